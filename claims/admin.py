@@ -1,39 +1,169 @@
 from django.contrib import admin
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+from django.utils.text import Truncator
+from .counts import EstimatedCountPaginator
 from .models import Claim, ClaimDetail, ClaimFlag, ClaimNote
+from .sharding import is_sharded, merge_distinct, scatter, shard_aliases, shards_for_id
+
+class CachedChoicesFilter(admin.SimpleListFilter):
+    """List filter whose DISTINCT choices are computed once per cache period"""
+    field_name = None
+    cache_seconds = 600
+    max_choices = 200
+
+    def lookups(self, request, model_admin):
+        model = model_admin.model
+        key = f'claims:admin-choices:{model._meta.label_lower}:{self.field_name}'
+        choices = cache.get(key)
+        if choices is None:
+            choices = merge_distinct(scatter(lambda alias: list(
+                model.objects.using(alias).exclude(**{f'{self.field_name}__isnull': True})
+                .values_list(self.field_name, flat=True)
+                .distinct()
+                .order_by(self.field_name)[:self.max_choices]
+            )))[:self.max_choices]
+            cache.set(key, choices, self.cache_seconds)
+        return [(choice, Truncator(choice).chars(60)) for choice in choices]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.field_name: self.value()})
+        return queryset
+
+class InsurerFilter(CachedChoicesFilter):
+    title = 'insurer'
+    parameter_name = 'insurer_name'
+    field_name = 'insurer_name'
+
+class DenialReasonFilter(CachedChoicesFilter):
+    title = 'denial reason'
+    parameter_name = 'denial_reason'
+    field_name = 'denial_reason'
+
+class ShardFilter(admin.SimpleListFilter):
+    """With sharding, the changelist shows one shard at a time, the first unless another is picked"""
+    title = 'shard'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in shard_aliases()]
+
+    def value(self):
+        value = super().value()
+        return value if value in shard_aliases() else shard_aliases()[0]
+
+    def choices(self, changelist):
+        # No "All" entry: a changelist queryset can only read one database
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': self.value() == lookup,
+                'query_string': changelist.get_query_string({self.parameter_name: lookup}),
+                'display': title,
+            }
+
+    def queryset(self, request, queryset):
+        return queryset.using(self.value())
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Changelist defaults that avoid full-table counts and text matches on IDs
+
+    With sharding, changelists gain a shard filter and objects are opened from
+    whichever shard holds them.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    id_search_field = None
+    # Forms pointing at a claim validate it against default, so these rows are view-only with sharding
+    claim_child = False
+
+    def has_add_permission(self, request):
+        return not (self.claim_child and is_sharded()) and super().has_add_permission(request)
+
+    def has_change_permission(self, request, obj=None):
+        return not (self.claim_child and is_sharded()) and super().has_change_permission(request, obj)
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        return [ShardFilter, *list_filter] if is_sharded() else list_filter
+
+    def get_object(self, request, object_id, from_field=None):
+        if not is_sharded():
+            return super().get_object(request, object_id, from_field)
+        queryset = self.get_queryset(request)
+        field = self.model._meta.pk if from_field is None else self.model._meta.get_field(from_field)
+        try:
+            object_id = field.to_python(object_id)
+        except (ValueError, ValidationError):
+            return None
+        aliases = shards_for_id(object_id) if self.model is Claim and from_field is None else shard_aliases()
+        for alias in aliases:
+            obj = queryset.using(alias).filter(**{field.name: object_id}).first()
+            if obj is not None:
+                return obj
+        return None
+
+    def get_search_results(self, request, queryset, search_term):
+        filtered = queryset
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        # Match claim IDs exactly instead of as text so the primary key index is used
+        if self.id_search_field and search_term.strip().isdigit():
+            queryset |= filtered.filter(**{self.id_search_field: int(search_term)})
+        return queryset, may_have_duplicates
 
 @admin.register(Claim)
-class ClaimAdmin(admin.ModelAdmin):
+class ClaimAdmin(ScalableAdmin):
     list_display = ['id', 'patient_name', 'billed_amount', 'paid_amount', 'status', 'insurer_name', 'discharge_date', 'is_flagged']
-    list_filter = ['status', 'insurer_name', 'discharge_date']
-    search_fields = ['id', 'patient_name', 'insurer_name']
+    list_filter = ['status', InsurerFilter, ('discharge_date', admin.DateFieldListFilter)]
+    search_fields = ['patient_name', 'insurer_name']
+    id_search_field = 'id'
     readonly_fields = ['created_at', 'updated_at']
     list_per_page = 50
-    
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            flagged=Exists(ClaimFlag.objects.filter(claim=OuterRef('pk')))
+        )
+
     def is_flagged(self, obj):
-        return obj.is_flagged
+        return obj.flagged
     is_flagged.boolean = True
     is_flagged.short_description = 'Flagged for Review'
+    is_flagged.admin_order_field = 'flagged'
 
 @admin.register(ClaimDetail)
-class ClaimDetailAdmin(admin.ModelAdmin):
+class ClaimDetailAdmin(ScalableAdmin):
+    claim_child = True
     list_display = ['claim', 'denial_reason', 'cpt_codes']
-    search_fields = ['claim__id', 'claim__patient_name', 'cpt_codes']
-    list_filter = ['denial_reason']
+    list_select_related = ['claim']
+    search_fields = ['claim__patient_name', 'cpt_codes']
+    id_search_field = 'claim_id'
+    list_filter = [DenialReasonFilter]
+    raw_id_fields = ['claim']
 
 @admin.register(ClaimFlag)
-class ClaimFlagAdmin(admin.ModelAdmin):
+class ClaimFlagAdmin(ScalableAdmin):
+    claim_child = True
     list_display = ['claim', 'user', 'reason', 'flagged_at']
+    list_select_related = ['claim', 'user']
     list_filter = ['flagged_at', 'user']
-    search_fields = ['claim__id', 'claim__patient_name', 'reason']
+    search_fields = ['claim__patient_name', 'reason']
+    id_search_field = 'claim_id'
     readonly_fields = ['flagged_at']
+    autocomplete_fields = ['claim', 'user']
 
 @admin.register(ClaimNote)
-class ClaimNoteAdmin(admin.ModelAdmin):
+class ClaimNoteAdmin(ScalableAdmin):
+    claim_child = True
     list_display = ['claim', 'user', 'note_type', 'created_at', 'content_preview']
+    list_select_related = ['claim', 'user']
     list_filter = ['note_type', 'created_at', 'user']
-    search_fields = ['claim__id', 'claim__patient_name', 'content']
+    search_fields = ['claim__patient_name', 'content']
+    id_search_field = 'claim_id'
     readonly_fields = ['created_at']
-    
+    autocomplete_fields = ['claim', 'user']
+
     def content_preview(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
     content_preview.short_description = 'Content Preview'
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db import DEFAULT_DB_ALIAS
 from django.db.models.signals import post_migrate
 from django.dispatch import receiver
 
@@ -8,19 +9,21 @@ class ClaimsConfig(AppConfig):
     name = 'claims'
 
     def ready(self):
+        from . import signals  # noqa: F401
         post_migrate.connect(load_initial_data, sender=self)
 
 
 @receiver(post_migrate)
 def load_initial_data(sender, **kwargs):
     """Auto-load CSV data on first migration"""
-    if sender.name == 'claims':
+    if sender.name == 'claims' and kwargs.get('using', DEFAULT_DB_ALIAS) == DEFAULT_DB_ALIAS:
         from .models import Claim
+        from .sharding import scatter
         from django.core.management import call_command
         import os
         
-        # Only load data if database is empty
-        if Claim.objects.count() == 0:
+        # Only load data if database is empty (with sharding, migrate the shards first)
+        if not any(scatter(lambda alias: Claim.objects.using(alias).exists())):
             # Check if CSV files exist
             data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
             claims_file = os.path.join(data_dir, 'claim_list_data.csv')
@@ -0,0 +1,205 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .counts import bump_data_version
+from .filters import apply_claim_filters
+from .flag_queue import count_bulk_flags
+from .models import ArchivedClaim, ChangeEvent, Claim, ClaimDetail, ClaimFlag, ClaimNote
+from .outbox import record_changes
+from .sharding import shard_aliases
+
+CLAIM_COLUMNS = [
+    'id', 'patient_name', 'billed_amount', 'paid_amount', 'status',
+    'insurer_name', 'discharge_date', 'created_at', 'updated_at',
+]
+
+# Stored columns plus the database-generated ones, selected on both sides of a union
+UNION_COLUMNS = CLAIM_COLUMNS + ['underpayment', 'payment_ratio']
+
+
+def archive_horizon():
+    """Discharge date before which claims belong in the archive"""
+    return timezone.localdate() - timedelta(days=settings.CLAIMS_ARCHIVE_HORIZON_DAYS)
+
+
+def reaches_archive(filters):
+    """True when a date filter is set and its range starts before the archive horizon
+
+    A range without date_from has no lower bound, so it always does.
+    """
+    if not (filters.get('date_from') or filters.get('date_to')):
+        return False
+    return not filters.get('date_from') or filters['date_from'] < archive_horizon()
+
+
+def with_archive(queryset, archived_queryset):
+    """Union hot claims with matching archived rows as Claim instances"""
+    # Compound statements reject ORDER BY in their parts, so drop Meta.ordering
+    return queryset.only(*UNION_COLUMNS).order_by().union(
+        archived_queryset.only(*UNION_COLUMNS).order_by(), all=True
+    )
+
+
+def filtered_claims(filters, using=DEFAULT_DB_ALIAS):
+    """Claims matching the list filters on one database, archived ones included when the dates reach them"""
+    claims = apply_claim_filters(Claim.objects.using(using), filters)
+    if reaches_archive(filters):
+        return with_archive(claims, apply_claim_filters(ArchivedClaim.objects.using(using), filters))
+    return claims
+
+
+def _snapshot(claim):
+    return {
+        'details': [
+            {'id': d.id, 'denial_reason': d.denial_reason, 'cpt_codes': d.cpt_codes}
+            for d in claim.details.all()
+        ],
+        'flags': [
+            {'id': f.id, 'user_id': f.user_id, 'reason': f.reason,
+             'flagged_at': f.flagged_at.isoformat()}
+            for f in claim.claim_flags.all()
+        ],
+        'notes': [
+            {'id': n.id, 'user_id': n.user_id, 'content': n.content,
+             'note_type': n.note_type, 'created_at': n.created_at.isoformat()}
+            for n in claim.claim_notes.all()
+        ],
+    }
+
+
+def _related_rows(data, name, stamp_field):
+    rows = []
+    for row in data.get(name, []):
+        row = dict(row)
+        if stamp_field:
+            row[stamp_field] = parse_datetime(row[stamp_field])
+        rows.append(row)
+    return rows
+
+
+def _archive_shard(using, before, batch_size):
+    moved = 0
+    while True:
+        with transaction.atomic(using=using):
+            batch = list(
+                Claim.objects.using(using).filter(discharge_date__lt=before)
+                .prefetch_related('details', 'claim_flags', 'claim_notes')
+                .order_by('id')[:batch_size]
+            )
+            if not batch:
+                break
+            archived = ArchivedClaim.objects.using(using).bulk_create([
+                ArchivedClaim(
+                    **{column: getattr(claim, column) for column in CLAIM_COLUMNS},
+                    related_data=_snapshot(claim),
+                )
+                for claim in batch
+            ])
+            # Consumers such as the scorecards see the claim move rather than disappear
+            record_changes(archived, ChangeEvent.INSERT, using)
+            Claim.objects.using(using).filter(id__in=[claim.id for claim in batch]).delete()
+        moved += len(batch)
+    return moved
+
+
+def archive_claims(before=None, batch_size=1000):
+    """Move claims discharged before ``before`` into the archive table of their shard"""
+    before = before or archive_horizon()
+    moved = sum(_archive_shard(alias, before, batch_size) for alias in shard_aliases())
+    if moved:
+        bump_data_version()
+    return moved
+
+
+def _restore_shard(using, since, batch_size, user_ids):
+    restored = 0
+    archived = ArchivedClaim.objects.using(using)
+    if since:
+        archived = archived.filter(discharge_date__gte=since)
+    while True:
+        with transaction.atomic(using=using):
+            batch = list(archived.order_by('id')[:batch_size])
+            if not batch:
+                break
+            claims = [
+                Claim(**{column: getattr(row, column) for column in CLAIM_COLUMNS})
+                for row in batch
+            ]
+            Claim.objects.using(using).bulk_create(claims)
+            # bulk_create stamps auto_now fields on the instances too; put the original values back
+            for claim, row in zip(claims, batch):
+                claim.created_at = row.created_at
+                claim.updated_at = row.updated_at
+            Claim.objects.using(using).bulk_update(claims, ['created_at', 'updated_at'])
+
+            details, flags, notes = [], [], []
+            for row in batch:
+                data = row.related_data
+                details += [
+                    ClaimDetail(claim_id=row.id, **d)
+                    for d in _related_rows(data, 'details', None)
+                ]
+                flags += [
+                    ClaimFlag(claim_id=row.id, **f)
+                    for f in _related_rows(data, 'flags', 'flagged_at')
+                    if f['user_id'] in user_ids
+                ]
+                notes += [
+                    ClaimNote(claim_id=row.id, **n)
+                    for n in _related_rows(data, 'notes', 'created_at')
+                    if n['user_id'] in user_ids
+                ]
+            ClaimDetail.objects.using(using).bulk_create(details)
+            ClaimFlag.objects.using(using).bulk_create(flags)
+            count_bulk_flags(flags, using)
+            ClaimNote.objects.using(using).bulk_create(notes)
+            for rows in (claims, flags, notes):
+                record_changes(rows, ChangeEvent.INSERT, using)
+            record_changes(batch, ChangeEvent.DELETE, using)
+            ArchivedClaim.objects.using(using).filter(id__in=[row.id for row in batch]).delete()
+        restored += len(batch)
+    return restored
+
+
+def restore_claims(since=None, batch_size=1000):
+    """Move archived claims discharged on or after ``since`` back to the hot table of their shard"""
+    user_ids = set(User.objects.values_list('id', flat=True))
+    restored = sum(_restore_shard(alias, since, batch_size, user_ids) for alias in shard_aliases())
+    if restored:
+        bump_data_version()
+    return restored
+
+
+def _prefetched(instance, name, objects):
+    # Mirror what prefetch_related stores so templates can call .all()
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = objects
+    queryset._prefetch_done = True
+    instance._prefetched_objects_cache[name] = queryset
+
+
+def archived_claim_as_claim(archived):
+    """Rebuild an unsaved Claim with its related rows for read-only display"""
+    claim = Claim(**{column: getattr(archived, column) for column in CLAIM_COLUMNS})
+    claim._prefetched_objects_cache = {}
+    data = archived.related_data
+    flags = _related_rows(data, 'flags', 'flagged_at')
+    notes = _related_rows(data, 'notes', 'created_at')
+    users = User.objects.in_bulk({row['user_id'] for row in flags + notes})
+    _prefetched(claim, 'details', [
+        ClaimDetail(claim=claim, **d) for d in _related_rows(data, 'details', None)
+    ])
+    _prefetched(claim, 'claim_flags', [
+        ClaimFlag(claim=claim, user=users[f.pop('user_id')], **f)
+        for f in flags if f['user_id'] in users
+    ])
+    _prefetched(claim, 'claim_notes', [
+        ClaimNote(claim=claim, user=users[n.pop('user_id')], **n)
+        for n in notes if n['user_id'] in users
+    ])
+    return claim
@@ -0,0 +1,312 @@
+import heapq
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from datetime import date, timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max
+
+from .archive import reaches_archive
+from .counts import data_version
+from .models import ChangeEvent, Claim
+from .outbox import committed_changes
+from .sharding import ordering_key, scatter, shard_aliases, with_tiebreak
+
+# Columns kept per claim: the filtered ones plus every claims list sort field
+FIELDS = [
+    'id', 'patient_name', 'insurer_name', 'status', 'discharge_date', 'billed_amount', 'underpayment',
+    'payment_ratio', 'updated_at',
+]
+# Edges of the bands billed amounts and underpayments are bucketed into
+AMOUNT_BANDS = [0, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 500000]
+
+
+def _positions(bitmap):
+    """Positions of the set bits, lowest first"""
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    for byte_index, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            yield byte_index * 8 + low.bit_length() - 1
+            byte ^= low
+
+
+def _month(value):
+    return (value.year, value.month)
+
+
+def _month_bounds(key):
+    year, month = key
+    return date(year, month, 1), date(year + month // 12, month % 12 + 1, 1)
+
+
+def _band(value):
+    return bisect_right(AMOUNT_BANDS, value)
+
+
+def _band_bounds(key):
+    return (
+        AMOUNT_BANDS[key - 1] if key > 0 else None,
+        AMOUNT_BANDS[key] if key < len(AMOUNT_BANDS) else None,
+    )
+
+
+class _RangeDimension:
+    """Bitmap per bucket of an ordered column, answering low <= value <= high
+
+    bounds(key) gives the bucket's [start, end) with None for unbounded. Buckets
+    wholly inside the range are OR-ed in; the one or two straddling an end have
+    their rows checked one by one. step is the column's smallest increment, for
+    columns such as dates where a bucket ending a day after high is still inside.
+    """
+
+    def __init__(self, field, bucket, bounds, step=None):
+        self.field = field
+        self._bucket = bucket
+        self._bounds = bounds
+        self._step = step
+        self.bitmaps = defaultdict(int)
+
+    def add(self, row, bit):
+        self.bitmaps[self._bucket(row[self.field])] |= bit
+
+    def remove(self, row, bit):
+        key = self._bucket(row[self.field])
+        self.bitmaps[key] &= ~bit
+        if not self.bitmaps[key]:
+            del self.bitmaps[key]
+
+    def select(self, rows, low, high):
+        selected = 0
+        for key, bitmap in self.bitmaps.items():
+            start, end = self._bounds(key)
+            if (high is not None and start is not None and start > high) or (
+                    low is not None and end is not None and end <= low):
+                continue
+            last = end - self._step if end is not None and self._step else end
+            if (low is None or (start is not None and start >= low)) and (
+                    high is None or (last is not None and last <= high)):
+                selected |= bitmap
+                continue
+            for position in _positions(bitmap):
+                value = rows[position][self.field]
+                if (low is None or value >= low) and (high is None or value <= high):
+                    selected |= 1 << position
+        return selected
+
+
+class BitmapIndex:
+    """Claims held in memory as one bit position each, with a bitmap per filter value
+
+    Positions are handed out in load order and never reused; a deleted claim leaves
+    a hole until the index is rebuilt.
+    """
+
+    def __init__(self):
+        self.rows = []  # FIELDS values per position, None once the claim is gone
+        self.positions = {}  # claim id -> position
+        self.live = 0
+        self.statuses = defaultdict(int)
+        self.insurers = defaultdict(int)
+        self.ranges = {
+            'date': _RangeDimension('discharge_date', _month, _month_bounds, step=timedelta(days=1)),
+            'amount': _RangeDimension('billed_amount', _band, _band_bounds),
+            'underpayment': _RangeDimension('underpayment', _band, _band_bounds),
+        }
+        self.version = None
+        self.updated_through = None
+        self.event_positions = {}
+        self._orders = {}  # ordering -> live positions in that order
+        self._keys = {}
+
+    @classmethod
+    def build(cls):
+        """Index every claim on every shard"""
+        index = cls()
+        index.version = data_version()
+        # Follow deletes from the current end of each outbox; earlier ones are already gone
+        index.event_positions = {
+            alias: ChangeEvent.objects.using(alias).aggregate(last=Max('id'))['last'] or 0
+            for alias in shard_aliases()
+        }
+        index._load(lambda alias: Claim.objects.using(alias).order_by().values(*FIELDS))
+        return index
+
+    def _load(self, build):
+        for rows in scatter(lambda alias: list(build(alias))):
+            for row in rows:
+                self._add(row)
+                if self.updated_through is None or row['updated_at'] > self.updated_through:
+                    self.updated_through = row['updated_at']
+
+    def _add(self, row):
+        position = self.positions.get(row['id'])
+        if position is not None:
+            if self.rows[position] == row:
+                return  # Re-read inside the settle window, unchanged
+            self._remove(position)
+        position = len(self.rows)
+        bit = 1 << position
+        self.rows.append(row)
+        self.positions[row['id']] = position
+        self.live |= bit
+        self.statuses[row['status']] |= bit
+        self.insurers[row['insurer_name']] |= bit
+        for dimension in self.ranges.values():
+            dimension.add(row, bit)
+        for ordering, positions in self._orders.items():
+            insort(positions, position, key=self._row_key(ordering))
+
+    def _remove(self, position):
+        row = self.rows[position]
+        bit = 1 << position
+        for ordering, positions in self._orders.items():
+            key = self._row_key(ordering)
+            del positions[bisect_left(positions, key(position), key=key)]
+        self.rows[position] = None
+        del self.positions[row['id']]
+        self.live &= ~bit
+        for bitmaps, value in ((self.statuses, row['status']), (self.insurers, row['insurer_name'])):
+            bitmaps[value] &= ~bit
+            if not bitmaps[value]:
+                del bitmaps[value]
+        for dimension in self.ranges.values():
+            dimension.remove(row, bit)
+
+    def refresh(self):
+        """Apply claims deleted and saved since the last refresh; False once it should be rebuilt
+
+        Runs when data_version() moves: at once for writes in this process, and within
+        CLAIMS_DATA_VERSION_CHECK_SECONDS of other processes' writes reaching the outbox.
+        Saves are found by updated_at, re-reading a window of CLAIMS_OUTBOX_SETTLE_SECONDS
+        for transactions that committed late; deletes come from the change outbox.
+        Writes that bypass updated_at, such as QuerySet.update(), are not seen.
+        """
+        version = data_version()
+        if version == self.version:
+            return True
+        # Taken first, so a write landing during the refresh triggers another one
+        self.version = version
+        for alias in shard_aliases():
+            while True:
+                events = committed_changes(self.event_positions.get(alias, 0), alias)
+                if not events:
+                    break
+                for event in events:
+                    if event.model == 'claim' and event.operation == ChangeEvent.DELETE and event.claim_id in self.positions:
+                        self._remove(self.positions[event.claim_id])
+                self.event_positions[alias] = events[-1].id
+        if self.updated_through is None:
+            since = None
+        else:
+            since = self.updated_through - timedelta(seconds=settings.CLAIMS_OUTBOX_SETTLE_SECONDS)
+
+        def changed(alias):
+            claims = Claim.objects.using(alias).order_by().values(*FIELDS)
+            return claims.filter(updated_at__gte=since) if since else claims
+
+        self._load(changed)
+        # Every re-saved claim moves to a new position; compact once holes outnumber claims
+        return len(self.rows) - len(self.positions) <= max(len(self.positions), 1000)
+
+    def select(self, filters):
+        """Bitmap of the claims matching the status, insurer, date and amount filters"""
+        bitmap = self.live
+        if filters['status']:
+            bitmap &= self.statuses.get(filters['status'], 0)
+        if filters['insurer']:
+            # icontains: OR together every insurer whose name contains the text
+            needle = filters['insurer'].lower()
+            insurers = 0
+            for insurer_name, insurer_bitmap in self.insurers.items():
+                if needle in insurer_name.lower():
+                    insurers |= insurer_bitmap
+            bitmap &= insurers
+        for name, low, high in (
+            ('date', filters['date_from'], filters['date_to']),
+            ('amount', filters['min_amount'], filters['max_amount']),
+            ('underpayment', filters['min_underpayment'], filters['max_underpayment']),
+        ):
+            if bitmap and (low is not None or high is not None):
+                bitmap &= self.ranges[name].select(self.rows, low, high)
+        return bitmap
+
+    def _row_key(self, ordering):
+        """Sort key of a position, matching the database's ORDER BY for the claims list"""
+        key = self._keys.get(ordering)
+        if key is None:
+            nulls_largest = connections[shard_aliases()[0]].features.nulls_order_largest
+            row_key = ordering_key(with_tiebreak([ordering]), nulls_largest)
+            key = self._keys[ordering] = lambda position: row_key(self.rows[position])
+        return key
+
+    def _order(self, ordering):
+        """Live positions in list order; sorted once, then kept in order as claims are added and removed"""
+        positions = self._orders.get(ordering)
+        if positions is None:
+            positions = self._orders[ordering] = sorted(self.positions.values(), key=self._row_key(ordering))
+        return positions
+
+    def page(self, bitmap, ordering, offset, limit):
+        """IDs of the selected claims offset..offset+limit in list order"""
+        positions = self._order(ordering)
+        if bitmap == self.live:
+            chosen = positions[offset:offset + limit]
+        else:
+            count = bitmap.bit_count()
+            if count * count < (offset + limit) * len(positions):
+                # Sparse: the page would be far down the full order, so rank just the selected claims
+                chosen = heapq.nsmallest(offset + limit, _positions(bitmap), key=self._row_key(ordering))[offset:]
+            else:
+                data = bitmap.to_bytes((len(self.rows) + 7) // 8, 'little')
+                selected = (position for position in positions if data[position >> 3] >> (position & 7) & 1)
+                chosen = list(islice(selected, offset, offset + limit))
+        return [self.rows[position]['id'] for position in chosen]
+
+
+class Selection:
+    """Claims one set of filters picked out of the index"""
+
+    def __init__(self, index, bitmap):
+        self.index = index
+        self.bitmap = bitmap
+        self.count = bitmap.bit_count()
+
+    def page(self, ordering, offset, limit):
+        with _lock:
+            return self.index.page(self.bitmap, ordering, offset, limit)
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def _current_index():
+    global _index
+    if _index is None or not _index.refresh():
+        _index = BitmapIndex.build()
+    return _index
+
+
+def select_claims(filters):
+    """Selection of the claims matching filters, or None when the database has to answer them
+
+    The index is off unless CLAIMS_BITMAP_INDEX is set, and it does not cover the
+    free-text search or ranges reaching archived claims.
+    """
+    if not settings.CLAIMS_BITMAP_INDEX or filters['search'] or reaches_archive(filters):
+        return None
+    with _lock:
+        index = _current_index()
+        return Selection(index, index.select(filters))
+
+
+def prime_bitmap_index():
+    """Build the index ahead of the first request; returns the claims indexed, or None when it is off"""
+    if not settings.CLAIMS_BITMAP_INDEX:
+        return None
+    with _lock:
+        return len(_current_index().positions)
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.utils.functional import cached_property
+
+from .models import ChangeEvent
+from .sharding import scatter, shard_aliases
+from .singleflight import single_flight
+
+DATA_VERSION_KEY = 'claims:data-version'
+OUTBOX_POSITION_KEY = 'claims:outbox-position'
+
+
+@dataclass(frozen=True)
+class ResultCount:
+    """Number of matching claims and whether it is exact or a planner estimate"""
+    value: int
+    exact: bool = True
+
+
+def _fresh_version():
+    # Seeded from the clock, so a stamp the cache evicted never comes back as an old value
+    return time.time_ns() // 1000
+
+
+def _outbox_position():
+    """Newest change outbox event on every shard, read at most once per CLAIMS_DATA_VERSION_CHECK_SECONDS"""
+    position = cache.get(OUTBOX_POSITION_KEY)
+    if position is None:
+        position = '.'.join(
+            str(ChangeEvent.objects.using(alias).aggregate(last=Max('id'))['last'] or 0)
+            for alias in shard_aliases()
+        )
+        cache.set(OUTBOX_POSITION_KEY, position, settings.CLAIMS_DATA_VERSION_CHECK_SECONDS)
+    return position
+
+
+def data_version():
+    """Stamp that changes whenever claim data is written
+
+    Writes in this process bump the cached counter at once. The cache is per process
+    unless CACHE_URL is set, so writes from other processes are picked up through the
+    change outbox instead, within CLAIMS_DATA_VERSION_CHECK_SECONDS.
+    """
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        cache.add(DATA_VERSION_KEY, _fresh_version(), timeout=None)
+        version = cache.get(DATA_VERSION_KEY, _fresh_version())
+    return f'{version}-{_outbox_position()}'
+
+
+def bump_data_version(**kwargs):
+    """Invalidate every cached count by moving to a new data version"""
+    try:
+        cache.incr(DATA_VERSION_KEY)
+    except ValueError:
+        cache.set(DATA_VERSION_KEY, _fresh_version(), timeout=None)
+
+
+def filter_signature(filters):
+    """Stable hash of the filters that affect a count (ordering does not)"""
+    normalized = {key: value for key, value in filters.items() if key != 'ordering' and value not in ('', None)}
+    payload = json.dumps(normalized, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def estimate_count(queryset):
+    """Planner row estimate for a queryset, or None where the backend has none"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_claims(queryset, signature):
+    """Exact count for small results, planner estimate for large ones, cached per filter signature"""
+    key = f'claims:count:{data_version()}:{signature}'
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    def compute():
+        estimate = estimate_count(queryset)
+        if estimate is not None and estimate > settings.CLAIMS_EXACT_COUNT_THRESHOLD:
+            counted = ResultCount(estimate, exact=False)
+        else:
+            counted = ResultCount(queryset.count())
+        cache.set(key, counted, settings.CLAIMS_COUNT_CACHE_SECONDS)
+        return counted
+
+    # Concurrent misses for the same filters share one COUNT
+    return single_flight(key, compute)
+
+
+def count_across_shards(build, signature):
+    """count_claims of build(alias) summed over every shard; exact only if every part is"""
+    counts = scatter(lambda alias: count_claims(build(alias), f'{signature}:{alias}'))
+    return ResultCount(sum(counted.value for counted in counts), exact=all(counted.exact for counted in counts))
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator whose count is cached per query and estimated when large"""
+
+    @cached_property
+    def count(self):
+        sql, params = self.object_list.query.sql_with_params()
+        # The same SQL counts different rows on each shard
+        signature = hashlib.sha1(f'{self.object_list.db}:{sql}{params}'.encode()).hexdigest()
+        return count_claims(self.object_list, signature).value
+
+
+class CountedPaginator(Paginator):
+    """Paginator that trusts a precomputed count instead of running COUNT(*) again
+
+    An estimated count (exact=False) can run past the real end; clamp() corrects it from a short page.
+    """
+
+    def __init__(self, object_list, per_page, count, exact=True, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._known_count = count
+        self.exact = exact
+
+    @cached_property
+    def count(self):
+        return self._known_count
+
+    def recount(self, count):
+        """Replace the count with an exact one"""
+        self._known_count = count
+        self.exact = True
+        for attribute in ('count', 'num_pages', 'page_range'):
+            self.__dict__.pop(attribute, None)
+
+    def clamp(self, page):
+        """Set the count from page if it is the real last page of an estimate; returns whether it did
+
+        A page with fewer rows than per_page ends the results. An empty page past the first says
+        only that the end comes earlier, so it is left for the caller to count.
+        """
+        rows = len(page.object_list)
+        if self.exact or rows >= self.per_page or (not rows and page.number > 1):
+            return False
+        self.recount((page.number - 1) * self.per_page + rows)
+        return True
@@ -0,0 +1,227 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import groupby
+
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Lower, Trim
+
+from .models import ChangeEvent, Claim, ClaimNote
+from .outbox import record_changes
+from .sharding import combine_groups, group_by_shard, locate_claims, scatter, stream_ordered
+
+SYSTEM_USERNAME = 'system'
+SYSTEM_NOTE = 'System Flag'
+
+
+@dataclass(frozen=True)
+class DetectionOptions:
+    window_days: int = 7
+    amount_tolerance: float = 0.05
+    z_threshold: float = 4.0
+
+
+@dataclass(frozen=True)
+class InsurerStats:
+    """Per-insurer mean and standard deviation of billed and paid amounts"""
+    insurer_name: str
+    claims: int
+    billed_mean: float
+    billed_std: float
+    paid_mean: float
+    paid_std: float
+
+
+def _std(mean, mean_of_squares):
+    return math.sqrt(max(mean_of_squares - mean * mean, 0))
+
+
+def insurer_stats():
+    """Every insurer's amount distribution from one grouped query per shard (no StdDev on SQLite)
+
+    Shards return sums rather than averages so their groups can be added together.
+    """
+    def grouped(alias):
+        return list(Claim.objects.using(alias).values('insurer_name').annotate(
+            claims=Count('id'),
+            billed_sum=Sum('billed_amount'),
+            billed_sq=Sum(F('billed_amount') * F('billed_amount')),
+            paid_sum=Sum('paid_amount'),
+            paid_sq=Sum(F('paid_amount') * F('paid_amount')),
+        ).order_by())
+
+    stats = []
+    for row in combine_groups(scatter(grouped), 'insurer_name', ['claims', 'billed_sum', 'billed_sq', 'paid_sum', 'paid_sq']):
+        billed_mean = float(row['billed_sum']) / row['claims']
+        paid_mean = float(row['paid_sum']) / row['claims']
+        stats.append(InsurerStats(
+            insurer_name=row['insurer_name'],
+            claims=row['claims'],
+            billed_mean=billed_mean,
+            billed_std=_std(billed_mean, float(row['billed_sq']) / row['claims']),
+            paid_mean=paid_mean,
+            paid_std=_std(paid_mean, float(row['paid_sq']) / row['claims']),
+        ))
+    return stats
+
+
+def partition_insurers(stats, partitions):
+    """Balance insurers (the blocking key's outer level) across worker partitions"""
+    buckets = [[] for _ in range(max(partitions, 1))]
+    loads = [0] * len(buckets)
+    for insurer in sorted(stats, key=lambda s: s.claims, reverse=True):
+        target = loads.index(min(loads))
+        buckets[target].append(insurer)
+        loads[target] += insurer.claims
+    return [bucket for bucket in buckets if bucket]
+
+
+def _similar(a, b, tolerance):
+    largest = max(abs(a), abs(b))
+    return largest == 0 or abs(a - b) / largest <= tolerance
+
+
+def _duplicates_in_block(block, options):
+    # block is sorted by discharge date, so only a sliding window needs comparing
+    findings = []
+    start = 0
+    for position, (claim_id, discharge_date, billed, paid) in enumerate(block):
+        while (discharge_date - block[start][1]).days > options.window_days:
+            start += 1
+        for other_id, other_date, other_billed, other_paid in block[start:position]:
+            if _similar(billed, other_billed, options.amount_tolerance) and \
+                    _similar(paid, other_paid, options.amount_tolerance):
+                days = (discharge_date - other_date).days
+                findings.append((claim_id, (
+                    f'Possible duplicate of claim {other_id}: same patient and insurer, '
+                    f'discharged {days} day(s) apart with billed and paid amounts within '
+                    f'{options.amount_tolerance:.0%}'
+                )))
+                break
+    return findings
+
+
+def _outlier(claim_id, label, value, mean, std, insurer_name, options):
+    if not std:
+        return None
+    z = (value - mean) / std
+    if abs(z) < options.z_threshold:
+        return None
+    return (claim_id, (
+        f'{label} amount outlier for {insurer_name}: ${value:,.2f} is '
+        f'{abs(z):.1f} standard deviations {"above" if z > 0 else "below"} the insurer mean '
+        f'of ${mean:,.2f}'
+    ))
+
+
+def scan_partition(insurers, options):
+    """Find duplicates and outliers for a set of insurers; safe to run in a worker process"""
+    by_name = {insurer.insurer_name: insurer for insurer in insurers}
+    # Claims of one patient can sit on different shards, so the shards' rows are merged in order.
+    # Blocks are grouped on the same normalized name the database sorts by, so case and
+    # whitespace variants of a name end up next to each other.
+    rows = stream_ordered(
+        lambda alias: Claim.objects.using(alias).filter(insurer_name__in=list(by_name))
+        .annotate(patient_key=Lower(Trim('patient_name')))
+        .values('id', 'insurer_name', 'patient_key', 'discharge_date', 'billed_amount', 'paid_amount'),
+        ['insurer_name', 'patient_key', 'discharge_date', 'id'],
+        chunk_size=5000,
+    )
+    findings = []
+    for (insurer_name, _), block in groupby(rows, key=lambda row: (row['insurer_name'], row['patient_key'])):
+        stats = by_name[insurer_name]
+        entries = []
+        for row in block:
+            claim_id, discharge_date = row['id'], row['discharge_date']
+            billed, paid = float(row['billed_amount']), float(row['paid_amount'])
+            entries.append((claim_id, discharge_date, billed, paid))
+            for label, value, mean, std in (
+                ('Billed', billed, stats.billed_mean, stats.billed_std),
+                ('Paid', paid, stats.paid_mean, stats.paid_std),
+            ):
+                finding = _outlier(claim_id, label, value, mean, std, insurer_name, options)
+                if finding:
+                    findings.append(finding)
+        if len(entries) > 1:
+            findings.extend(_duplicates_in_block(entries, options))
+    return findings
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _scan_in_worker(insurers, options):
+    try:
+        return scan_partition(insurers, options)
+    finally:
+        connections.close_all()
+
+
+def system_user():
+    user, created = User.objects.get_or_create(username=SYSTEM_USERNAME, defaults={'is_active': False})
+    if created:
+        user.set_unusable_password()
+        user.save(update_fields=['password'])
+    return user
+
+
+def finding_key(content):
+    """What a finding is about, e.g. 'Possible duplicate of claim 55001'; the figures after the colon vary between runs"""
+    return content.partition(':')[0]
+
+
+def write_findings(findings, batch_size=1000):
+    """Bulk-insert findings as System Flag notes on their claims' shards
+
+    A finding already noted on its claim has the note's text refreshed.
+    """
+    user = system_user()
+    written = 0
+    for offset in range(0, len(findings), batch_size):
+        batch = findings[offset:offset + batch_size]
+        located = locate_claims({claim_id for claim_id, _ in batch})
+        for alias, shard_batch in group_by_shard(batch, lambda finding: located.get(finding[0])).items():
+            if alias is None:
+                continue  # Claim deleted or archived since the scan
+            existing = {
+                (note.claim_id, finding_key(note.content)): note
+                for note in ClaimNote.objects.using(alias).filter(
+                    note_type=SYSTEM_NOTE, claim_id__in={claim_id for claim_id, _ in shard_batch}
+                ).only('id', 'claim_id', 'user_id', 'content', 'note_type', 'created_at')
+            }
+            notes = []
+            updated = []
+            for claim_id, content in shard_batch:
+                note = existing.get((claim_id, finding_key(content)))
+                if note is None:
+                    notes.append(ClaimNote(claim_id=claim_id, user=user, content=content, note_type=SYSTEM_NOTE))
+                elif note.content != content:
+                    note.content = content
+                    updated.append(note)
+            with transaction.atomic(using=alias):
+                ClaimNote.objects.using(alias).bulk_create(notes)
+                ClaimNote.objects.using(alias).bulk_update(updated, ['content'])
+                record_changes(notes, ChangeEvent.INSERT, alias)
+                record_changes(updated, ChangeEvent.UPDATE, alias)
+            written += len(notes) + len(updated)
+    return written
+
+
+def detect_anomalies(options=None, workers=1):
+    """Scan all claims in insurer partitions, in a process pool when workers > 1"""
+    options = options or DetectionOptions()
+    partitions = partition_insurers(insurer_stats(), workers * 4)
+    if workers <= 1:
+        return [finding for partition in partitions for finding in scan_partition(partition, options)]
+
+    # Children must open their own connections rather than share the parent's sockets
+    connections.close_all()
+    findings = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for partition_findings in pool.map(_scan_in_worker, partitions, [options] * len(partitions)):
+            findings.extend(partition_findings)
+    return findings
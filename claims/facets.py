@@ -0,0 +1,31 @@
+from django.core.cache import cache
+
+from .counts import data_version
+from .models import Claim
+from .sharding import merge_distinct, scatter
+
+# Claim columns offered as dropdowns on the claims list
+FACET_FIELDS = ['status', 'insurer_name']
+FACET_CACHE_SECONDS = 600
+
+
+def _distinct_values(field):
+    return merge_distinct(scatter(lambda alias: list(
+        Claim.objects.using(alias).exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+        .values_list(field, flat=True).distinct().order_by(field)
+    )))
+
+
+def facet_values(field):
+    """Sorted distinct non-empty values of a claim column from every shard, cached until claims change"""
+    key = f'claims:facets:{data_version()}:{field}'
+    values = cache.get(key)
+    if values is None:
+        values = _distinct_values(field)
+        cache.set(key, values, FACET_CACHE_SECONDS)
+    return values
+
+
+def prime_facets():
+    """Fill the facet cache so the first claims list request skips the DISTINCT scans"""
+    return {field: len(facet_values(field)) for field in FACET_FIELDS}
@@ -0,0 +1,93 @@
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+
+SORT_MAPPING = {
+    'id': 'id',
+    'patient': 'patient_name',
+    'insurer': 'insurer_name',
+    'amount': 'billed_amount',
+    'status': 'status',
+    'date': 'discharge_date',
+    'underpayment': 'underpayment',
+    'ratio': 'payment_ratio',
+}
+
+DEFAULT_ORDERING = '-discharge_date'
+
+
+def _parse_amount(value, label, warnings):
+    if not value:
+        return None
+    try:
+        amount = float(value)
+    except (ValueError, TypeError):
+        warnings.append(f'Invalid {label} amount format.')
+        return None
+    return amount if amount >= 0 else None
+
+
+def _parse_date(value, warnings):
+    if not value:
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        warnings.append('Invalid date format.')
+    return parsed
+
+
+def parse_claim_filters(params):
+    """Normalize claims list query parameters into a filter dict plus warnings"""
+    warnings = []
+    filters = {
+        'search': params.get('search', '').strip(),
+        'status': params.get('status', ''),
+        'insurer': params.get('insurer', ''),
+        'min_amount': _parse_amount(params.get('min_amount', ''), 'minimum', warnings),
+        'max_amount': _parse_amount(params.get('max_amount', ''), 'maximum', warnings),
+        'min_underpayment': _parse_amount(params.get('min_underpayment', ''), 'minimum underpayment', warnings),
+        'max_underpayment': _parse_amount(params.get('max_underpayment', ''), 'maximum underpayment', warnings),
+        'date_from': _parse_date(params.get('date_from', ''), warnings),
+        'date_to': _parse_date(params.get('date_to', ''), warnings),
+    }
+
+    sort_field = params.get('sort', 'discharge_date')
+    if sort_field in SORT_MAPPING:
+        order_field = SORT_MAPPING[sort_field]
+        if params.get('direction', 'desc') == 'desc':
+            order_field = f'-{order_field}'
+    else:
+        order_field = DEFAULT_ORDERING
+    filters['ordering'] = order_field
+
+    return filters, warnings
+
+
+def apply_claim_filters(queryset, filters):
+    """Apply parsed filters to any queryset with the claim columns"""
+    if filters['search']:
+        search = filters['search']
+        queryset = queryset.filter(
+            Q(patient_name__icontains=search) |
+            Q(id__icontains=search) |
+            Q(insurer_name__icontains=search)
+        )
+    if filters['status']:
+        queryset = queryset.filter(status=filters['status'])
+    if filters['insurer']:
+        queryset = queryset.filter(insurer_name__icontains=filters['insurer'])
+    if filters['min_amount'] is not None:
+        queryset = queryset.filter(billed_amount__gte=filters['min_amount'])
+    if filters['max_amount'] is not None:
+        queryset = queryset.filter(billed_amount__lte=filters['max_amount'])
+    if filters['min_underpayment'] is not None:
+        queryset = queryset.filter(underpayment__gte=filters['min_underpayment'])
+    if filters['max_underpayment'] is not None:
+        queryset = queryset.filter(underpayment__lte=filters['max_underpayment'])
+    if filters['date_from']:
+        queryset = queryset.filter(discharge_date__gte=filters['date_from'])
+    if filters['date_to']:
+        queryset = queryset.filter(discharge_date__lte=filters['date_to'])
+    return queryset
@@ -0,0 +1,106 @@
+import base64
+import json
+from collections import Counter
+
+from django.db.models import Count, F, Q
+from django.utils.dateparse import parse_datetime
+
+from .models import ClaimFlag, ReviewerFlagCount
+from .sharding import combine_groups, merge_ordered, scatter, shard_aliases
+
+PAGE_SIZE = 50
+
+
+def encode_cursor(flag):
+    """Opaque position after ``flag`` in (flagged_at, id) order"""
+    payload = json.dumps([flag.flagged_at.isoformat(), flag.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(value):
+    """Return (flagged_at, id) for a cursor, or None if it is missing or malformed"""
+    if not value:
+        return None
+    try:
+        flagged_at, flag_id = json.loads(base64.urlsafe_b64decode(value.encode()))
+        flagged_at = parse_datetime(flagged_at)
+        flag_id = int(flag_id)
+    except (ValueError, TypeError):
+        return None
+    return (flagged_at, flag_id) if flagged_at else None
+
+
+def flag_queue_page(queryset, cursor=None, newest_first=False, page_size=PAGE_SIZE):
+    """One page of flags after ``cursor``; seeks on the flagged_at indexes instead of using OFFSET"""
+    if newest_first:
+        queryset = queryset.order_by('-flagged_at', '-id')
+    else:
+        queryset = queryset.order_by('flagged_at', 'id')
+
+    position = decode_cursor(cursor)
+    if position:
+        flagged_at, flag_id = position
+        if newest_first:
+            queryset = queryset.filter(Q(flagged_at__lt=flagged_at) | Q(flagged_at=flagged_at, id__lt=flag_id))
+        else:
+            queryset = queryset.filter(Q(flagged_at__gt=flagged_at) | Q(flagged_at=flagged_at, id__gt=flag_id))
+
+    flags = list(queryset[:page_size + 1])
+    next_cursor = encode_cursor(flags[page_size - 1]) if len(flags) > page_size else None
+    return flags[:page_size], next_cursor
+
+
+def gather_flag_queue_page(build, cursor=None, newest_first=False, page_size=PAGE_SIZE):
+    """flag_queue_page of build(alias) on every shard, merged into one page in queue order"""
+    pages = scatter(lambda alias: flag_queue_page(build(alias), cursor, newest_first, page_size + 1)[0])
+    ordering = ['-flagged_at', '-id'] if newest_first else ['flagged_at', 'id']
+    flags = merge_ordered(pages, ordering, page_size + 1)
+    next_cursor = encode_cursor(flags[page_size - 1]) if len(flags) > page_size else None
+    return flags[:page_size], next_cursor
+
+
+def _open_flags(user_id, using):
+    """A reviewer's flags on every shard
+
+    The shard being written to is counted on this thread's connection, which sees
+    the flag its uncommitted transaction just added; other shards' threads would not.
+    """
+    others = [alias for alias in shard_aliases() if alias != using]
+    total = ClaimFlag.objects.using(using).filter(user_id=user_id).count() if using else 0
+    if others:
+        total += sum(scatter(lambda alias: ClaimFlag.objects.using(alias).filter(user_id=user_id).count(), others))
+    return total
+
+
+def adjust_reviewer_count(user_id, delta, using=None):
+    """Apply a change in a reviewer's open flags without counting their flags
+
+    using is the database the flags were written to, when that write may not have committed yet.
+    """
+    if ReviewerFlagCount.objects.filter(user_id=user_id).update(open_flags=F('open_flags') + delta):
+        return
+    if delta > 0:
+        # First flag for this reviewer: seed the counter from their (indexed) flags
+        _, created = ReviewerFlagCount.objects.get_or_create(
+            user_id=user_id,
+            defaults={'open_flags': _open_flags(user_id, using)},
+        )
+        if not created:
+            ReviewerFlagCount.objects.filter(user_id=user_id).update(open_flags=F('open_flags') + delta)
+
+
+def count_bulk_flags(flags, using=None):
+    """Update reviewer counters after ClaimFlag.objects.bulk_create, which sends no signals"""
+    for user_id, added in Counter(flag.user_id for flag in flags).items():
+        adjust_reviewer_count(user_id, added, using)
+
+
+def recount_reviewer_flags():
+    """Rebuild every reviewer counter from the flag table of every shard"""
+    counts = combine_groups(scatter(
+        lambda alias: list(ClaimFlag.objects.using(alias).values('user_id').annotate(open_flags=Count('id')).order_by())
+    ), 'user_id', ['open_flags'])
+    ReviewerFlagCount.objects.all().delete()
+    ReviewerFlagCount.objects.bulk_create(
+        [ReviewerFlagCount(user_id=row['user_id'], open_flags=row['open_flags']) for row in counts]
+    )
@@ -0,0 +1,267 @@
+import csv
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .counts import bump_data_version
+from .models import ChangeEvent, Claim, ClaimDetail, ImportCheckpoint
+from .outbox import record_changes
+from .sharding import group_by_shard, locate_claims, shard_for
+
+DELIMITER = '|'
+CLAIM_COLUMNS = ['id', 'patient_name', 'billed_amount', 'paid_amount', 'status', 'insurer_name', 'discharge_date']
+DETAIL_COLUMNS = ['claim_id', 'denial_reason', 'cpt_codes']
+VALID_STATUSES = {value for value, _ in Claim.STATUS_CHOICES}
+MAX_AMOUNT = Decimal('10000000000')  # max_digits=12, decimal_places=2
+
+
+@dataclass
+class ImportResult:
+    """Outcome of importing one file (counts cover this run only)"""
+    path: str
+    loaded: int = 0
+    skipped: int = 0
+    quarantined: int = 0
+    resumed_from: int = 0
+    quarantine_path: str = ''
+
+
+def _amount(value, label):
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f'{label} is not a number: {value!r}')
+    if not amount.is_finite() or amount < 0 or amount >= MAX_AMOUNT:
+        raise ValueError(f'{label} out of range: {value!r}')
+    return amount.quantize(Decimal('0.01'))
+
+
+def _text(value, label, max_length=200):
+    value = value.strip()
+    if not value:
+        raise ValueError(f'{label} is empty')
+    if len(value) > max_length:
+        raise ValueError(f'{label} longer than {max_length} characters')
+    return value
+
+
+def _integer(value, label):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{label} is not an integer: {value!r}')
+
+
+def clean_claim(record):
+    """Validate one claims row and return model field values"""
+    status = record['status'].strip()
+    if status not in VALID_STATUSES:
+        raise ValueError(f'unknown status: {status!r}')
+    try:
+        discharge_date = datetime.strptime(record['discharge_date'].strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'invalid discharge_date: {record["discharge_date"]!r}')
+    return {
+        'id': _integer(record['id'], 'id'),
+        'patient_name': _text(record['patient_name'], 'patient_name'),
+        'billed_amount': _amount(record['billed_amount'], 'billed_amount'),
+        'paid_amount': _amount(record['paid_amount'], 'paid_amount'),
+        'status': status,
+        'insurer_name': _text(record['insurer_name'], 'insurer_name'),
+        'discharge_date': discharge_date,
+    }
+
+
+def clean_detail(record):
+    """Validate one claim details row and return model field values"""
+    denial_reason = record['denial_reason'].strip()
+    return {
+        'claim_id': _integer(record['claim_id'], 'claim_id'),
+        'denial_reason': denial_reason if denial_reason not in ('', 'N/A') else None,
+        'cpt_codes': record['cpt_codes'].strip(),
+    }
+
+
+CLEANERS = {'claims': (CLAIM_COLUMNS, clean_claim), 'details': (DETAIL_COLUMNS, clean_detail)}
+
+
+def parse_chunk(kind, header, first_line, lines):
+    """Parse and validate raw lines; returns (rows, rejects) as (line, raw, values|reason) tuples"""
+    _, clean = CLEANERS[kind]
+    rows, rejects = [], []
+    for line_number, raw in enumerate(lines, start=first_line):
+        try:
+            text = raw.decode('utf-8').rstrip('\r\n')
+        except UnicodeDecodeError:
+            rejects.append((line_number, raw.decode('utf-8', 'replace').rstrip('\r\n'), 'invalid UTF-8'))
+            continue
+        if not text.strip():
+            continue
+        values = next(csv.reader([text], delimiter=DELIMITER))
+        if len(values) != len(header):
+            rejects.append((line_number, text, f'expected {len(header)} fields, got {len(values)}'))
+            continue
+        try:
+            rows.append((line_number, text, clean(dict(zip(header, values)))))
+        except ValueError as e:
+            rejects.append((line_number, text, str(e)))
+    return rows, rejects
+
+
+def read_chunks(f, first_line, chunk_lines):
+    """Yield (first_line, end_offset, lines) blocks of whole lines from a binary file
+
+    Records are one per line, so any line boundary is a safe place to resume from.
+    """
+    while True:
+        lines = []
+        while len(lines) < chunk_lines:
+            line = f.readline()
+            if not line:
+                break
+            lines.append(line)
+        if not lines:
+            return
+        yield first_line, f.tell(), lines
+        first_line += len(lines)
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _parse_in_pool(kind, header, chunks, workers):
+    # Keep a bounded number of chunks in flight so memory does not grow with file size;
+    # results come back in file order for the single writer
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        pending = deque()
+        for first_line, end_offset, lines in chunks:
+            future = pool.submit(parse_chunk, kind, header, first_line, lines)
+            pending.append((first_line, end_offset, len(lines), future))
+            if len(pending) >= workers * 2:
+                first, end, count, future = pending.popleft()
+                yield (first, end, count) + future.result()
+        while pending:
+            first, end, count, future = pending.popleft()
+            yield (first, end, count) + future.result()
+
+
+def _parse_inline(kind, header, chunks):
+    for first_line, end_offset, lines in chunks:
+        yield (first_line, end_offset, len(lines)) + parse_chunk(kind, header, first_line, lines)
+
+
+def write_claims(rows):
+    """Insert new claims on their shards; existing ids are skipped as the old get_or_create import did"""
+    existing = locate_claims(values['id'] for _, _, values in rows)
+    new = {}
+    for _, _, values in rows:
+        if values['id'] not in existing:
+            new.setdefault(values['id'], values)
+    placed = group_by_shard(new.values(), lambda values: shard_for(values['insurer_name'], values['id']))
+    for alias, claims in placed.items():
+        claims = [Claim(**values) for values in claims]
+        with transaction.atomic(using=alias):
+            Claim.objects.using(alias).bulk_create(claims, batch_size=1000)
+            record_changes(claims, ChangeEvent.INSERT, alias)
+    return len(new), len(rows) - len(new), []
+
+
+def write_details(rows):
+    """Insert the first detail row per claim, next to its claim; rows for unknown claims are rejected"""
+    known = locate_claims({values['claim_id'] for _, _, values in rows})
+    has_detail = set()
+    for alias, claim_ids in group_by_shard(known, known.get).items():
+        has_detail.update(ClaimDetail.objects.using(alias).filter(claim_id__in=claim_ids).values_list('claim_id', flat=True))
+    new, rejects = {}, []
+    for line_number, text, values in rows:
+        if values['claim_id'] not in known:
+            rejects.append((line_number, text, f'unknown claim id {values["claim_id"]}'))
+        elif values['claim_id'] not in has_detail:
+            new.setdefault(values['claim_id'], values)
+    for alias, details in group_by_shard(new.values(), lambda values: known[values['claim_id']]).items():
+        ClaimDetail.objects.using(alias).bulk_create([ClaimDetail(**values) for values in details], batch_size=1000)
+    return len(new), len(rows) - len(new) - len(rejects), rejects
+
+
+WRITERS = {'claims': write_claims, 'details': write_details}
+
+
+def quarantine_path(path):
+    return os.path.join(settings.CLAIMS_IMPORT_QUARANTINE_DIR, f'{os.path.basename(path)}.quarantine')
+
+
+def ingest_file(path, kind, resume=False, workers=1, chunk_lines=5000):
+    """Stream a pipe-delimited file into the database, checkpointing after every chunk
+
+    Parsing runs in `workers` processes; this process is the only writer, and commits
+    each chunk together with its checkpoint so a rerun with resume=True picks up after
+    the last committed chunk. Invalid rows are appended to a quarantine file.
+    """
+    columns, _ = CLEANERS[kind]
+    path = os.path.abspath(path)
+    result = ImportResult(path=path, quarantine_path=quarantine_path(path))
+
+    with open(path, 'rb') as f:
+        header = next(csv.reader([f.readline().decode('utf-8-sig').rstrip('\r\n')], delimiter=DELIMITER))
+        missing = [column for column in columns if column not in header]
+        if missing:
+            raise ValueError(f'{path} is missing columns: {", ".join(missing)}')
+
+        checkpoint = ImportCheckpoint.objects.filter(path=path, kind=kind).first()
+        if resume and checkpoint:
+            if checkpoint.offset > os.path.getsize(path):
+                raise ValueError(f'{path} is shorter than its checkpoint; it has changed since the last import')
+            f.seek(checkpoint.offset)
+            result.resumed_from = checkpoint.offset
+        else:
+            checkpoint, _ = ImportCheckpoint.objects.update_or_create(path=path, defaults={
+                'kind': kind, 'offset': f.tell(), 'line': 2, 'rows_loaded': 0, 'rows_skipped': 0,
+                'rows_quarantined': 0, 'started_at': timezone.now(),
+            })
+        checkpoint.completed = False
+
+        chunks = read_chunks(f, checkpoint.line, chunk_lines)
+        if workers > 1:
+            parsed = _parse_in_pool(kind, header, chunks, workers)
+        else:
+            parsed = _parse_inline(kind, header, chunks)
+
+        os.makedirs(settings.CLAIMS_IMPORT_QUARANTINE_DIR, exist_ok=True)
+        with open(result.quarantine_path, 'a' if resume else 'w', newline='') as quarantine:
+            writer = csv.writer(quarantine, delimiter=DELIMITER)
+            if quarantine.tell() == 0:
+                writer.writerow(['line', 'reason', 'row'])
+            for first_line, end_offset, line_count, rows, rejects in parsed:
+                # Shard writes commit on their own; a chunk repeated after a crash skips what they stored
+                with transaction.atomic():
+                    loaded, skipped, write_rejects = WRITERS[kind](rows)
+                    rejects = rejects + write_rejects
+                    # Quarantine is written before the commit: a crash can repeat entries, never lose them
+                    for line_number, text, reason in rejects:
+                        writer.writerow([line_number, reason, text])
+                    quarantine.flush()
+                    checkpoint.offset = end_offset
+                    checkpoint.line = first_line + line_count
+                    checkpoint.rows_loaded += loaded
+                    checkpoint.rows_skipped += skipped
+                    checkpoint.rows_quarantined += len(rejects)
+                    checkpoint.save()
+                result.loaded += loaded
+                result.skipped += skipped
+                result.quarantined += len(rejects)
+                if loaded:
+                    bump_data_version()
+
+    checkpoint.completed = True
+    checkpoint.save(update_fields=['completed', 'updated_at'])
+    return result
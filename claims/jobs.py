@@ -0,0 +1,300 @@
+import csv
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .flag_queue import adjust_reviewer_count
+from .models import ChangeEvent, Claim, ClaimFlag, Job
+from .outbox import record_changes
+from .sharding import group_by_shard, locate_claims, scatter, stream_ordered
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {}
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler when its job has been cancelled"""
+
+
+def job_handler(kind):
+    """Register a function as the handler for a job kind"""
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+class JobContext:
+    """What a handler sees: its parameters plus progress and cancellation hooks"""
+
+    def __init__(self, job):
+        self.job = job
+        self.params = job.params
+
+    def set_progress(self, percent, message=''):
+        """Record progress and raise JobCancelled if someone asked to stop"""
+        now = timezone.now()
+        Job.objects.filter(id=self.job.id).update(
+            progress=max(0, min(int(percent), 100)),
+            progress_message=message[:200],
+            heartbeat_at=now,
+        )
+        if Job.objects.filter(id=self.job.id, cancel_requested=True).exists():
+            raise JobCancelled()
+
+
+def enqueue(kind, params=None, user=None, max_attempts=3):
+    """Queue a job for the run_workers pool"""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    return Job.objects.create(kind=kind, params=params or {}, created_by=user, max_attempts=max_attempts)
+
+
+def cancel(job):
+    """Cancel a queued job now, or ask a running one to stop at its next progress update"""
+    if Job.objects.filter(id=job.id, status='Queued').update(
+        status='Cancelled', finished_at=timezone.now()
+    ):
+        return
+    Job.objects.filter(id=job.id, status='Running').update(cancel_requested=True)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim_next_job(worker):
+    """Atomically take the oldest runnable job; safe across processes without row locks"""
+    now = timezone.now()
+    candidates = Job.objects.filter(status='Queued', run_after__lte=now).order_by('run_after', 'id')
+    for job_id in candidates.values_list('id', flat=True)[:10]:
+        claimed = Job.objects.filter(id=job_id, status='Queued').update(
+            status='Running',
+            locked_by=worker,
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+class Heartbeat:
+    """Stamps heartbeat_at from a background thread while a job runs, however rarely its handler reports progress"""
+
+    def __init__(self, job):
+        self.job = job
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._beat, name=f'job-{job.id}-heartbeat', daemon=True)
+
+    def _beat(self):
+        try:
+            while not self.stopped.wait(settings.CLAIMS_JOB_HEARTBEAT_SECONDS):
+                try:
+                    Job.objects.filter(id=self.job.id, status='Running', locked_by=self.job.locked_by).update(
+                        heartbeat_at=timezone.now()
+                    )
+                except DatabaseError:
+                    logger.warning(f"Heartbeat for job {self.job.id} failed", exc_info=True)
+        finally:
+            connections.close_all()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+def run_job(job):
+    """Run a claimed job and record success, retry, failure or cancellation"""
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f'No handler registered for {job.kind}')
+        with Heartbeat(job):
+            result = handler(JobContext(job))
+    except JobCancelled:
+        job.status = 'Cancelled'
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            # Exponential backoff before the next attempt
+            job.status = 'Queued'
+            job.run_after = timezone.now() + timedelta(seconds=30 * 2 ** (job.attempts - 1))
+            job.locked_by = ''
+        else:
+            job.status = 'Failed'
+        logger.warning(f"Job {job.id} ({job.kind}) failed on attempt {job.attempts}")
+    else:
+        job.status = 'Succeeded'
+        job.progress = 100
+        job.result = result
+    if job.status != 'Queued':
+        job.finished_at = timezone.now()
+    fields = ['status', 'result', 'error', 'run_after', 'locked_by', 'finished_at']
+    if job.status == 'Succeeded':
+        fields.append('progress')
+    # Otherwise the progress the handler recorded stands; this in-memory copy never saw it
+    job.save(update_fields=fields)
+    return job
+
+
+def requeue_stale_jobs(timeout_seconds):
+    """Put back jobs whose worker stopped sending heartbeats (e.g. it was killed)
+
+    A job that has already used all its attempts is marked failed instead, so one
+    that keeps killing its worker is not retried forever. Returns (requeued, failed).
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status='Running', heartbeat_at__lt=now - timedelta(seconds=timeout_seconds))
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='Failed', locked_by='', finished_at=now,
+        error=f'Worker stopped sending heartbeats for over {timeout_seconds}s on its last attempt',
+    )
+    requeued = stale.filter(attempts__lt=F('max_attempts')).update(status='Queued', locked_by='')
+    return requeued, failed
+
+
+def run_next_job(worker=None):
+    """Claim and run one job; returns it, or None when the queue is empty"""
+    job = claim_next_job(worker or worker_name())
+    return run_job(job) if job else None
+
+
+def worker_loop(poll_interval=1.0, stop_when_idle=False, stale_after=None):
+    """Process jobs until stopped; one of these runs in each run_workers process
+
+    With stale_after, jobs whose worker died are put back every stale_after / 2
+    seconds, so they are picked up again without restarting run_workers.
+    """
+    worker = worker_name()
+    processed = 0
+    next_sweep = 0
+    try:
+        while True:
+            if stale_after and time.monotonic() >= next_sweep:
+                requeued, failed = requeue_stale_jobs(stale_after)
+                if requeued or failed:
+                    logger.warning(f"Requeued {requeued} and failed {failed} jobs with no heartbeat for {stale_after}s")
+                next_sweep = time.monotonic() + stale_after / 2
+            job = run_next_job(worker)
+            if job:
+                processed += 1
+            elif stop_when_idle:
+                return processed
+            else:
+                time.sleep(poll_interval)
+    finally:
+        connections.close_all()
+
+
+def output_path(job, extension):
+    os.makedirs(settings.CLAIMS_JOB_OUTPUT_DIR, exist_ok=True)
+    return os.path.join(settings.CLAIMS_JOB_OUTPUT_DIR, f'job-{job.id}.{extension}')
+
+
+@job_handler('export_claims')
+def export_claims(context):
+    """Write the claims matching a list filter set to CSV, from every shard in list order
+
+    Like the list, a date range reaching past the archive horizon takes in archived claims.
+    """
+    from .archive import filtered_claims
+    from .filters import parse_claim_filters
+    filters, _ = parse_claim_filters(context.params.get('filters', {}))
+    total = sum(scatter(lambda alias: filtered_claims(filters, alias).count())) or 1
+    columns = ['id', 'patient_name', 'billed_amount', 'paid_amount', 'status', 'insurer_name', 'discharge_date']
+    # The sort column travels with each row so the shards' streams can be merged on it
+    fields = list(dict.fromkeys(columns + [filters['ordering'].lstrip('-')]))
+    path = output_path(context.job, 'csv')
+    rows = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for row in stream_ordered(lambda alias: filtered_claims(filters, alias).values(*fields), [filters['ordering']]):
+            writer.writerow([row[column] for column in columns])
+            rows += 1
+            if rows % 5000 == 0:
+                context.set_progress(rows * 100 / total, f'Exported {rows} claims')
+    return {'path': path, 'rows': rows}
+
+
+@job_handler('load_claims_data')
+def load_claims_data(context):
+    """Run the CSV import off the web workers"""
+    context.set_progress(0, 'Importing CSV data')
+    call_command('load_claims_data', **context.params)
+    return {'claims': sum(scatter(lambda alias: Claim.objects.using(alias).count()))}
+
+
+@job_handler('detect_anomalies')
+def detect_anomalies(context):
+    """Run duplicate and outlier detection and record System Flag notes"""
+    from .detection import detect_anomalies as detect, write_findings
+    context.set_progress(0, 'Scanning claims')
+    findings = detect()
+    context.set_progress(80, f'Writing {len(findings)} findings')
+    return {'findings': len(findings), 'written': write_findings(findings)}
+
+
+@job_handler('archive_claims')
+def archive_claims(context):
+    """Move claims past the archive horizon into cold storage"""
+    from .archive import archive_claims as archive
+    return {'archived': archive()}
+
+
+@job_handler('update_scorecards')
+def update_scorecards(context):
+    """Build the insurer scorecards on first use, or fold in recent claim changes"""
+    from .scorecards import update_scorecards as update
+    context.set_progress(0, 'Updating insurer scorecards')
+    return {'events': update()}
+
+
+@job_handler('bulk_flag')
+def bulk_flag(context):
+    """Flag many claims for one reviewer in batches"""
+    claim_ids = context.params['claim_ids']
+    user_id = context.params['user_id']
+    reason = context.params.get('reason', 'Flagged for review')
+    batch_size = 1000
+    for offset in range(0, len(claim_ids), batch_size):
+        batch = claim_ids[offset:offset + batch_size]
+        located = locate_claims(batch)
+        added = 0
+        # Each flag goes on its claim's shard
+        for alias, shard_batch in group_by_shard(located, located.get).items():
+            with transaction.atomic(using=alias):
+                already = set(
+                    ClaimFlag.objects.using(alias).filter(user_id=user_id, claim_id__in=shard_batch)
+                    .values_list('claim_id', flat=True)
+                )
+                ClaimFlag.objects.using(alias).bulk_create(
+                    [ClaimFlag(claim_id=claim_id, user_id=user_id, reason=reason) for claim_id in shard_batch],
+                    ignore_conflicts=True,
+                )
+                # ignore_conflicts leaves the new flags without ids, so read them back for the outbox
+                new_flags = list(ClaimFlag.objects.using(alias).filter(
+                    user_id=user_id, claim_id__in=set(shard_batch) - already
+                ))
+                record_changes(new_flags, ChangeEvent.INSERT, alias)
+            added += len(new_flags)
+        adjust_reviewer_count(user_id, added)
+        context.set_progress((offset + len(batch)) * 100 / len(claim_ids), f'Flagged {offset + len(batch)} claims')
+    return {'flagged': len(claim_ids)}
@@ -0,0 +1,232 @@
+import http.cookiejar
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.urls import reverse
+
+from .models import Claim
+
+
+@dataclass(frozen=True)
+class Sample:
+    """One request made during a load test"""
+    endpoint: str
+    elapsed_ms: float
+    status: int
+    error: str = ''
+
+    @property
+    def ok(self):
+        return not self.error and self.status < 400
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(samples, elapsed_seconds):
+    """Throughput, latency percentiles and errors per endpoint and overall"""
+    groups = defaultdict(list)
+    for sample in samples:
+        groups[sample.endpoint].append(sample)
+    groups['TOTAL'] = list(samples)
+
+    summary = {}
+    for endpoint, group in sorted(groups.items()):
+        latencies = [sample.elapsed_ms for sample in group]
+        errors = [sample for sample in group if not sample.ok]
+        summary[endpoint] = {
+            'requests': len(group),
+            'errors': len(errors),
+            'error_examples': sorted({sample.error or f'HTTP {sample.status}' for sample in errors})[:5],
+            'throughput_rps': round(len(group) / elapsed_seconds, 2) if elapsed_seconds else 0,
+            'mean_ms': round(sum(latencies) / len(latencies), 1) if latencies else 0,
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+            'p99_ms': round(percentile(latencies, 99), 1),
+            'max_ms': round(max(latencies), 1) if latencies else 0,
+        }
+    return summary
+
+
+class TrafficMix:
+    """Weighted reviewer actions against the claims app, sampled from the local database
+
+    Flagging and noting claims are real writes, so they are only in the mix with with_writes.
+    """
+
+    def __init__(self, seed=None, with_writes=False):
+        self.random = random.Random(seed)
+        self.claim_ids = list(Claim.objects.order_by('?').values_list('id', flat=True)[:500])
+        self.insurers = list(Claim.objects.order_by().values_list('insurer_name', flat=True).distinct()[:50])
+        self.statuses = [value for value, _ in Claim.STATUS_CHOICES]
+        self.actions = [
+            ('list', 20, self.list_default),
+            ('list_filter', 15, self.list_filter),
+            ('list_sort', 10, self.list_sort),
+            ('list_page', 15, self.list_page),
+            ('detail_modal', 25, self.detail_modal),
+            ('dashboard', 7, self.dashboard),
+        ]
+        if with_writes:
+            self.actions += [
+                ('flag', 4, self.flag),
+                ('note', 4, self.note),
+            ]
+
+    def next_request(self):
+        """Return (endpoint, method, path, data, headers) for the next action"""
+        endpoint, _, build = self.random.choices(self.actions, weights=[a[1] for a in self.actions])[0]
+        return (endpoint,) + build()
+
+    def _list(self, params):
+        return 'GET', f'{reverse("claims_list")}?{urllib.parse.urlencode(params)}', None, {'HX-Request': 'true'}
+
+    def list_default(self):
+        return 'GET', reverse('claims_list'), None, {}
+
+    def list_filter(self):
+        params = self.random.choice([
+            {'status': self.random.choice(self.statuses)},
+            {'insurer': self.random.choice(self.insurers or [''])},
+            {'min_amount': self.random.choice([1000, 10000, 100000])},
+            {'search': self.random.choice(['an', 'john', 'health', str(self.random.choice(self.claim_ids or [1]))])},
+        ])
+        return self._list(params)
+
+    def list_sort(self):
+        return self._list({
+            'sort': self.random.choice(['id', 'patient', 'insurer', 'amount', 'status', 'date', 'underpayment']),
+            'direction': self.random.choice(['asc', 'desc']),
+        })
+
+    def list_page(self):
+        return self._list({'page': self.random.randint(1, 50)})
+
+    def _claim_id(self):
+        return self.random.choice(self.claim_ids) if self.claim_ids else 1
+
+    def detail_modal(self):
+        return 'GET', reverse('claim_detail', args=[self._claim_id()]), None, {'HX-Request': 'true'}
+
+    def flag(self):
+        data = {'reason': 'Load test review'}
+        return 'POST', reverse('flag_claim', args=[self._claim_id()]), data, {'HX-Request': 'true'}
+
+    def note(self):
+        data = {'content': 'Load test note', 'note_type': 'User Note'}
+        return 'POST', reverse('add_note', args=[self._claim_id()]), data, {'HX-Request': 'true'}
+
+    def dashboard(self):
+        return 'GET', reverse('admin_dashboard'), None, {}
+
+
+class VirtualReviewer:
+    """A logged-in browser session with its own cookies and CSRF token"""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+
+    def _csrf_token(self):
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def request(self, method, path, data=None, headers=None):
+        """Make one request; returns (status, elapsed_ms, error)"""
+        headers = dict(headers or {})
+        body = None
+        if method == 'POST':
+            body = urllib.parse.urlencode(data or {}).encode()
+            headers['X-CSRFToken'] = self._csrf_token()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                response.read()
+                status, error = response.status, ''
+        except urllib.error.HTTPError as e:
+            status, error = e.code, ''
+        except (urllib.error.URLError, OSError) as e:
+            status, error = 0, str(getattr(e, 'reason', e))
+        return status, (time.perf_counter() - started) * 1000, error
+
+    def login(self, username, password):
+        self.request('GET', reverse('login'))
+        status, _, error = self.request('POST', reverse('login'), {
+            'username': username,
+            'password': password,
+            'csrfmiddlewaretoken': self._csrf_token(),
+        })
+        if error or status >= 400 or not any(cookie.name == 'sessionid' for cookie in self.cookies):
+            raise RuntimeError(f'Could not log in as {username} (HTTP {status} {error})'.strip())
+
+
+def run_load(base_url, username, password, concurrency=10, duration=30, max_requests=None, seed=None,
+             with_writes=False):
+    """Drive the traffic mix from ``concurrency`` reviewers; returns (samples, elapsed_seconds)"""
+    mix = TrafficMix(seed, with_writes)
+    reviewers = [VirtualReviewer(base_url) for _ in range(concurrency)]
+    for reviewer in reviewers:
+        reviewer.login(username, password)
+
+    samples = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def work(reviewer):
+        while time.monotonic() < deadline:
+            with lock:
+                if max_requests is not None and len(samples) >= max_requests:
+                    return
+                endpoint, method, path, data, headers = mix.next_request()
+            status, elapsed_ms, error = reviewer.request(method, path, data, headers)
+            with lock:
+                samples.append(Sample(endpoint, elapsed_ms, status, error))
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=work, args=(reviewer,), daemon=True) for reviewer in reviewers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.monotonic() - started
+
+
+def compare(current, previous):
+    """Per-endpoint change in p95 latency and throughput against an earlier result file"""
+    rows = []
+    for endpoint, stats in current['endpoints'].items():
+        before = previous.get('endpoints', {}).get(endpoint)
+        if not before:
+            continue
+        rows.append({
+            'endpoint': endpoint,
+            'p95_ms': stats['p95_ms'],
+            'p95_change_pct': round((stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100, 1)
+            if before['p95_ms'] else 0,
+            'throughput_change_pct': round(
+                (stats['throughput_rps'] - before['throughput_rps']) / before['throughput_rps'] * 100, 1
+            ) if before['throughput_rps'] else 0,
+        })
+    return rows
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,121 @@
+import os
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.migrations import Migration
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.operations import AddIndex
+from django.db.migrations.writer import MigrationWriter
+from claims.models import Claim, QueryPattern
+from claims.workload import benchmark_workload, flush_query_patterns, pattern_queryset, propose_index
+
+class Command(BaseCommand):
+    help = 'Rank recorded claims list query patterns and propose composite indexes for them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=10,
+            help='Number of most expensive patterns to analyse',
+        )
+        parser.add_argument(
+            '--benchmark',
+            action='store_true',
+            help='Temporarily create each candidate index and time the recorded workload with it',
+        )
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=5,
+            help='Timed repetitions per pattern when benchmarking',
+        )
+        parser.add_argument(
+            '--write-migration',
+            action='store_true',
+            help='Write a migration adding the proposed (or, with --benchmark, the faster) indexes',
+        )
+
+    def handle(self, *args, **options):
+        # Samples buffered in a shared cache since the last background flush
+        flush_query_patterns()
+        patterns = list(QueryPattern.objects.order_by('-total_ms')[:options['top']])
+        if not patterns:
+            self.stdout.write(self.style.WARNING('No query patterns recorded yet.'))
+            return
+
+        candidates = {}
+        for rank, pattern in enumerate(patterns, start=1):
+            self.stdout.write('\n' + '='*50)
+            self.stdout.write(
+                f'#{rank}: {pattern.hits} hits, {pattern.avg_ms:.1f} ms avg, '
+                f'filters={pattern.shape["filters"]} ordering={pattern.shape["ordering"]}'
+            )
+            self.stdout.write(pattern_queryset(pattern).explain())
+            index = propose_index(pattern, connection.vendor)
+            if index is None:
+                self.stdout.write('  No new index proposed (covered or not indexable).')
+                continue
+            candidates.setdefault(index.name, index)
+            self.stdout.write(self.style.SUCCESS(f'  Proposed: {self._describe(index)}'))
+
+        if not candidates:
+            return
+
+        accepted = list(candidates.values())
+        if options['benchmark']:
+            accepted = self._benchmark(patterns, accepted, options['runs'])
+
+        if accepted:
+            self.stdout.write('\nAdd to Claim.Meta.indexes:')
+            for index in accepted:
+                self.stdout.write(f'    {self._describe(index)},')
+        if options['write_migration'] and accepted:
+            path = self._write_migration(accepted)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {path}'))
+
+    def _describe(self, index):
+        _, _, kwargs = index.deconstruct()
+        if 'condition' in kwargs:
+            lookups = ', '.join(f'{key}={value!r}' for key, value in kwargs['condition'].children)
+            kwargs['condition'] = f'models.Q({lookups})'
+        arguments = ', '.join(
+            f'{key}={value}' if key == 'condition' else f'{key}={value!r}'
+            for key, value in kwargs.items()
+        )
+        return f'models.Index({arguments})'
+
+    def _benchmark(self, patterns, candidates, runs):
+        self.stdout.write('\n' + '='*50)
+        self.stdout.write('Benchmarking candidates against the recorded workload...')
+        baseline = benchmark_workload(patterns, runs=runs)
+        self.stdout.write(f'  Baseline: {baseline:.1f} weighted ms')
+
+        faster = []
+        for index in candidates:
+            with connection.schema_editor() as editor:
+                editor.add_index(Claim, index)
+            try:
+                cost = benchmark_workload(patterns, runs=runs)
+            finally:
+                with connection.schema_editor() as editor:
+                    editor.remove_index(Claim, index)
+            change = (baseline - cost) / baseline * 100 if baseline else 0
+            line = f'  {index.name}: {cost:.1f} weighted ms ({change:+.1f}% faster)'
+            if cost < baseline:
+                faster.append(index)
+                self.stdout.write(self.style.SUCCESS(line))
+            else:
+                self.stdout.write(self.style.WARNING(line))
+        return faster
+
+    def _write_migration(self, indexes):
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        leaf = loader.graph.leaf_nodes('claims')[0]
+        number = int(leaf[1].split('_', 1)[0]) + 1
+        migration = Migration(f'{number:04d}_advised_indexes', 'claims')
+        migration.dependencies = [leaf]
+        migration.operations = [AddIndex('claim', index) for index in indexes]
+        writer = MigrationWriter(migration)
+        with open(writer.path, 'w') as f:
+            f.write(writer.as_string())
+        return os.path.relpath(writer.path)
@@ -0,0 +1,52 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from claims.archive import archive_claims, archive_horizon, restore_claims
+from claims.models import ArchivedClaim, Claim
+
+class Command(BaseCommand):
+    help = 'Move claims older than the archive horizon to the archive tables, or restore them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--before',
+            type=str,
+            help='Archive claims discharged before this date (YYYY-MM-DD); defaults to the horizon',
+        )
+        parser.add_argument(
+            '--restore',
+            action='store_true',
+            help='Move archived claims back into the hot table',
+        )
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='With --restore, only restore claims discharged on or after this date',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of claims moved per transaction',
+        )
+
+    def _parse_date(self, value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Invalid date: {value} (expected YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        if options['restore']:
+            since = self._parse_date(options['since']) if options['since'] else None
+            restored = restore_claims(since=since, batch_size=batch_size)
+            self.stdout.write(self.style.SUCCESS(f'Restored {restored} claims from the archive'))
+        else:
+            before = self._parse_date(options['before']) if options['before'] else archive_horizon()
+            self.stdout.write(f'Archiving claims discharged before {before}...')
+            moved = archive_claims(before=before, batch_size=batch_size)
+            self.stdout.write(self.style.SUCCESS(f'Archived {moved} claims'))
+
+        self.stdout.write(f'  Hot claims: {Claim.objects.count()}')
+        self.stdout.write(f'  Archived claims: {ArchivedClaim.objects.count()}')
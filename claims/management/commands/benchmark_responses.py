@@ -0,0 +1,54 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+PAGES = [
+    ('list, 25 rows', {'per_page': '25'}, {}),
+    ('list, 100 rows', {'per_page': '100'}, {}),
+    ('table partial, 100 rows', {'per_page': '100'}, {'HTTP_HX_REQUEST': 'true'}),
+]
+
+ENCODINGS = ['identity', 'gzip', 'gzip, deflate, br']
+
+class Command(BaseCommand):
+    help = 'Measure payload size and server-side time to first byte of claims list pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=5,
+            help='Requests per page, encoding and mode (the median is reported)',
+        )
+
+    def _measure(self, client, params, headers, encoding):
+        started = time.perf_counter()
+        response = client.get(reverse('claims_list'), params, HTTP_ACCEPT_ENCODING=encoding, **headers)
+        if response.streaming:
+            chunks = iter(response.streaming_content)
+            first = next(chunks, b'')
+            ttfb = time.perf_counter() - started
+            size = len(first) + sum(len(chunk) for chunk in chunks)
+        else:
+            ttfb = time.perf_counter() - started
+            size = len(response.content)
+        total = time.perf_counter() - started
+        return ttfb * 1000, total * 1000, size, response.get('Content-Encoding', 'identity')
+
+    def handle(self, *args, **options):
+        client = Client(HTTP_HOST='localhost')
+        self.stdout.write(
+            f'{"Page":<26} {"Mode":<9} {"Encoding":<9} {"Bytes":>9} {"TTFB":>9} {"Total":>9}'
+        )
+        for label, params, headers in PAGES:
+            for mode, min_rows in (('buffered', 10 ** 6), ('streamed', 1)):
+                with override_settings(CLAIMS_STREAM_MIN_ROWS=min_rows):
+                    for encoding in ENCODINGS:
+                        runs = [self._measure(client, params, headers, encoding) for _ in range(options['runs'])]
+                        self.stdout.write(
+                            f'{label:<26} {mode:<9} {runs[-1][3]:<9} {runs[-1][2]:>9,} '
+                            f'{statistics.median(r[0] for r in runs):>7.1f}ms '
+                            f'{statistics.median(r[1] for r in runs):>7.1f}ms'
+                        )
@@ -0,0 +1,59 @@
+import os
+import time
+from django.core.management.base import BaseCommand
+from claims.detection import DetectionOptions, detect_anomalies, write_findings
+
+class Command(BaseCommand):
+    help = 'Detect likely duplicate claims and amount outliers and record them as System Flag notes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Worker processes scanning insurer partitions',
+        )
+        parser.add_argument(
+            '--window-days',
+            type=int,
+            default=7,
+            help='Maximum days between discharge dates of likely duplicates',
+        )
+        parser.add_argument(
+            '--amount-tolerance',
+            type=float,
+            default=0.05,
+            help='Maximum relative difference between amounts of likely duplicates',
+        )
+        parser.add_argument(
+            '--z-threshold',
+            type=float,
+            default=4.0,
+            help='Standard deviations from the insurer mean that make an amount an outlier',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report findings without writing notes',
+        )
+
+    def handle(self, *args, **options):
+        detection_options = DetectionOptions(
+            window_days=options['window_days'],
+            amount_tolerance=options['amount_tolerance'],
+            z_threshold=options['z_threshold'],
+        )
+        started = time.monotonic()
+        self.stdout.write(f'Scanning claims with {options["workers"]} worker(s)...')
+        findings = detect_anomalies(detection_options, workers=options['workers'])
+        self.stdout.write(f'Found {len(findings)} findings in {time.monotonic() - started:.1f}s')
+
+        if options['dry_run']:
+            for claim_id, content in findings[:50]:
+                self.stdout.write(f'  Claim {claim_id}: {content}')
+            return
+
+        written = write_findings(findings)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote or refreshed {written} System Flag notes ({len(findings) - written} already up to date)'
+        ))
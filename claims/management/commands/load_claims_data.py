@@ -1,9 +1,10 @@
-import csv
 import os
-from datetime import datetime
-from django.core.management.base import BaseCommand
-from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from claims.ingest import ingest_file
 from claims.models import Claim, ClaimDetail
+from claims.scorecards import update_scorecards
+from claims.sharding import combine_groups, scatter, shard_aliases
 
 class Command(BaseCommand):
     help = 'Load CSV claim data into database'
@@ -27,12 +28,32 @@ class Command(BaseCommand):
             default='data/claim_detail_data.csv',
             help='Path to claim details CSV file'
         )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue each file from its last committed checkpoint',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=max((os.cpu_count() or 2) // 2, 1),
+            help='Worker processes parsing and validating rows (1 parses inline)',
+        )
+        parser.add_argument(
+            '--chunk-lines',
+            type=int,
+            default=5000,
+            help='Rows committed per transaction and checkpoint',
+        )
 
     def handle(self, *args, **options):
         claims_file = options['claims_file']
         details_file = options['details_file']
         overwrite = options['overwrite']
 
+        if overwrite and options['resume']:
+            raise CommandError('--overwrite and --resume cannot be combined')
+
         self.stdout.write(
             self.style.SUCCESS('Starting CSV data import...')
         )
@@ -53,70 +74,39 @@ class Command(BaseCommand):
         # Clear existing data if overwrite flag is set
         if overwrite:
             self.stdout.write('Clearing existing data...')
-            ClaimDetail.objects.all().delete()
-            Claim.objects.all().delete()
+            for alias in shard_aliases():
+                ClaimDetail.objects.using(alias).all().delete()
+                Claim.objects.using(alias).all().delete()
 
-        # Load claims data
-        claims_loaded = 0
-        with open(claims_file, 'r') as f:
-            reader = csv.DictReader(f, delimiter='|')
-            for row in reader:
-                try:
-                    claim, created = Claim.objects.get_or_create(
-                        id=int(row['id']),
-                        defaults={
-                            'patient_name': row['patient_name'],
-                            'billed_amount': float(row['billed_amount']),
-                            'paid_amount': float(row['paid_amount']),
-                            'status': row['status'],
-                            'insurer_name': row['insurer_name'],
-                            'discharge_date': datetime.strptime(row['discharge_date'], '%Y-%m-%d').date()
-                        }
-                    )
-                    if created:
-                        claims_loaded += 1
-                except Exception as e:
-                    self.stdout.write(
-                        self.style.ERROR(f'Error loading claim {row.get("id", "unknown")}: {e}')
-                    )
+        # Load claims, then details (which need their claims to exist)
+        for kind, path, label in (('claims', claims_file, 'claims'), ('details', details_file, 'claim details')):
+            try:
+                result = ingest_file(
+                    path,
+                    kind,
+                    resume=options['resume'],
+                    workers=options['workers'],
+                    chunk_lines=options['chunk_lines'],
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
 
-        self.stdout.write(
-            self.style.SUCCESS(f'Loaded {claims_loaded} claims')
-        )
-
-        # Load claim details
-        details_loaded = 0
-        with open(details_file, 'r') as f:
-            reader = csv.DictReader(f, delimiter='|')
-            for row in reader:
-                try:
-                    claim_id = int(row['claim_id'])
-                    if Claim.objects.filter(id=claim_id).exists():
-                        detail, created = ClaimDetail.objects.get_or_create(
-                            claim_id=claim_id,
-                            defaults={
-                                'denial_reason': row['denial_reason'] if row['denial_reason'] != 'N/A' else None,
-                                'cpt_codes': row['cpt_codes']
-                            }
-                        )
-                        if created:
-                            details_loaded += 1
-                    else:
-                        self.stdout.write(
-                            self.style.WARNING(f'Skipping detail for non-existent claim: {claim_id}')
-                        )
-                except Exception as e:
-                    self.stdout.write(
-                        self.style.ERROR(f'Error loading detail for claim {row.get("claim_id", "unknown")}: {e}')
-                    )
+            if result.resumed_from:
+                self.stdout.write(f'Resumed {path} from byte {result.resumed_from}')
+            self.stdout.write(
+                self.style.SUCCESS(f'Loaded {result.loaded} {label} ({result.skipped} already present)')
+            )
+            if result.quarantined:
+                self.stdout.write(
+                    self.style.WARNING(f'Quarantined {result.quarantined} invalid rows to {result.quarantine_path}')
+                )
 
-        self.stdout.write(
-            self.style.SUCCESS(f'Loaded {details_loaded} claim details')
-        )
+        # Fold the new claims into the insurer scorecards now rather than on the next page view
+        update_scorecards()
 
         # Summary statistics
-        total_claims = Claim.objects.count()
-        total_details = ClaimDetail.objects.count()
+        total_claims = sum(scatter(lambda alias: Claim.objects.using(alias).count()))
+        total_details = sum(scatter(lambda alias: ClaimDetail.objects.using(alias).count()))
         
         self.stdout.write('\n' + '='*50)
         self.stdout.write(f'Data import complete - Summary:')
@@ -124,9 +114,11 @@ class Command(BaseCommand):
         self.stdout.write(f'  Total Details in Database: {total_details}')
         self.stdout.write(f'  Claims by Status:')
         
-        for status_data in Claim.objects.values('status').distinct():
-            count = Claim.objects.filter(status=status_data['status']).count()
-            self.stdout.write(f'    {status_data["status"]}: {count}')
+        status_counts = combine_groups(scatter(
+            lambda alias: list(Claim.objects.using(alias).values('status').annotate(count=Count('id')).order_by('status'))
+        ), 'status', ['count'])
+        for status_data in sorted(status_counts, key=lambda row: row['status']):
+            self.stdout.write(f'    {status_data["status"]}: {status_data["count"]}')
         
         self.stdout.write('='*50)
         self.stdout.write(
@@ -0,0 +1,195 @@
+import importlib.util
+import json
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import reverse
+from claims.loadtest import compare, load_results, run_load, summarize
+
+class Command(BaseCommand):
+    help = 'Drive mixed reviewer traffic at the app and report throughput and latency percentiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            type=str,
+            help='Test an already running server (sharing this database) instead of starting one',
+        )
+        parser.add_argument(
+            '--server-workers',
+            type=int,
+            default=int(os.environ.get('WEB_CONCURRENCY', '4')),
+            help='Gunicorn workers for the local server (render.yaml runs 4)',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=10,
+            help='Simultaneous logged-in reviewers',
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=30,
+            help='Seconds to run',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            help='Stop after this many requests even if time remains',
+        )
+        parser.add_argument(
+            '--username',
+            type=str,
+            help='Reviewer to log in as; defaults to a loadtest user created for the run and deleted after it',
+        )
+        parser.add_argument(
+            '--password',
+            type=str,
+            help='Password for --username',
+        )
+        parser.add_argument(
+            '--with-writes',
+            action='store_true',
+            help='Also flag claims and add notes; they stay in the database unless the run created its own user',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='Random seed for a repeatable traffic mix',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Where to save the JSON results (default: a timestamped file in CLAIMS_LOADTEST_DIR)',
+        )
+        parser.add_argument(
+            '--compare',
+            type=str,
+            help='Earlier results file to compare against',
+        )
+
+    def _free_port(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    def _start_server(self, workers):
+        port = self._free_port()
+        if importlib.util.find_spec('gunicorn'):
+            command = [
+                sys.executable, '-m', 'gunicorn', 'claims_management.wsgi:application',
+                '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning',
+            ]
+        else:
+            command = [sys.executable, 'manage.py', 'runserver', '--noreload', f'127.0.0.1:{port}']
+        os.makedirs(settings.CLAIMS_LOADTEST_DIR, exist_ok=True)
+        log_path = os.path.join(settings.CLAIMS_LOADTEST_DIR, 'server.log')
+        self.stdout.write(f'Starting {" ".join(command[2:4])} on port {port} (log: {log_path})...')
+        with open(log_path, 'w') as log:
+            server = subprocess.Popen(command, cwd=settings.BASE_DIR, stdout=log, stderr=subprocess.STDOUT)
+
+        base_url = f'http://127.0.0.1:{port}'
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError('The local server exited during startup')
+            try:
+                urllib.request.urlopen(base_url + reverse('login'), timeout=2).read()
+                return server, base_url
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError('The local server did not start within 30 seconds')
+
+    def _git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ''
+
+    def handle(self, *args, **options):
+        username, password = options['username'], options['password']
+        if username and not password:
+            raise CommandError('--password is required with --username')
+        created_user = None
+        if not username:
+            username, password = f'loadtest-{secrets.token_hex(4)}', secrets.token_urlsafe(16)
+            created_user = User.objects.create_user(username=username, password=password)
+
+        server = None
+        base_url = options['url']
+        try:
+            if not base_url:
+                # The server processes open their own connections
+                connections.close_all()
+                server, base_url = self._start_server(options['server_workers'])
+            self.stdout.write(
+                f'Running {options["concurrency"]} reviewers against {base_url} for {options["duration"]:g}s...'
+            )
+            samples, elapsed = run_load(
+                base_url, username, password,
+                concurrency=options['concurrency'],
+                duration=options['duration'],
+                max_requests=options['requests'],
+                seed=options['seed'],
+                with_writes=options['with_writes'],
+            )
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        finally:
+            if server:
+                server.terminate()
+                server.wait(timeout=10)
+            if created_user:
+                # Takes the run's flags and notes with it, on every shard
+                created_user.delete()
+
+        summary = summarize(samples, elapsed)
+        results = {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'commit': self._git_commit(),
+            'target': base_url if options['url'] else f'local ({options["server_workers"]} workers)',
+            'concurrency': options['concurrency'],
+            'elapsed_s': round(elapsed, 1),
+            'endpoints': summary,
+        }
+
+        self.stdout.write('')
+        self.stdout.write(f'{"Endpoint":<14} {"Reqs":>6} {"Errs":>5} {"Req/s":>7} {"p50":>8} {"p95":>8} {"p99":>8}')
+        for endpoint, stats in summary.items():
+            line = (
+                f'{endpoint:<14} {stats["requests"]:>6} {stats["errors"]:>5} {stats["throughput_rps"]:>7} '
+                f'{stats["p50_ms"]:>6}ms {stats["p95_ms"]:>6}ms {stats["p99_ms"]:>6}ms'
+            )
+            self.stdout.write(self.style.ERROR(line) if stats['errors'] else line)
+            for example in stats['error_examples']:
+                self.stdout.write(f'    {example}')
+
+        output = options['output']
+        if not output:
+            os.makedirs(settings.CLAIMS_LOADTEST_DIR, exist_ok=True)
+            output = os.path.join(settings.CLAIMS_LOADTEST_DIR, f'loadtest-{datetime.now():%Y%m%d-%H%M%S}.json')
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'\nSaved results to {output}'))
+
+        if options['compare']:
+            self.stdout.write(f'\nCompared with {options["compare"]}:')
+            for row in compare(results, load_results(options['compare'])):
+                self.stdout.write(
+                    f'  {row["endpoint"]:<14} p95 {row["p95_ms"]}ms ({row["p95_change_pct"]:+}%), '
+                    f'throughput {row["throughput_change_pct"]:+}%'
+                )
@@ -0,0 +1,63 @@
+import json
+import os
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from claims.warmup import import_times_by_package, parse_import_times
+
+# Runs in a fresh interpreter so nothing is imported or cached yet
+CHILD = '''
+import json, os, sys, time
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "claims_management.settings")
+started = time.perf_counter()
+from claims_management.wsgi import application
+loaded = time.perf_counter() - started
+from claims.warmup import warm_up
+report = warm_up()
+json.dump({"load": loaded, "steps": report}, sys.stdout, default=str)
+'''
+
+class Command(BaseCommand):
+    help = 'Measure how long a fresh process takes to load the app, by imported module, and to warm it up, by step'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=15,
+            help='Rows to show in each breakdown',
+        )
+
+    def handle(self, *args, **options):
+        top = options['top']
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', CHILD],
+            cwd=settings.BASE_DIR, env=os.environ.copy(), capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f'Startup failed:\n{result.stderr[-2000:]}')
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        modules = parse_import_times(result.stderr)
+
+        self.stdout.write(f'Loading the WSGI application took {report["load"] * 1000:.0f}ms '
+                          f'({len(modules)} modules imported)')
+        self.stdout.write('\nImport time by top-level package (self time, summed):')
+        packages = sorted(import_times_by_package(modules).items(), key=lambda item: -item[1])
+        for package, seconds in packages[:top]:
+            self.stdout.write(f'  {package:<40} {seconds * 1000:>8.1f}ms')
+        self.stdout.write('\nSlowest modules (self time / including their imports):')
+        for name, own, cumulative in sorted(modules, key=lambda module: -module[1])[:top]:
+            self.stdout.write(f'  {name:<40} {own * 1000:>8.1f}ms {cumulative * 1000:>8.1f}ms')
+
+        self.stdout.write('\nWarm-up steps:')
+        for step, seconds, _ in report['steps']:
+            self.stdout.write(f'  {step:<40} {seconds * 1000:>8.1f}ms')
+        templates = next((output for step, _, output in report['steps'] if step == 'templates'), None) or {}
+        if templates:
+            self.stdout.write('\nSlowest templates to compile:')
+            for name, seconds in sorted(templates.items(), key=lambda item: -item[1])[:top]:
+                self.stdout.write(f'  {name:<40} {seconds * 1000:>8.1f}ms')
+        self.stdout.write(self.style.SUCCESS(
+            f'Total startup: {(report["load"] + sum(seconds for _, seconds, _ in report["steps"])) * 1000:.0f}ms'
+        ))
@@ -0,0 +1,63 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connections
+from claims.jobs import requeue_stale_jobs, worker_loop
+
+def _init_worker():
+    import django
+    django.setup()
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the database queue in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=max((os.cpu_count() or 2) // 2, 1),
+            help='Number of worker processes',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait between polls when the queue is empty',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=600,
+            help='Requeue running jobs with no heartbeat for this many seconds, checked at start and every half of it '
+                 '(keep well above CLAIMS_JOB_HEARTBEAT_SECONDS)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is empty instead of polling forever',
+        )
+
+    def handle(self, *args, **options):
+        requeued, failed = requeue_stale_jobs(options['stale_after'])
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale jobs'))
+        if failed:
+            self.stdout.write(self.style.ERROR(f'Failed {failed} stale jobs that had no attempts left'))
+
+        processes = options['processes']
+        if processes <= 1:
+            processed = worker_loop(options['poll_interval'], stop_when_idle=options['once'],
+                                    stale_after=options['stale_after'])
+            self.stdout.write(self.style.SUCCESS(f'Processed {processed} jobs'))
+            return
+
+        self.stdout.write(f'Starting {processes} job workers...')
+        # Each process opens its own database connection
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker) as pool:
+            futures = [
+                pool.submit(worker_loop, options['poll_interval'], options['once'], options['stale_after'])
+                for _ in range(processes)
+            ]
+            processed = sum(future.result() for future in futures)
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} jobs'))
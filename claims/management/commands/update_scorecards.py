@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from claims.models import InsurerMonthStats
+from claims.scorecards import rebuild_scorecards, update_scorecards
+
+class Command(BaseCommand):
+    help = 'Fold recent claim changes into the insurer scorecard sketches, or rebuild them from the claims'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Recompute every insurer-month from the claims instead of reading the change outbox',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['rebuild']:
+            cells = rebuild_scorecards()
+            self.stdout.write(self.style.SUCCESS(
+                f'Rebuilt {cells} insurer-months in {time.monotonic() - started:.1f}s'
+            ))
+        else:
+            events = update_scorecards()
+            self.stdout.write(self.style.SUCCESS(
+                f'Applied {events} changes in {time.monotonic() - started:.1f}s'
+            ))
+        self.stdout.write(f'  Insurer-months tracked: {InsurerMonthStats.objects.count()}')
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-19 07:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0002_claim_claims_clai_status_b4f911_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedClaim',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('patient_name', models.CharField(max_length=200)),
+                ('billed_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('paid_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('status', models.CharField(choices=[('Denied', 'Denied'), ('Paid', 'Paid'), ('Under Review', 'Under Review')], max_length=20)),
+                ('insurer_name', models.CharField(max_length=200)),
+                ('discharge_date', models.DateField()),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('related_data', models.JSONField(default=dict)),
+            ],
+            options={
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['discharge_date'], name='claims_arch_dischar_9b3d6c_idx'), models.Index(fields=['status'], name='claims_arch_status_f883f3_idx'), models.Index(fields=['insurer_name'], name='claims_arch_insurer_ef91c0_idx')],
+            },
+        ),
+    ]
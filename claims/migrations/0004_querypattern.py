@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-19 07:56
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0003_archivedclaim'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryPattern',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signature', models.CharField(max_length=40, unique=True)),
+                ('shape', models.JSONField(default=dict)),
+                ('example_filters', models.JSONField(default=dict)),
+                ('value_counts', models.JSONField(default=dict)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-total_ms'],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:05
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0004_querypattern'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedclaim',
+            name='payment_ratio',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast('paid_amount', models.FloatField()), '/', django.db.models.functions.comparison.NullIf(django.db.models.functions.comparison.Cast('billed_amount', models.FloatField()), models.Value(0.0))), output_field=models.FloatField()),
+        ),
+        migrations.AddField(
+            model_name='archivedclaim',
+            name='underpayment',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('billed_amount'), '-', models.F('paid_amount')), output_field=models.DecimalField(decimal_places=2, max_digits=12)),
+        ),
+        migrations.AddField(
+            model_name='claim',
+            name='payment_ratio',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast('paid_amount', models.FloatField()), '/', django.db.models.functions.comparison.NullIf(django.db.models.functions.comparison.Cast('billed_amount', models.FloatField()), models.Value(0.0))), output_field=models.FloatField()),
+        ),
+        migrations.AddField(
+            model_name='claim',
+            name='underpayment',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('billed_amount'), '-', models.F('paid_amount')), output_field=models.DecimalField(decimal_places=2, max_digits=12)),
+        ),
+        migrations.AddIndex(
+            model_name='claim',
+            index=models.Index(fields=['underpayment'], name='claims_clai_underpa_13fbda_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='claim',
+            index=models.Index(fields=['payment_ratio'], name='claims_clai_payment_9da3e3_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_reviewer_counts(apps, schema_editor):
+    ClaimFlag = apps.get_model('claims', 'ClaimFlag')
+    ReviewerFlagCount = apps.get_model('claims', 'ReviewerFlagCount')
+    counts = ClaimFlag.objects.values('user_id').annotate(open_flags=Count('id')).order_by()
+    ReviewerFlagCount.objects.bulk_create(
+        [ReviewerFlagCount(user_id=row['user_id'], open_flags=row['open_flags']) for row in counts]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('claims', '0007_importcheckpoint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewerFlagCount',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='flag_count', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('open_flags', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-open_flags'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='claimflag',
+            index=models.Index(fields=['user', 'flagged_at'], name='claims_clai_user_id_591b15_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='claimflag',
+            index=models.Index(fields=['flagged_at'], name='claims_clai_flagged_1468df_idx'),
+        ),
+        migrations.RunPython(backfill_reviewer_counts, migrations.RunPython.noop),
+    ]
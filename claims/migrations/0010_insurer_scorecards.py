@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:46
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0009_change_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='changeevent',
+            name='previous',
+            field=models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True),
+        ),
+        migrations.CreateModel(
+            name='InsurerMonthStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('insurer_name', models.CharField(max_length=255)),
+                ('month', models.DateField()),
+                ('claim_count', models.IntegerField(default=0)),
+                ('denied_count', models.IntegerField(default=0)),
+                ('billed_total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('paid_total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('payment_ratios', models.JSONField(default=dict)),
+                ('billed_amounts', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month'], name='claims_insu_month_ec769c_idx')],
+                'unique_together': {('insurer_name', 'month')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0011_saved_views'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='changeevent',
+            index=models.Index(fields=['claim_id', 'id'], name='claims_chan_claim_i_134e00_idx'),
+        ),
+    ]
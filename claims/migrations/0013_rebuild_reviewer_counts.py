@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-19 11:20
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def rebuild_reviewer_counts(apps, schema_editor):
+    # 0008's backfill read and wrote through the default database whichever one was
+    # being migrated; recount each database from its own flags
+    ClaimFlag = apps.get_model('claims', 'ClaimFlag')
+    ReviewerFlagCount = apps.get_model('claims', 'ReviewerFlagCount')
+    db_alias = schema_editor.connection.alias
+    counts = ClaimFlag.objects.using(db_alias).values('user_id').annotate(open_flags=Count('id')).order_by()
+    ReviewerFlagCount.objects.using(db_alias).all().delete()
+    ReviewerFlagCount.objects.using(db_alias).bulk_create(
+        [ReviewerFlagCount(user_id=row['user_id'], open_flags=row['open_flags']) for row in counts]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0012_change_event_claim_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_reviewer_counts, migrations.RunPython.noop),
+    ]
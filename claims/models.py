@@ -1,8 +1,42 @@
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Cast, NullIf
 from django.contrib.auth.models import User
 from django.utils import timezone
 
-class Claim(models.Model):
+class ChangeTrackedModel(models.Model):
+    """Saves run in a transaction, so the outbox event written on post_save commits with the row"""
+    
+    class Meta:
+        abstract = True
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance.loaded_values()
+        return instance
+    
+    def loaded_values(self):
+        """Stored column values held by the instance, without deferred or generated fields"""
+        return {
+            field.attname: field.value_from_object(self)
+            for field in self._meta.concrete_fields
+            if not field.generated and field.attname in self.__dict__
+        }
+    
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_values = self.loaded_values()
+    
+    def save(self, *args, using=None, **kwargs):
+        using = using or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, using=using, **kwargs)
+        # The next update's change event reports these as the values it replaced
+        self._loaded_values = self.loaded_values()
+
+class Claim(ChangeTrackedModel):
     """Main claim model"""
     STATUS_CHOICES = [
         ('Denied', 'Denied'),
@@ -19,6 +53,17 @@ class Claim(models.Model):
     discharge_date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    underpayment = models.GeneratedField(
+        expression=F('billed_amount') - F('paid_amount'),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        db_persist=True,
+    )
+    payment_ratio = models.GeneratedField(
+        # Cast first: SQLite stores whole decimals as integers and would divide as such
+        expression=Cast('paid_amount', models.FloatField()) / NullIf(Cast('billed_amount', models.FloatField()), Value(0.0)),
+        output_field=models.FloatField(),
+        db_persist=True,
+    )
     
     class Meta:
         ordering = ['-id']
@@ -28,6 +73,8 @@ class Claim(models.Model):
             models.Index(fields=['discharge_date']),
             models.Index(fields=['patient_name']),
             models.Index(fields=['billed_amount']),
+            models.Index(fields=['underpayment']),
+            models.Index(fields=['payment_ratio']),
         ]
         
     def __str__(self):
@@ -54,14 +101,14 @@ class ClaimDetail(models.Model):
     cpt_codes = models.TextField()
     
     def __str__(self):
-        return f"Details for Claim {self.claim.id}"
+        return f"Details for Claim {self.claim_id}"
     
     @property
     def cpt_codes_list(self):
         """Split CPT codes into a list"""
         return [code.strip() for code in self.cpt_codes.split(',') if code.strip()]
 
-class ClaimFlag(models.Model):
+class ClaimFlag(ChangeTrackedModel):
     """Flag system for claim review"""
     claim = models.ForeignKey(Claim, on_delete=models.CASCADE, related_name='claim_flags')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -71,11 +118,26 @@ class ClaimFlag(models.Model):
     class Meta:
         unique_together = ['claim', 'user']
         ordering = ['-flagged_at']
+        indexes = [
+            models.Index(fields=['user', 'flagged_at']),
+            models.Index(fields=['flagged_at']),
+        ]
+    
+    def __str__(self):
+        return f"Flag on Claim {self.claim_id} by {self.user.username}"
+
+class ReviewerFlagCount(models.Model):
+    """Open flag count per reviewer, kept current by signals so the work queue never counts"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='flag_count')
+    open_flags = models.IntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-open_flags']
     
     def __str__(self):
-        return f"Flag on Claim {self.claim.id} by {self.user.username}"
+        return f"{self.user.username}: {self.open_flags} open flags"
 
-class ClaimNote(models.Model):
+class ClaimNote(ChangeTrackedModel):
     """Annotation system for claims"""
     NOTE_TYPES = [
         ('User Note', 'User Note'),
@@ -93,4 +155,211 @@ class ClaimNote(models.Model):
         ordering = ['-created_at']
     
     def __str__(self):
-        return f"{self.note_type} on Claim {self.claim.id} by {self.user.username}"
+        return f"{self.note_type} on Claim {self.claim_id} by {self.user.username}"
+
+class ArchivedClaim(models.Model):
+    """Cold-storage copy of a claim discharged before the archive horizon"""
+    # Column order mirrors Claim so hot and archived querysets can be unioned
+    id = models.IntegerField(primary_key=True)
+    patient_name = models.CharField(max_length=200)
+    billed_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    paid_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    status = models.CharField(max_length=20, choices=Claim.STATUS_CHOICES)
+    insurer_name = models.CharField(max_length=200)
+    discharge_date = models.DateField()
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+    related_data = models.JSONField(default=dict)
+    underpayment = models.GeneratedField(
+        expression=F('billed_amount') - F('paid_amount'),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        db_persist=True,
+    )
+    payment_ratio = models.GeneratedField(
+        # Cast first: SQLite stores whole decimals as integers and would divide as such
+        expression=Cast('paid_amount', models.FloatField()) / NullIf(Cast('billed_amount', models.FloatField()), Value(0.0)),
+        output_field=models.FloatField(),
+        db_persist=True,
+    )
+    
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['discharge_date']),
+            models.Index(fields=['status']),
+            models.Index(fields=['insurer_name']),
+        ]
+    
+    def __str__(self):
+        return f"Archived Claim {self.id} - {self.patient_name}"
+
+class QueryPattern(models.Model):
+    """Normalized filter/sort combination observed on the claims list"""
+    signature = models.CharField(max_length=40, unique=True)
+    shape = models.JSONField(default=dict)
+    example_filters = models.JSONField(default=dict)
+    value_counts = models.JSONField(default=dict)
+    hits = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    last_seen = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['-total_ms']
+    
+    def __str__(self):
+        return f"Query pattern {self.signature[:8]} ({self.hits} hits)"
+    
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.hits if self.hits else 0
+
+class Job(models.Model):
+    """Background job stored in the app database and run by run_workers"""
+    STATUS_CHOICES = [
+        ('Queued', 'Queued'),
+        ('Running', 'Running'),
+        ('Succeeded', 'Succeeded'),
+        ('Failed', 'Failed'),
+        ('Cancelled', 'Cancelled'),
+    ]
+    FINISHED_STATUSES = ['Succeeded', 'Failed', 'Cancelled']
+    
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Queued')
+    progress = models.PositiveSmallIntegerField(default=0)
+    progress_message = models.CharField(max_length=200, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    cancel_requested = models.BooleanField(default=False)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+    
+    def __str__(self):
+        return f"Job {self.id} ({self.kind}) - {self.status}"
+    
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
+
+class ImportCheckpoint(models.Model):
+    """Last committed position of a CSV import, so load_claims_data --resume can continue"""
+    KIND_CHOICES = [
+        ('claims', 'Claims'),
+        ('details', 'Claim details'),
+    ]
+    
+    path = models.CharField(max_length=500, unique=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    offset = models.BigIntegerField(default=0)
+    line = models.BigIntegerField(default=1)
+    rows_loaded = models.PositiveIntegerField(default=0)
+    rows_skipped = models.PositiveIntegerField(default=0)
+    rows_quarantined = models.PositiveIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    started_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Import of {self.path} at byte {self.offset}"
+
+class ChangeEvent(models.Model):
+    """Append-only outbox row for a claim, archived claim, flag or note write; the id is the consumers' sequence number"""
+    INSERT = 'insert'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    OPERATION_CHOICES = [
+        (INSERT, 'Insert'),
+        (UPDATE, 'Update'),
+        (DELETE, 'Delete'),
+    ]
+    
+    id = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    claim_id = models.IntegerField()
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    # The row after an insert or update, or as it was before a delete
+    data = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    # The row before an update, when the updated instance had been read from the database
+    previous = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # Newest change per claim: the detail modal's freshness stamp
+            models.Index(fields=['claim_id', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"Change {self.id}: {self.operation} {self.model} {self.object_id}"
+
+class ChangeCheckpoint(models.Model):
+    """How far a named consumer has read the change outbox of one database"""
+    consumer = models.CharField(max_length=100)
+    database = models.CharField(max_length=100, default='default')
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['consumer', 'database']
+    
+    def __str__(self):
+        return f"{self.consumer} at change {self.position} on {self.database}"
+
+class InsurerMonthStats(models.Model):
+    """One insurer's claims discharged in one month, as totals plus quantile sketches that merge across months"""
+    insurer_name = models.CharField(max_length=255)
+    month = models.DateField()
+    claim_count = models.IntegerField(default=0)
+    denied_count = models.IntegerField(default=0)
+    billed_total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    paid_total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    # QuantileSketch.to_dict() of paid / billed and of billed amounts
+    payment_ratios = models.JSONField(default=dict)
+    billed_amounts = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['insurer_name', 'month']
+        indexes = [
+            models.Index(fields=['month']),
+        ]
+    
+    def __str__(self):
+        return f"{self.insurer_name} {self.month:%Y-%m}: {self.claim_count} claims"
+
+class SavedView(models.Model):
+    """A reviewer's named claims list filter, with the matching claim IDs kept in list order"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='saved_views')
+    name = models.CharField(max_length=100)
+    # Claims list query parameters: filters plus sort and direction
+    params = models.JSONField(default=dict)
+    # [sort value, claim id] pairs in the view's order, kept current from the change outbox
+    entries = models.JSONField(default=list)
+    # Claims that entered the view since its owner last opened it
+    new_claim_ids = models.JSONField(default=list)
+    last_opened_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        unique_together = ['user', 'name']
+        ordering = ['name']
+    
+    def __str__(self):
+        return f"{self.name} ({self.user.username})"
@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+from .models import ChangeCheckpoint, ChangeEvent
+from .sharding import shard_aliases
+
+
+# Archived claims' copies of their details, flags and notes, which have events of their own
+SNAPSHOT_EXCLUDED = {'related_data'}
+
+
+def snapshot(instance):
+    """Stored column values of a claim, archived claim, flag or note (generated columns are left out)"""
+    return {
+        field.attname: field.value_from_object(instance)
+        for field in instance._meta.concrete_fields
+        if not field.generated and field.attname not in SNAPSHOT_EXCLUDED
+    }
+
+
+def _event(instance, operation):
+    return ChangeEvent(
+        model=instance._meta.model_name,
+        object_id=instance.pk,
+        claim_id=instance.pk if instance._meta.model_name in ('claim', 'archivedclaim') else instance.claim_id,
+        operation=operation,
+        data=snapshot(instance),
+        previous=getattr(instance, '_loaded_values', None) if operation == ChangeEvent.UPDATE else None,
+    )
+
+
+def record_change(instance, operation, using):
+    """Append one write to the outbox of the database it happened in"""
+    _event(instance, operation).save(using=using)
+
+
+def record_changes(instances, operation, using):
+    """Append a bulk write to the outbox; call inside the transaction that made it"""
+    ChangeEvent.objects.using(using).bulk_create([_event(instance, operation) for instance in instances], batch_size=1000)
+
+
+def committed_changes(after, using=DEFAULT_DB_ALIAS, limit=1000):
+    """Events after sequence number ``after``, in order, stopping at a gap that may still fill
+
+    Ids are handed out when a row is inserted, not when its transaction commits, so a
+    missing id can belong to a transaction still in flight. Reading stops before such a
+    gap until the event after it is CLAIMS_OUTBOX_SETTLE_SECONDS old; by then the gap
+    is taken to be a rollback.
+    """
+    events = list(ChangeEvent.objects.using(using).filter(id__gt=after).order_by('id')[:limit])
+    settled = timezone.now() - timedelta(seconds=settings.CLAIMS_OUTBOX_SETTLE_SECONDS)
+    expected = after + 1 if after else None
+    for index, event in enumerate(events):
+        if expected is not None and event.id != expected and event.created_at > settled:
+            return events[:index]
+        expected = event.id + 1
+    return events
+
+
+def consume_changes(consumer, handler, batch_size=1000):
+    """Feed handler(events) every change after the consumer's checkpoints, in order
+
+    Each batch is handled in one transaction with the checkpoint update, so derived
+    data kept in the default database advances exactly once per change. Returns the
+    number of events handled.
+    """
+    handled = 0
+    for alias in shard_aliases():
+        ChangeCheckpoint.objects.get_or_create(consumer=consumer, database=alias)
+        while True:
+            with transaction.atomic():
+                # Locks the checkpoint so two processes don't consume the same batch
+                checkpoint = ChangeCheckpoint.objects.select_for_update().get(consumer=consumer, database=alias)
+                events = committed_changes(checkpoint.position, alias, batch_size)
+                if not events:
+                    break
+                handler(events)
+                checkpoint.position = events[-1].id
+                checkpoint.save(update_fields=['position', 'updated_at'])
+            handled += len(events)
+            if len(events) < batch_size:
+                break
+    return handled
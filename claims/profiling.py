@@ -0,0 +1,144 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_PARAM = '_profile'
+RATE_LIMIT_KEY = 'claims:profile:last'
+MAX_EXPLAINED_QUERIES = 50
+
+
+class QueryRecorder:
+    """Database execute wrapper that keeps every statement with its timing"""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': self.alias,
+                'sql': sql,
+                'params': params,
+                'many': many,
+                'ms': (time.perf_counter() - started) * 1000,
+            })
+
+
+def _explain(query):
+    if query['many'] or not query['sql'].lstrip().upper().startswith('SELECT'):
+        return ''
+    connection = connections[query['alias']]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {query['sql']}", query['params'])
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+    except DatabaseError as e:
+        return f'EXPLAIN failed: {e}'
+
+
+def profile_dir():
+    return settings.CLAIMS_PROFILE_DIR
+
+
+def list_reports():
+    """Saved profile reports, newest first"""
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        (name[:-5] for name in os.listdir(directory) if name.endswith('.html')),
+        reverse=True,
+    )
+
+
+def report_path(report_id, extension='html'):
+    """Path of a saved report; report ids are generated, never user paths"""
+    return os.path.join(profile_dir(), f'{os.path.basename(report_id)}.{extension}')
+
+
+class RequestProfilerMiddleware:
+    """Profile one request (Python calls and SQL) for staff who ask for it"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _should_profile(self, request):
+        user = getattr(request, 'user', None)
+        if not (user and user.is_staff):
+            return False
+        if not (request.headers.get(PROFILE_HEADER) or request.GET.get(PROFILE_PARAM)):
+            return False
+        # cache.add only succeeds once per interval, so at most one profile runs per window
+        return cache.add(RATE_LIMIT_KEY, time.time(), settings.CLAIMS_PROFILE_MIN_INTERVAL)
+
+    def __call__(self, request):
+        if not self._should_profile(request):
+            return self.get_response(request)
+
+        recorders = [QueryRecorder(connection.alias) for connection in connections.all()]
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection, recorder in zip(connections.all(), recorders):
+                stack.enter_context(connection.execute_wrapper(recorder))
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+                if response.streaming and not response.is_async:
+                    # Render streamed pages now so the profile includes their deferred work
+                    response.streaming_content = [b''.join(response.streaming_content)]
+            finally:
+                profiler.disable()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        try:
+            report_id = self._save_report(request, response, profiler, recorders, elapsed_ms)
+            response['X-Profile-Report'] = report_id
+        except OSError as e:
+            logger.error(f"Could not save profile report: {e}")
+        return response
+
+    def _save_report(self, request, response, profiler, recorders, elapsed_ms):
+        os.makedirs(profile_dir(), exist_ok=True)
+        report_id = f"{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+        profiler.dump_stats(report_path(report_id, 'prof'))
+
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(60)
+
+        queries = [query for recorder in recorders for query in recorder.queries]
+        for position, query in enumerate(queries):
+            query['explain'] = _explain(query) if position < MAX_EXPLAINED_QUERIES else ''
+
+        html = render_to_string('claims/profile_report.html', {
+            'report_id': report_id,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'user': request.user,
+            'status_code': response.status_code,
+            'elapsed_ms': elapsed_ms,
+            'sql_ms': sum(query['ms'] for query in queries),
+            'queries': queries,
+            'python_profile': stream.getvalue(),
+        })
+        with open(report_path(report_id), 'w') as f:
+            f.write(html)
+        return report_id
@@ -0,0 +1,84 @@
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import Claim
+from .sharding import scatter, sum_results
+from .singleflight import single_flight
+
+CACHE_KEY = 'claims:quick-stats'
+REFRESH_LOCK_KEY = 'claims:quick-stats:refreshing'
+
+PROCESSED_STATUSES = ['Paid', 'Denied']
+PENDING_STATUSES = ['Under Review']
+
+
+def compute_quick_stats():
+    """Today's (against yesterday's), processed and pending claim counts plus this month's billed value, in one query per shard"""
+    now = timezone.localtime()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    yesterday = today - timedelta(days=1)
+    month = today.replace(day=1)
+    totals = sum_results(scatter(lambda alias: Claim.objects.using(alias).aggregate(
+        todays_claims=Count('id', filter=Q(created_at__gte=today)),
+        yesterdays_claims=Count('id', filter=Q(created_at__gte=yesterday, created_at__lt=today)),
+        processed_claims=Count('id', filter=Q(status__in=PROCESSED_STATUSES)),
+        pending_claims=Count('id', filter=Q(status__in=PENDING_STATUSES)),
+        month_billed=Sum('billed_amount', filter=Q(created_at__gte=month)),
+    )))
+    yesterdays = totals['yesterdays_claims']
+    return {
+        'todays_claims': totals['todays_claims'],
+        'yesterdays_claims': yesterdays,
+        # Percent change from yesterday, None when there were no claims yesterday to compare with
+        'todays_change': round((totals['todays_claims'] - yesterdays) * 100 / yesterdays) if yesterdays else None,
+        'processed_claims': totals['processed_claims'],
+        'pending_claims': totals['pending_claims'],
+        # The widget shows thousands
+        'total_value': (totals['month_billed'] or Decimal('0')) / 1000,
+    }
+
+
+def refresh_quick_stats():
+    """Recompute the stats and store them with the time they were computed"""
+    stats = compute_quick_stats()
+    # Kept well past the TTL so pollers are served the last value while a refresh runs
+    cache.set(CACHE_KEY, (time.time(), stats), settings.CLAIMS_QUICK_STATS_TTL_SECONDS * 10)
+    return stats
+
+
+def _refresh_worker():
+    try:
+        refresh_quick_stats()
+    finally:
+        cache.delete(REFRESH_LOCK_KEY)
+        connections.close_all()
+
+
+def _refresh_in_background():
+    thread = threading.Thread(target=_refresh_worker, name='quick-stats-refresh', daemon=True)
+    thread.start()
+
+
+def get_quick_stats():
+    """Cached quick stats; once older than the TTL they are refreshed in the background
+
+    Only a cold cache makes the caller wait, and concurrent cold callers share one query.
+    """
+    cached = cache.get(CACHE_KEY)
+    if cached is None:
+        return single_flight(CACHE_KEY, refresh_quick_stats)
+
+    computed_at, stats = cached
+    if time.time() - computed_at >= settings.CLAIMS_QUICK_STATS_TTL_SECONDS:
+        # One refresh at a time across workers; everyone else keeps the stale value
+        if cache.add(REFRESH_LOCK_KEY, 1, timeout=settings.CLAIMS_SINGLE_FLIGHT_WAIT_SECONDS):
+            _refresh_in_background()
+    return stats
@@ -0,0 +1,139 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .archive import reaches_archive
+from .filters import apply_claim_filters, parse_claim_filters
+from .models import ChangeCheckpoint, ChangeEvent, Claim, SavedView
+from .outbox import consume_changes
+from .sharding import fetch_claims, ordering_key, scatter, shard_aliases, with_tiebreak
+
+CONSUMER = 'saved-views'
+# Claims list query parameters a saved view keeps; paging is not part of a view
+FILTER_PARAMS = [
+    'search', 'status', 'insurer', 'min_amount', 'max_amount', 'min_underpayment', 'max_underpayment',
+    'date_from', 'date_to', 'sort', 'direction',
+]
+
+
+def view_params(query):
+    """The non-empty filter and sort parameters of a claims list query"""
+    return {key: query.get(key) for key in FILTER_PARAMS if query.get(key)}
+
+
+def view_filters(view):
+    """The parsed filters the view was saved with"""
+    return parse_claim_filters(view.params)[0]
+
+
+def is_materialized(filters):
+    """Views reaching the archive are not kept as ID lists; they open as a normal list query"""
+    return not reaches_archive(filters)
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _sort_field(filters):
+    return filters['ordering'].lstrip('-')
+
+
+def _sort_entries(entries, filters):
+    """Sort [value, id] pairs the way the claims list orders the view"""
+    field = _sort_field(filters)
+    key = ordering_key(with_tiebreak([filters['ordering']]), connections['default'].features.nulls_order_largest)
+    return sorted(entries, key=lambda entry: key({field: entry[0], 'id': entry[1]}))
+
+
+def _matching_entries(filters, alias, claim_ids=None):
+    """[value, id] pairs of the claims on one database matching the filters, optionally among claim_ids"""
+    claims = Claim.objects.using(alias)
+    if claim_ids is not None:
+        claims = claims.filter(id__in=claim_ids)
+    return [
+        [_json_value(value), claim_id]
+        for value, claim_id in apply_claim_filters(claims, filters).values_list(_sort_field(filters), 'id')
+    ]
+
+
+def _start_consumer():
+    """Begin following the outbox at its current end; views are materialized from the claims themselves"""
+    for alias in shard_aliases():
+        last = ChangeEvent.objects.using(alias).aggregate(last=Max('id'))['last'] or 0
+        ChangeCheckpoint.objects.get_or_create(consumer=CONSUMER, database=alias, defaults={'position': last})
+
+
+def materialize(view):
+    """Recompute the view's ordered claim IDs from every shard"""
+    filters = view_filters(view)
+    entries = []
+    if is_materialized(filters):
+        for shard_entries in scatter(lambda alias: _matching_entries(filters, alias)):
+            entries.extend(shard_entries)
+    view.entries = _sort_entries(entries, filters)
+    view.new_claim_ids = []
+    view.save(update_fields=['entries', 'new_claim_ids'])
+
+
+def create_saved_view(user, name, query):
+    """Create or replace the user's view called name with the filters in query, materialized now"""
+    _start_consumer()
+    with transaction.atomic():
+        view, _ = SavedView.objects.update_or_create(user=user, name=name, defaults={'params': view_params(query)})
+        materialize(view)
+    return view
+
+
+def apply_changes(events):
+    """consume_changes handler re-checking every view against the claims the events touched
+
+    Membership is read from the claims as they are now, so replaying an event is harmless.
+    """
+    changed = {event.claim_id for event in events if event.model == 'claim'}
+    if not changed:
+        return
+    alias = events[0]._state.db
+    for view in SavedView.objects.select_for_update():
+        filters = view_filters(view)
+        if not is_materialized(filters):
+            continue
+        matching = _matching_entries(filters, alias, changed)
+        kept = [entry for entry in view.entries if entry[1] not in changed]
+        if not matching and len(kept) == len(view.entries):
+            continue
+        present = {entry[1] for entry in view.entries}
+        matching_ids = {entry[1] for entry in matching}
+        view.new_claim_ids = [
+            claim_id for claim_id in view.new_claim_ids if claim_id not in changed or claim_id in matching_ids
+        ] + [claim_id for claim_id in sorted(matching_ids) if claim_id not in present]
+        view.entries = _sort_entries(kept + matching, filters)
+        view.save(update_fields=['entries', 'new_claim_ids'])
+
+
+def refresh_saved_views():
+    """Apply claim changes since the last refresh to every saved view; returns events read"""
+    _start_consumer()
+    return consume_changes(CONSUMER, apply_changes)
+
+
+def mark_opened(view):
+    """Record that the owner opened the view; returns the IDs that were new to them"""
+    new_claim_ids = view.new_claim_ids
+    view.new_claim_ids = []
+    view.last_opened_at = timezone.now()
+    view.save(update_fields=['new_claim_ids', 'last_opened_at'])
+    return new_claim_ids
+
+
+def page_claims(view, offset, limit):
+    """One page of the view's claims, fetched by primary key from whichever shards hold them"""
+    # A claim deleted since the last refresh is simply skipped
+    return fetch_claims(entry[1] for entry in view.entries[offset:offset + limit])
@@ -0,0 +1,216 @@
+import logging
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max
+
+from .models import ArchivedClaim, ChangeCheckpoint, ChangeEvent, Claim, InsurerMonthStats
+from .outbox import consume_changes
+from .sharding import shard_aliases
+from .sketches import QuantileSketch
+
+logger = logging.getLogger(__name__)
+
+CONSUMER = 'insurer-scorecards'
+RELATIVE_ACCURACY = 0.01
+DENIED_STATUSES = ['Denied']
+BILLED_QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+# Claims, hot or archived, that scorecards are built from
+SCORED_MODELS = {'claim', 'archivedclaim'}
+# Claim columns a scorecard depends on; updates touching none of them are skipped
+STAT_FIELDS = ['insurer_name', 'discharge_date', 'status', 'billed_amount', 'paid_amount']
+
+
+def _contribution(values):
+    """((insurer, month), status, billed, paid) for claim values from a query or a change event"""
+    discharge_date = values['discharge_date']
+    if isinstance(discharge_date, str):
+        discharge_date = date.fromisoformat(discharge_date)
+    return (
+        (values['insurer_name'], discharge_date.replace(day=1)),
+        values['status'],
+        Decimal(str(values['billed_amount'])),
+        Decimal(str(values['paid_amount'])),
+    )
+
+
+class _Cell:
+    """Signed change to one insurer-month: totals plus sketches that can hold negative counts"""
+
+    def __init__(self):
+        self.claim_count = 0
+        self.denied_count = 0
+        self.billed_total = Decimal('0')
+        self.paid_total = Decimal('0')
+        self.payment_ratios = QuantileSketch(RELATIVE_ACCURACY)
+        self.billed_amounts = QuantileSketch(RELATIVE_ACCURACY)
+
+    def add(self, status, billed, paid, sign=1):
+        self.claim_count += sign
+        if status in DENIED_STATUSES:
+            self.denied_count += sign
+        self.billed_total += sign * billed
+        self.paid_total += sign * paid
+        if billed > 0:
+            self.payment_ratios.add(paid / billed, sign)
+        self.billed_amounts.add(billed, sign)
+
+    def apply_to(self, stats):
+        stats.claim_count += self.claim_count
+        stats.denied_count += self.denied_count
+        stats.billed_total += self.billed_total
+        stats.paid_total += self.paid_total
+        stats.payment_ratios = QuantileSketch.from_dict(stats.payment_ratios, RELATIVE_ACCURACY).merge(self.payment_ratios).to_dict()
+        stats.billed_amounts = QuantileSketch.from_dict(stats.billed_amounts, RELATIVE_ACCURACY).merge(self.billed_amounts).to_dict()
+
+
+def _count(cells, values, sign):
+    key, status, billed, paid = _contribution(values)
+    cells[key].add(status, billed, paid, sign)
+
+
+def apply_claim_changes(events):
+    """consume_changes handler folding claim inserts, updates and deletes into the monthly stats
+
+    Archived claims still count: archiving a claim deletes it and inserts its
+    archived copy, which cancel out here, and restoring it does the reverse.
+    """
+    cells = defaultdict(_Cell)
+    for event in events:
+        if event.model not in SCORED_MODELS:
+            continue
+        if event.operation == ChangeEvent.INSERT:
+            _count(cells, event.data, 1)
+        elif event.operation == ChangeEvent.DELETE:
+            _count(cells, event.data, -1)
+        elif event.previous is None or not all(field in event.previous for field in STAT_FIELDS):
+            # Saved from an instance that was never read, so what it replaced is unknown
+            logger.warning(f'Claim {event.claim_id} was updated without its previous values; '
+                           f'run update_scorecards --rebuild to correct its scorecard')
+        elif any(str(event.previous[field]) != str(event.data[field]) for field in STAT_FIELDS):
+            _count(cells, event.previous, -1)
+            _count(cells, event.data, 1)
+    _save_cells(cells)
+
+
+def _save_cells(cells):
+    """Add pending cells into their stored rows, creating and dropping rows as needed"""
+    if not cells:
+        return
+    # Locks a superset of the cells (every pairing of their insurers and months) in one query
+    stored = {
+        (stats.insurer_name, stats.month): stats
+        for stats in InsurerMonthStats.objects.select_for_update().filter(
+            insurer_name__in={insurer_name for insurer_name, _ in cells},
+            month__in={month for _, month in cells},
+        )
+    }
+    created, updated, emptied = [], [], []
+    for (insurer_name, month), cell in cells.items():
+        stats = stored.get((insurer_name, month))
+        if stats is None:
+            stats = InsurerMonthStats(insurer_name=insurer_name, month=month)
+            created.append(stats)
+        else:
+            updated.append(stats)
+        cell.apply_to(stats)
+        if stats.claim_count <= 0 and stats.pk:
+            emptied.append(stats.pk)
+    InsurerMonthStats.objects.bulk_create([stats for stats in created if stats.claim_count > 0])
+    InsurerMonthStats.objects.bulk_update(
+        [stats for stats in updated if stats.claim_count > 0],
+        ['claim_count', 'denied_count', 'billed_total', 'paid_total', 'payment_ratios', 'billed_amounts'],
+    )
+    InsurerMonthStats.objects.filter(pk__in=emptied).delete()
+
+
+def scorecards_built():
+    """True once the stats have been built from the claims and follow the outbox"""
+    return ChangeCheckpoint.objects.filter(consumer=CONSUMER).exists()
+
+
+def update_scorecards():
+    """Fold claim changes made since the last run into the monthly stats; returns events read
+
+    The first run builds the stats from the claims, which also covers claims loaded
+    before the outbox existed.
+    """
+    if not scorecards_built():
+        rebuild_scorecards()
+    return consume_changes(CONSUMER, apply_claim_changes)
+
+
+def rebuild_scorecards():
+    """Recompute every insurer-month from the claims and archived claims, and skip the outbox to its end
+
+    For repairs, e.g. after updates without previous values; run it while claims are not being written.
+    """
+    with transaction.atomic():
+        positions = {
+            alias: ChangeEvent.objects.using(alias).aggregate(last=Max('id'))['last'] or 0
+            for alias in shard_aliases()
+        }
+        cells = defaultdict(_Cell)
+        for alias in shard_aliases():
+            for model in (Claim, ArchivedClaim):
+                for values in model.objects.using(alias).values(*STAT_FIELDS).iterator(chunk_size=2000):
+                    _count(cells, values, 1)
+        InsurerMonthStats.objects.all().delete()
+        rows = []
+        for (insurer_name, month), cell in cells.items():
+            stats = InsurerMonthStats(insurer_name=insurer_name, month=month)
+            cell.apply_to(stats)
+            rows.append(stats)
+        InsurerMonthStats.objects.bulk_create(rows, batch_size=500)
+        for alias, position in positions.items():
+            ChangeCheckpoint.objects.update_or_create(
+                consumer=CONSUMER, database=alias, defaults={'position': position}
+            )
+    return len(rows)
+
+
+def first_month(months_back, today):
+    """First day of the month months_back - 1 months before today's"""
+    index = today.year * 12 + today.month - months_back
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def merge_scorecards(since=None):
+    """Scorecard per insurer, busiest first, merged from its monthly stats from month ``since`` on"""
+    stats = InsurerMonthStats.objects.order_by('insurer_name', 'month')
+    if since:
+        stats = stats.filter(month__gte=since)
+    merged = {}
+    for row in stats.iterator():
+        card = merged.get(row.insurer_name)
+        if card is None:
+            card = merged[row.insurer_name] = _Cell()
+            card.months = 0
+        card.months += 1
+        card.claim_count += row.claim_count
+        card.denied_count += row.denied_count
+        card.billed_total += row.billed_total
+        card.paid_total += row.paid_total
+        card.payment_ratios.merge(QuantileSketch.from_dict(row.payment_ratios, RELATIVE_ACCURACY))
+        card.billed_amounts.merge(QuantileSketch.from_dict(row.billed_amounts, RELATIVE_ACCURACY))
+
+    scorecards = []
+    for insurer_name, card in merged.items():
+        scorecards.append({
+            'insurer_name': insurer_name,
+            'months': card.months,
+            'claim_count': card.claim_count,
+            'denied_count': card.denied_count,
+            'denial_rate': card.denied_count / card.claim_count if card.claim_count else 0,
+            'billed_total': card.billed_total,
+            'paid_total': card.paid_total,
+            'median_payment_ratio': card.payment_ratios.quantile(0.5),
+            'p90_payment_ratio': card.payment_ratios.quantile(0.9),
+            'billed_quantiles': [
+                (f'p{round(q * 100)}', card.billed_amounts.quantile(q)) for q in BILLED_QUANTILES
+            ],
+        })
+    scorecards.sort(key=lambda card: (-card['claim_count'], card['insurer_name']))
+    return scorecards
@@ -0,0 +1,318 @@
+import heapq
+import os
+import threading
+import zlib
+from bisect import bisect_right
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Claims and the rows that hang off them live together on the claim's shard;
+# everything else (users, jobs, checkpoints, counters) stays on default, except
+# change outbox events, which are written next to the rows they record
+SHARDED_MODELS = {'claim', 'claimdetail', 'claimflag', 'claimnote', 'archivedclaim'}
+
+
+def is_sharded():
+    return bool(settings.CLAIMS_SHARDS)
+
+
+def shard_aliases():
+    """Databases holding claims: the configured shards, or just default"""
+    return list(settings.CLAIMS_SHARDS) or [DEFAULT_DB_ALIAS]
+
+
+def insurer_shard(insurer_name, shard_count):
+    """Shard index for an insurer, stable across processes and restarts"""
+    return zlib.crc32(insurer_name.strip().lower().encode()) % shard_count
+
+
+def id_range_shard(claim_id, boundaries):
+    """Shard index for a claim ID, given the first ID of every shard after the first"""
+    return bisect_right(boundaries, claim_id)
+
+
+def shard_for(insurer_name, claim_id):
+    """Database alias a new claim belongs on"""
+    aliases = shard_aliases()
+    if len(aliases) == 1:
+        return aliases[0]
+    if settings.CLAIMS_SHARD_KEY == 'id':
+        if claim_id is None:
+            # Not numbered yet: the last shard's range is open-ended, so whatever ID its
+            # database hands out stays in range as long as it runs above the boundary
+            return aliases[-1]
+        return aliases[id_range_shard(claim_id, settings.CLAIMS_SHARD_ID_BOUNDARIES)]
+    return aliases[insurer_shard(insurer_name, len(aliases))]
+
+
+def shards_for_id(claim_id):
+    """Shards that may hold a claim: exactly one with ID-range keys, otherwise all"""
+    if is_sharded() and settings.CLAIMS_SHARD_KEY == 'id':
+        return [shard_for(None, claim_id)]
+    return shard_aliases()
+
+
+_pool = None
+_pool_pid = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+_pool_thread = threading.local()
+
+
+def _shard_pool():
+    global _pool, _pool_pid, _pool_size
+    with _pool_lock:
+        # Threads don't survive fork, so a pool inherited from the gunicorn master is replaced
+        if _pool is None or _pool_pid != os.getpid():
+            _pool_size = max(settings.CLAIMS_SHARD_THREADS, len(shard_aliases()))
+            _pool = ThreadPoolExecutor(max_workers=_pool_size, thread_name_prefix='shard')
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _on_shard(fn, alias):
+    # Pool threads keep their connections between calls, like a request thread with
+    # CONN_MAX_AGE; drop the ones that broke or outlived it before reusing them
+    for connection in connections.all(initialized_only=True):
+        connection.close_if_unusable_or_obsolete()
+    _pool_thread.active = True
+    try:
+        return fn(alias)
+    finally:
+        _pool_thread.active = False
+
+
+def scatter(fn, aliases=None):
+    """Call fn(alias) for every shard, in parallel when there are several, results in shard order
+
+    Calls run on a pool shared by the process, whose threads reuse their shard
+    connections (set CONN_MAX_AGE on the shard databases); a scatter from inside
+    fn runs its calls in turn rather than waiting on the pool it occupies.
+    """
+    aliases = aliases or shard_aliases()
+    if len(aliases) == 1 or getattr(_pool_thread, 'active', False):
+        return [fn(alias) for alias in aliases]
+    return list(_shard_pool().map(lambda alias: _on_shard(fn, alias), aliases))
+
+
+def _close_thread_connections(barrier):
+    # Every pool thread waits here, so each one runs exactly one of these
+    try:
+        barrier.wait()
+    finally:
+        connections.close_all()
+
+
+def shutdown_shard_pool():
+    """Close the pool threads' connections and stop them, e.g. in a master before it forks"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is None or _pool_pid != os.getpid():
+        return
+    barrier = threading.Barrier(_pool_size, timeout=30)
+    for _ in range(_pool_size):
+        pool.submit(_close_thread_connections, barrier)
+    pool.shutdown(wait=True)
+
+
+def find_claim(claim_id, model=None):
+    """The claim (or archived claim) with this ID from whichever shard holds it"""
+    from .models import Claim
+    model = model or Claim
+    for alias in shards_for_id(claim_id):
+        try:
+            return model.objects.using(alias).get(id=claim_id)
+        except model.DoesNotExist:
+            continue
+    raise model.DoesNotExist(f'{model.__name__} {claim_id} is on no shard')
+
+
+def locate_claims(claim_ids):
+    """{claim id: alias} for the claims among claim_ids that exist"""
+    from .models import Claim
+    claim_ids = list(claim_ids)
+    if not is_sharded() or settings.CLAIMS_SHARD_KEY != 'id':
+        candidates = {alias: claim_ids for alias in shard_aliases()}
+    else:
+        candidates = defaultdict(list)
+        for claim_id in claim_ids:
+            candidates[shard_for(None, claim_id)].append(claim_id)
+    located = {}
+    for alias, ids in candidates.items():
+        for claim_id in Claim.objects.using(alias).filter(id__in=ids).values_list('id', flat=True):
+            located[claim_id] = alias
+    return located
+
+
+def fetch_claims(claim_ids):
+    """Claims with these IDs in the given order, from whichever shards hold them; missing IDs are skipped"""
+    from .models import Claim
+    claim_ids = list(claim_ids)
+    found = {}
+    for claims in scatter(lambda alias: Claim.objects.using(alias).in_bulk(claim_ids)):
+        found.update(claims)
+    return [found[claim_id] for claim_id in claim_ids if claim_id in found]
+
+
+def group_by_shard(rows, alias_of):
+    """{alias: rows} for the rows, placed by alias_of(row)"""
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[alias_of(row)].append(row)
+    return grouped
+
+
+class _Descending:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def _field_value(row, field):
+    return row[field] if isinstance(row, dict) else getattr(row, field)
+
+
+def ordering_key(ordering, nulls_largest=False):
+    """Sort key matching a database ORDER BY such as ['-discharge_date', '-id']"""
+    fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    def key(row):
+        parts = []
+        for field, descending in fields:
+            value = _field_value(row, field)
+            # Place NULLs where the database does, without comparing None to values
+            part = (value is None, value) if nulls_largest else (value is not None, value)
+            parts.append(_Descending(part) if descending else part)
+        return parts
+
+    return key
+
+
+def with_tiebreak(ordering):
+    """Ordering plus the primary key, so every shard returns ties in the same order"""
+    ordering = list(ordering)
+    if not any(name.lstrip('-') in ('id', 'pk') for name in ordering):
+        ordering.append('-id' if ordering and ordering[0].startswith('-') else 'id')
+    return ordering
+
+
+def merge_ordered(results, ordering, limit=None, nulls_largest=False):
+    """Merge per-shard result lists, each already sorted by ordering, into one ordered list"""
+    merged = heapq.merge(*results, key=ordering_key(ordering, nulls_largest))
+    return list(islice(merged, limit))
+
+
+def gather_ordered(build, ordering, offset=0, limit=None):
+    """Rows offset..offset+limit of build(alias) ordered across every shard
+
+    Each shard returns its own first offset+limit rows, which is all the merged
+    window can contain; deep pages therefore cost more than shallow ones.
+    """
+    ordering = with_tiebreak(ordering)
+    end = offset + limit if limit is not None else None
+    results = scatter(lambda alias: list(build(alias).order_by(*ordering)[:end]))
+    nulls_largest = connections[shard_aliases()[0]].features.nulls_order_largest
+    return merge_ordered(results, ordering, end, nulls_largest)[offset:]
+
+
+def stream_ordered(build, ordering, chunk_size=2000):
+    """Every row of build(alias) across the shards in order, read in chunks rather than all at once
+
+    Runs on the calling thread with one open cursor per shard, for exports and
+    scans too large for gather_ordered's lists.
+    """
+    ordering = with_tiebreak(ordering)
+    streams = [build(alias).order_by(*ordering).iterator(chunk_size=chunk_size) for alias in shard_aliases()]
+    if len(streams) == 1:
+        return streams[0]
+    nulls_largest = connections[shard_aliases()[0]].features.nulls_order_largest
+    return heapq.merge(*streams, key=ordering_key(ordering, nulls_largest))
+
+
+def merge_distinct(results):
+    """Sorted distinct values from per-shard sorted value lists"""
+    return list(dict.fromkeys(heapq.merge(*results)))
+
+
+def combine_groups(results, key, sum_fields):
+    """Merge per-shard GROUP BY rows (dicts) that share a key, summing sum_fields"""
+    combined = {}
+    for rows in results:
+        for row in rows:
+            group = combined.get(row[key])
+            if group is None:
+                combined[row[key]] = dict(row)
+                continue
+            for field in sum_fields:
+                if row[field] is not None:
+                    group[field] = row[field] if group[field] is None else group[field] + row[field]
+    return list(combined.values())
+
+
+def sum_results(results):
+    """Add up per-shard aggregate dicts field by field, treating None as nothing"""
+    totals = {}
+    for row in results:
+        for field, value in row.items():
+            current = totals.get(field)
+            totals[field] = value if current is None else current if value is None else current + value
+    return totals
+
+
+def mirror_user(user, update_fields=None):
+    """Copy a saved user to every shard so flags and notes there can reference it"""
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    values = {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields if not field.primary_key
+    }
+    for alias in settings.CLAIMS_SHARDS:
+        type(user).objects.using(alias).update_or_create(pk=user.pk, defaults=values)
+
+
+def unmirror_user(user):
+    """Remove a deleted user, and with it their flags and notes, from every shard"""
+    for alias in settings.CLAIMS_SHARDS:
+        type(user).objects.using(alias).filter(pk=user.pk).delete()
+
+
+class ShardRouter:
+    """Place new claims, and the rows that hang off them, on their shard
+
+    Reads and writes of rows that are already loaded follow the row's own database
+    (Django's default), so only new objects need placing here. Queries with no row to
+    follow go to default; code that reads claims goes through scatter() instead.
+    """
+
+    def _is_sharded(self, model):
+        return model._meta.app_label == 'claims' and model._meta.model_name in SHARDED_MODELS
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if not self._is_sharded(model) or instance is None or instance._state.db:
+            return None
+        if model._meta.model_name in ('claim', 'archivedclaim'):
+            return shard_for(instance.insurer_name, instance.id)
+        claim = model._meta.get_field('claim').get_cached_value(instance, None)
+        if claim is not None and claim._state.db:
+            return claim._state.db
+        return locate_claims([instance.claim_id]).get(instance.claim_id)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self._is_sharded(obj1) and self._is_sharded(obj2):
+            return obj1._state.db == obj2._state.db
+        # Users are mirrored onto every shard
+        return True
@@ -0,0 +1,62 @@
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .counts import bump_data_version
+from .flag_queue import adjust_reviewer_count
+from .models import ArchivedClaim, ChangeEvent, Claim, ClaimFlag, ClaimNote
+from .outbox import record_change
+from .sharding import mirror_user, unmirror_user
+
+
+@receiver([post_save, post_delete], sender=Claim)
+@receiver([post_save, post_delete], sender=ArchivedClaim)
+@receiver([post_save, post_delete], sender=ClaimFlag)
+@receiver([post_save, post_delete], sender=ClaimNote)
+def claims_changed(sender, **kwargs):
+    """Invalidate cached counts when a claim, flag or note is written"""
+    bump_data_version()
+
+
+@receiver(post_save, sender=Claim)
+@receiver(post_save, sender=ClaimFlag)
+@receiver(post_save, sender=ClaimNote)
+def record_saved(sender, instance, created, using, **kwargs):
+    """Append the write to the change outbox, inside the transaction the save runs in"""
+    record_change(instance, ChangeEvent.INSERT if created else ChangeEvent.UPDATE, using)
+
+
+@receiver(post_delete, sender=Claim)
+@receiver(post_delete, sender=ClaimFlag)
+@receiver(post_delete, sender=ClaimNote)
+def record_deleted(sender, instance, using, **kwargs):
+    """Append the delete, with the row as it was, to the change outbox"""
+    record_change(instance, ChangeEvent.DELETE, using)
+
+
+@receiver(post_save, sender=ClaimFlag)
+def flag_created(sender, instance, created, using, **kwargs):
+    """Count a new flag against its reviewer"""
+    if created:
+        adjust_reviewer_count(instance.user_id, 1, using)
+
+
+@receiver(post_delete, sender=ClaimFlag)
+def flag_deleted(sender, instance, **kwargs):
+    """Remove a resolved or cascaded flag from its reviewer's count"""
+    adjust_reviewer_count(instance.user_id, -1)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, using, update_fields=None, **kwargs):
+    """Keep the copy of each user on every claims shard current"""
+    if using == DEFAULT_DB_ALIAS:
+        mirror_user(instance, update_fields)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, using, **kwargs):
+    """Drop a deleted user from every claims shard"""
+    if using == DEFAULT_DB_ALIAS:
+        unmirror_user(instance)
@@ -0,0 +1,96 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+POLL_SECONDS = 0.05
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+_calls = {}
+_calls_lock = threading.Lock()
+
+
+def _compute_shared(key, compute):
+    # Through the cache: the first caller takes a cache lock and publishes its result
+    # briefly; the rest poll for it, and compute themselves if the leader gives up or fails.
+    # This spans worker processes only when CACHE_URL gives them a shared cache; with the
+    # default per-process cache it adds nothing to the in-process coalescing below
+    result_key = f'claims:single-flight:result:{key}'
+    lock_key = f'claims:single-flight:lock:{key}'
+    shared = cache.get(result_key)
+    if shared is not None:
+        return shared[0]
+
+    wait_seconds = settings.CLAIMS_SINGLE_FLIGHT_WAIT_SECONDS
+    if cache.add(lock_key, 1, timeout=wait_seconds):
+        try:
+            result = compute()
+            cache.set(result_key, (result,), settings.CLAIMS_SINGLE_FLIGHT_SHARE_SECONDS)
+            return result
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + wait_seconds
+    while time.monotonic() < deadline:
+        time.sleep(POLL_SECONDS)
+        shared = cache.get(result_key)
+        if shared is not None:
+            return shared[0]
+        if cache.get(lock_key) is None:
+            break
+    return compute()
+
+
+def single_flight(key, compute):
+    """Run compute() once for concurrent callers with the same key and give them all its result
+
+    Callers are coalesced within this process, and across processes too when CACHE_URL
+    configures a shared cache. Keys must include everything the result depends on,
+    including the data version.
+    """
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        # Same process: wait on the thread already running it
+        if call.done.wait(settings.CLAIMS_SINGLE_FLIGHT_WAIT_SECONDS) and not call.failed:
+            return call.result
+        return compute()
+
+    try:
+        call.result = _compute_shared(key, compute)
+        return call.result
+    except Exception:
+        call.failed = True
+        raise
+    finally:
+        with _calls_lock:
+            _calls.pop(key, None)
+        call.done.set()
+
+
+def note_request_sequence(client_id, sequence):
+    """Record the newest request number a browser tab has sent, in this process's cache unless it is shared"""
+    key = f'claims:request-seq:{client_id}'
+    if sequence > cache.get(key, 0):
+        cache.set(key, sequence, 300)
+
+
+def is_superseded(client_id, sequence):
+    """True when the same tab has since sent a newer request, so this response would be discarded
+
+    Without a shared cache only newer requests handled by this process are seen; one that
+    another worker took is missed and the older response is simply rendered.
+    """
+    return cache.get(f'claims:request-seq:{client_id}', 0) > sequence
@@ -0,0 +1,88 @@
+import math
+
+
+class QuantileSketch:
+    """Log-bucketed histogram of non-negative values with relative-error quantiles
+
+    A value v is counted in bucket ceil(log(v) / log(gamma)), so every quantile it
+    reports is within ``relative_accuracy`` of a true sample value. Buckets are plain
+    counts: two sketches with the same accuracy merge exactly by adding them, and a
+    value is removed by counting it -1, which is what lets scorecards follow updates
+    and deletes.
+    """
+
+    # Values at or below this are counted as zero
+    MIN_VALUE = 1e-9
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.zero_count = 0
+        self.bins = {}
+
+    @property
+    def count(self):
+        return self.zero_count + sum(self.bins.values())
+
+    def _index(self, value):
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, index):
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value, count=1):
+        """Count a value; a negative count removes earlier additions"""
+        value = float(value)
+        if value <= self.MIN_VALUE:
+            self.zero_count += count
+            return
+        index = self._index(value)
+        remaining = self.bins.get(index, 0) + count
+        if remaining:
+            self.bins[index] = remaining
+        else:
+            del self.bins[index]
+
+    def merge(self, other):
+        """Add another sketch's counts into this one"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Only sketches with the same relative accuracy can be merged')
+        self.zero_count += other.zero_count
+        for index, count in other.bins.items():
+            remaining = self.bins.get(index, 0) + count
+            if remaining:
+                self.bins[index] = remaining
+            else:
+                self.bins.pop(index, None)
+        return self
+
+    def quantile(self, q):
+        """Estimated nearest-rank q-quantile (0 <= q <= 1), or None for an empty sketch"""
+        total = self.count
+        if total <= 0:
+            return None
+        rank = max(math.ceil(q * total) - 1, 0)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return self._value(index)
+        return self._value(max(self.bins))
+
+    def to_dict(self):
+        return {
+            'accuracy': self.relative_accuracy,
+            'zero': self.zero_count,
+            'bins': {str(index): count for index, count in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data, relative_accuracy=0.01):
+        """Sketch stored by to_dict(); an empty dict gives an empty sketch"""
+        sketch = cls(data.get('accuracy', relative_accuracy))
+        sketch.zero_count = data.get('zero', 0)
+        sketch.bins = {int(index): count for index, count in data.get('bins', {}).items()}
+        return sketch
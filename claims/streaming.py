@@ -0,0 +1,102 @@
+from contextlib import ExitStack
+
+from django.contrib.messages import get_messages
+from django.http import StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.template import Node, loader
+from django.template.context import make_context
+from django.template.loader_tags import BLOCK_CONTEXT_KEY, BlockContext, BlockNode, ExtendsNode
+
+CHUNK_CHARS = 16 * 1024
+
+
+class StreamFlushNode(Node):
+    """{% stream_flush %}: where a streamed page sends what it has before running deferred work"""
+
+    def render(self, context):
+        return ''
+
+
+def _template_chain(template, context):
+    """The template followed by each layout it extends, registering blocks as ExtendsNode.render does"""
+    chain = [template]
+    while True:
+        extends = next((node for node in chain[-1].nodelist if isinstance(node, ExtendsNode)), None)
+        if extends is None:
+            break
+        if BLOCK_CONTEXT_KEY not in context.render_context:
+            context.render_context[BLOCK_CONTEXT_KEY] = BlockContext()
+        context.render_context[BLOCK_CONTEXT_KEY].add_blocks(extends.blocks)
+        chain.append(extends.get_parent(context))
+    if len(chain) > 1:
+        layout = chain[-1]
+        context.render_context[BLOCK_CONTEXT_KEY].add_blocks(
+            {node.name: node for node in layout.nodelist.get_nodes_by_type(BlockNode)}
+        )
+    return chain
+
+
+def stream_template(request, template_name, context=None, deferred=None):
+    """Render a template as a StreamingHttpResponse, sending output in chunks as it renders
+
+    With ``deferred``, the layout up to its top-level {% stream_flush %} is sent first and
+    deferred() is only then called for the rest of the context, so the browser can fetch
+    CSS and draw the page chrome while the expensive queries run.
+    """
+    backend_template = loader.get_template(template_name)
+    template = backend_template.template
+    # Middleware process_response runs before the body is iterated, so everything that
+    # touches request state happens now: the CSRF cookie is requested, queued messages
+    # are marked used, and the session is loaded (and so marked accessed for Vary)
+    context = dict(context or {})
+    context['csrf_token'] = get_token(request)
+    messages = context['messages'] = list(get_messages(request))
+    user = getattr(request, 'user', None)
+    if user is not None:
+        user.is_authenticated
+
+    def run_deferred():
+        shown = len(messages)
+        values = deferred()
+        # Messages added by the deferred work are too late to be stored; show them on this page
+        messages.extend(list(get_messages(request))[shown:])
+        session = getattr(request, 'session', None)
+        if session is not None and session.modified and session.session_key:
+            session.save()
+        return values
+
+    context = make_context(context, request, autoescape=backend_template.backend.engine.autoescape)
+
+    def chunks():
+        buffer, size = [], 0
+        with ExitStack() as stack:
+            stack.enter_context(context.render_context.push_state(template))
+            stack.enter_context(context.bind_template(template))
+            context.template_name = template.name
+            chain = _template_chain(template, context)
+            for parent in chain[1:]:
+                stack.enter_context(context.render_context.push_state(parent, isolated_context=False))
+            nodes = chain[-1].nodelist
+
+            pending = deferred
+            if pending and not any(isinstance(node, StreamFlushNode) for node in nodes):
+                context.update(run_deferred())
+                pending = None
+            for node in nodes:
+                if isinstance(node, StreamFlushNode) and pending:
+                    if buffer:
+                        yield ''.join(buffer)
+                        buffer, size = [], 0
+                    context.update(run_deferred())
+                    pending = None
+                    continue
+                output = node.render_annotated(context)
+                buffer.append(output)
+                size += len(output)
+                if size >= CHUNK_CHARS:
+                    yield ''.join(buffer)
+                    buffer, size = [], 0
+        if buffer:
+            yield ''.join(buffer)
+
+    return StreamingHttpResponse(chunks(), content_type='text/html; charset=utf-8')
@@ -2,6 +2,7 @@ from django import template
 from django.utils.safestring import mark_safe
 from django.http import QueryDict
 import urllib.parse
+from claims.streaming import StreamFlushNode
 
 register = template.Library()
 
@@ -72,6 +73,20 @@ def pagination_info(page_obj, total_count):
     
     return f"Showing {start} to {end} of {total_count} items"
 
+@register.filter
+def approx_count(value, exact=True):
+    """Render a result count, abbreviating planner estimates as 'about 1.2M'"""
+    if exact in (True, None, ''):
+        return value
+    try:
+        value = int(value)
+    except (ValueError, TypeError):
+        return value
+    for threshold, suffix in ((1_000_000_000, 'B'), (1_000_000, 'M'), (1_000, 'K')):
+        if value >= threshold:
+            return f"about {value / threshold:.1f}{suffix}"
+    return f"about {value}"
+
 @register.filter
 def accessibility_label(status):
     """Generate accessibility-friendly labels for status"""
@@ -96,3 +111,8 @@ def format_currency(amount):
 def make_list(value):
     """Convert string to list of characters for iteration"""
     return list(value)
+
+@register.tag
+def stream_flush(parser, token):
+    """Where a streamed page flushes the layout before computing its content"""
+    return StreamFlushNode()
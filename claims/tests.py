@@ -1,10 +1,62 @@
-from django.test import TestCase, Client
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.utils import ConnectionRouter
+from django.db.models import Avg, Max, Q
+from django.template import engines
+from django.test.utils import CaptureQueriesContext
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase, Client, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from decimal import Decimal
-from datetime import date
-from claims.models import Claim, ClaimDetail, ClaimFlag, ClaimNote
+from datetime import date, datetime, timedelta
+from io import StringIO
+import gzip
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+from unittest import skipUnless
+from unittest.mock import patch
+from claims import bitmaps, compression
+from claims.archive import archive_claims, reaches_archive, restore_claims
+from claims.bitmaps import select_claims
+from claims.counts import ResultCount, count_claims, filter_signature
+from claims.detection import detect_anomalies, write_findings
+from claims.facets import prime_facets
+from claims.filters import apply_claim_filters, parse_claim_filters
+from claims.flag_queue import flag_queue_page, recount_reviewer_flags
+from claims.ingest import ingest_file
+from claims.jobs import JOB_HANDLERS, cancel, enqueue, job_handler, requeue_stale_jobs, run_next_job, worker_loop
+from claims.outbox import committed_changes, consume_changes, record_changes
+from claims.loadtest import Sample, TrafficMix, compare, percentile, run_load, summarize
+from claims.models import (
+    ArchivedClaim, ChangeCheckpoint, ChangeEvent, Claim, ClaimDetail, ClaimFlag, ClaimNote, ImportCheckpoint, InsurerMonthStats, Job, QueryPattern, ReviewerFlagCount, SavedView,
+)
+from claims.profiling import list_reports, report_path
+from claims.quick_stats import compute_quick_stats, get_quick_stats
+from claims.saved_views import refresh_saved_views
+from claims.scorecards import merge_scorecards, rebuild_scorecards, update_scorecards
+from claims.sharding import (
+    ShardRouter, combine_groups, id_range_shard, insurer_shard, merge_distinct, merge_ordered, scatter,
+    shutdown_shard_pool, with_tiebreak,
+)
+from claims.singleflight import note_request_sequence, single_flight
+from claims.sketches import QuantileSketch
+from claims.streaming import stream_template
+from claims.templatetags.claims_extras import approx_count
+from claims.warmup import compile_templates, import_times_by_package, parse_import_times
+from claims.workload import flush_query_patterns, propose_index, query_shape
 
 class ClaimTestCase(TestCase):
     
@@ -141,3 +193,1762 @@ class ClaimTestCase(TestCase):
         """Test with invalid claim IDs"""
         response = self.client.get(reverse('claim_detail', args=[999999]))
         self.assertEqual(response.status_code, 404)
+
+
+class ClaimArchiveTestCase(TestCase):
+    
+    def setUp(self):
+        """Set up an old claim with related rows"""
+        self.user = User.objects.create_user(username='archiver', password='testpass123')
+        self.claim = Claim.objects.create(
+            id=88888,
+            patient_name='Archived Patient',
+            billed_amount=Decimal('2000.00'),
+            paid_amount=Decimal('1500.00'),
+            status='Paid',
+            insurer_name='Old Insurance',
+            discharge_date=date(2000, 1, 15)
+        )
+        ClaimDetail.objects.create(claim=self.claim, cpt_codes='99213')
+        ClaimFlag.objects.create(claim=self.claim, user=self.user, reason='Old flag')
+        ClaimNote.objects.create(claim=self.claim, user=self.user, content='Old note')
+        self.moved = archive_claims(before=date(2000, 2, 1))
+
+    def test_archive_moves_claim_and_related_rows(self):
+        """Test archiving removes the claim from the hot tables"""
+        self.assertEqual(self.moved, 1)
+        self.assertFalse(Claim.objects.filter(id=88888).exists())
+        archived = ArchivedClaim.objects.get(id=88888)
+        self.assertEqual(len(archived.related_data['flags']), 1)
+        self.assertEqual(archived.related_data['notes'][0]['content'], 'Old note')
+
+    def test_default_list_excludes_archive(self):
+        """Test default list queries only the hot set"""
+        response = self.client.get(reverse('claims_list'), {'search': 'Archived Patient'})
+        self.assertNotContains(response, 'claim-88888-id')
+
+    def test_date_filter_past_horizon_includes_archive(self):
+        """Test explicit old date filters transparently include the archive"""
+        response = self.client.get(reverse('claims_list'), {
+            'date_from': '1999-12-01', 'date_to': '2000-12-31'
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Archived Patient')
+
+    def test_archived_claim_detail(self):
+        """Test archived claims still render read-only details"""
+        response = self.client.get(reverse('claim_detail', args=[88888]), HTTP_HX_REQUEST='true')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Old flag')
+
+    def test_restore_claims(self):
+        """Test restoring moves the claim and related rows back"""
+        self.assertEqual(restore_claims(), 1)
+        claim = Claim.objects.get(id=88888)
+        self.assertEqual(claim.details.get().cpt_codes, '99213')
+        self.assertTrue(claim.is_flagged)
+        self.assertEqual(claim.claim_notes.count(), 1)
+        self.assertFalse(ArchivedClaim.objects.exists())
+
+    def test_restore_keeps_timestamps(self):
+        """Test a claim's created and updated times survive an archive and restore round trip"""
+        restore_claims()
+        stamp = timezone.make_aware(datetime(2001, 1, 1, 9, 30))
+        Claim.objects.filter(id=88888).update(created_at=stamp, updated_at=stamp)
+        archive_claims(before=date(2000, 2, 1))
+        start = ChangeEvent.objects.aggregate(last=Max('id'))['last']
+        restore_claims()
+        claim = Claim.objects.get(id=88888)
+        self.assertEqual((claim.created_at, claim.updated_at), (stamp, stamp))
+        event = ChangeEvent.objects.get(id__gt=start, model='claim', operation='insert')
+        self.assertEqual(parse_datetime(event.data['created_at']), stamp)
+
+    def test_open_ended_date_filter_includes_archive(self):
+        """Test a range with only an end date has no lower bound, so it reaches the archive"""
+        self.assertTrue(reaches_archive({'date_from': None, 'date_to': timezone.localdate()}))
+        self.assertFalse(reaches_archive({'date_from': timezone.localdate(), 'date_to': None}))
+        self.assertFalse(reaches_archive({'date_from': None, 'date_to': None}))
+        response = self.client.get(reverse('claims_list'), {
+            'search': 'Archived Patient', 'date_to': timezone.localdate().isoformat()
+        })
+        self.assertContains(response, 'Archived Patient')
+
+
+class ResultCountTestCase(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.filters, _ = parse_claim_filters({'status': 'Paid'})
+        self.queryset = apply_claim_filters(Claim.objects.all(), self.filters)
+
+    def test_small_results_are_exact(self):
+        """Test counts without a planner estimate fall back to COUNT(*)"""
+        result = count_claims(self.queryset, filter_signature(self.filters))
+        self.assertTrue(result.exact)
+        self.assertEqual(result.value, self.queryset.count())
+
+    def test_counts_are_cached_until_data_changes(self):
+        """Test cached counts are reused per signature and dropped on writes"""
+        signature = filter_signature(self.filters)
+        first = count_claims(self.queryset, signature)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(count_claims(self.queryset, signature), first)
+        self.assertFalse([query for query in queries if 'claims_claim' in query['sql']])
+        Claim.objects.create(
+            id=77777, patient_name='Count Patient', billed_amount=Decimal('10.00'),
+            paid_amount=Decimal('10.00'), status='Paid', insurer_name='Count Insurance',
+            discharge_date=date.today()
+        )
+        self.assertEqual(count_claims(self.queryset, signature).value, first.value + 1)
+
+    @override_settings(CLAIMS_DATA_VERSION_CHECK_SECONDS=0)
+    def test_writes_from_another_process_invalidate_counts(self):
+        """Test a count cached here is dropped when another process writes, though its cache is not shared"""
+        signature = filter_signature(self.filters)
+        first = count_claims(self.queryset, signature)
+        # What another worker's import leaves behind: the rows and their outbox events, no local signals
+        claims = Claim.objects.bulk_create([Claim(
+            id=77778, patient_name='Other Worker', billed_amount=Decimal('10.00'),
+            paid_amount=Decimal('10.00'), status='Paid', insurer_name='Count Insurance',
+            discharge_date=date.today()
+        )])
+        record_changes(claims, ChangeEvent.INSERT, 'default')
+        self.assertEqual(count_claims(self.queryset, signature).value, first.value + 1)
+
+    def test_signature_ignores_ordering(self):
+        """Test sort order does not split the count cache"""
+        by_amount, _ = parse_claim_filters({'status': 'Paid', 'sort': 'amount'})
+        self.assertEqual(filter_signature(by_amount), filter_signature(self.filters))
+
+    @override_settings(CLAIMS_EXACT_COUNT_THRESHOLD=100)
+    def test_large_results_use_estimate(self):
+        """Test planner estimates replace exact counts above the threshold"""
+        with patch('claims.counts.estimate_count', return_value=1_234_567):
+            result = count_claims(self.queryset, filter_signature(self.filters))
+        self.assertEqual(result, ResultCount(1_234_567, exact=False))
+        self.assertEqual(approx_count(result.value, result.exact), 'about 1.2M')
+
+    def _seed_estimated_claims(self):
+        Claim.objects.bulk_create([Claim(
+            id=77800 + i, patient_name=f'Estimate Patient {i}', billed_amount=Decimal('10.00'),
+            paid_amount=Decimal('10.00'), status='Paid', insurer_name='Estimate Insurance',
+            discharge_date=date(2024, 1, 1)
+        ) for i in range(25)])
+
+    def _estimated_pages(self, page, estimate=1000):
+        with patch('claims.views.count_across_shards', return_value=ResultCount(estimate, exact=False)):
+            return self.client.get(reverse('claims_list'), {'search': 'Estimate Patient', 'per_page': '10', 'page': page})
+
+    def test_short_page_clamps_an_estimate(self):
+        """Test the page where the rows run out sets the real count and ends the pager"""
+        self._seed_estimated_claims()
+        response = self._estimated_pages(2)
+        self.assertEqual(len(response.context['claims'].object_list), 10)
+        self.assertEqual(response.context['total_claims'], 1000)
+
+        response = self._estimated_pages(3)
+        self.assertEqual(len(response.context['claims'].object_list), 5)
+        self.assertEqual(response.context['total_claims'], 25)
+        self.assertTrue(response.context['total_claims_exact'])
+        self.assertFalse(response.context['claims'].has_next())
+
+    def test_page_past_the_real_end_shows_the_last_page(self):
+        """Test an estimate too high to have a page there falls back to the last real page"""
+        self._seed_estimated_claims()
+        response = self._estimated_pages(50)
+        claims = response.context['claims']
+        self.assertEqual(claims.number, 3)
+        self.assertEqual(len(claims.object_list), 5)
+        self.assertEqual(response.context['total_claims'], 25)
+        self.assertEqual(response.context['page_range'], [1, 2, 3])
+
+    def test_estimated_pager_hides_the_last_page(self):
+        """Test an estimated count offers only nearby pages, since its last page may not exist"""
+        self._seed_estimated_claims()
+        response = self._estimated_pages(2)
+        self.assertEqual(response.context['page_range'], [1, 2, 3, 4, '...'])
+        self.assertNotContains(response, 'aria-label="Go to last page"')
+
+
+@override_settings(CLAIMS_WORKLOAD_SAMPLE_RATE=1.0)
+class IndexAdvisorTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_list_requests_record_query_patterns(self):
+        """Test the claims list buffers normalized filter/sort shapes until they are flushed"""
+        self.client.get(reverse('claims_list'), {'status': 'Paid', 'sort': 'date'})
+        self.client.get(reverse('claims_list'), {'status': 'Denied', 'sort': 'date'})
+        self.assertFalse(QueryPattern.objects.exists())
+        self.assertEqual(flush_query_patterns(), 1)
+        pattern = QueryPattern.objects.get()
+        self.assertEqual(pattern.hits, 2)
+        self.assertEqual(pattern.shape, {'filters': [['status', 'eq']], 'ordering': '-discharge_date'})
+        self.assertEqual(pattern.value_counts['status'], {'Paid': 1, 'Denied': 1})
+
+        self.client.get(reverse('claims_list'), {'status': 'Paid', 'sort': 'date'})
+        flush_query_patterns()
+        pattern.refresh_from_db()
+        self.assertEqual(pattern.hits, 3)
+        self.assertEqual(pattern.value_counts['status'], {'Paid': 2, 'Denied': 1})
+
+    @override_settings(CLAIMS_WORKLOAD_FLUSH_SECONDS=0)
+    def test_old_buffer_is_flushed_in_background(self):
+        """Test a sample arriving after the flush interval hands the buffer to a background flush"""
+        with patch('claims.workload._flush_in_background') as flush:
+            self.client.get(reverse('claims_list'), {'status': 'Paid'})
+            self.client.get(reverse('claims_list'), {'status': 'Paid'})
+        flush.assert_called_once_with()
+
+    def test_search_records_every_column_it_matches(self):
+        """Test a search is recorded against the id and both name columns"""
+        self.assertEqual(query_shape({'search': 'smith', 'ordering': '-discharge_date'})['filters'], [
+            ['id', 'eq'], ['insurer_name', 'contains'], ['patient_name', 'contains'],
+        ])
+
+    def test_propose_composite_index(self):
+        """Test equality columns lead and the sort column follows"""
+        pattern = QueryPattern(shape={
+            'filters': [['billed_amount', 'range'], ['status', 'eq']],
+            'ordering': '-discharge_date',
+        }, value_counts={'status': {'Paid': 5, 'Denied': 5}})
+        index = propose_index(pattern, 'sqlite')
+        self.assertEqual(index.fields, ['status', '-discharge_date', 'billed_amount'])
+        self.assertIsNone(index.condition)
+
+    def test_propose_partial_index_for_dominant_value(self):
+        """Test a status pinned by almost every request becomes a partial index"""
+        pattern = QueryPattern(shape={
+            'filters': [['status', 'eq']], 'ordering': '-billed_amount',
+        }, value_counts={'status': {'Under Review': 50}})
+        index = propose_index(pattern, 'sqlite')
+        self.assertEqual(index.fields, ['-billed_amount'])
+        self.assertEqual(index.condition, Q(status='Under Review'))
+
+
+
+@override_settings(CLAIMS_WORKLOAD_SAMPLE_RATE=1.0)
+class IndexAdvisorCommandTestCase(TransactionTestCase):
+    available_apps = ['claims', 'django.contrib.auth', 'django.contrib.contenttypes', 'django.contrib.sessions']
+
+    def setUp(self):
+        cache.clear()
+
+    def test_advise_indexes_benchmarks_candidates(self):
+        """Test the advisor command explains and benchmarks recorded patterns"""
+        # The SQLite schema editor cannot run inside TestCase's transaction
+        self.client.get(reverse('claims_list'), {'status': 'Paid', 'min_amount': '1000'})
+        out = StringIO()
+        call_command('advise_indexes', '--benchmark', '--runs', '1', stdout=out)
+        self.assertIn('Proposed: models.Index(', out.getvalue())
+        self.assertIn('Baseline:', out.getvalue())
+
+
+class RequestProfilerTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+        self.settings_override = override_settings(CLAIMS_PROFILE_DIR=self.profile_dir)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.staff = User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        self.reviewer = User.objects.create_user(username='reviewer', password='testpass123')
+
+    def test_staff_profile_writes_report(self):
+        """Test a flagged staff request saves a report with SQL and plans"""
+        self.client.login(username='staff', password='testpass123')
+        response = self.client.get(reverse('claims_list'), {'_profile': '1', 'status': 'Paid'})
+        report_id = response['X-Profile-Report']
+        with open(report_path(report_id)) as f:
+            report = f.read()
+        self.assertIn('SQL statements', report)
+        self.assertIn('claims_claim', report)
+        self.assertIn('cumulative', report)
+        self.assertContains(self.client.get(reverse('profile_reports')), report_id)
+
+    def test_non_staff_is_never_profiled(self):
+        """Test the profile flag is ignored for regular users"""
+        self.client.login(username='reviewer', password='testpass123')
+        response = self.client.get(reverse('claims_list'), HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Report', response)
+        self.assertEqual(list_reports(), [])
+
+    def test_profiles_are_rate_limited(self):
+        """Test only one profile is captured per interval"""
+        self.client.login(username='staff', password='testpass123')
+        first = self.client.get(reverse('claims_list'), HTTP_X_PROFILE='1')
+        second = self.client.get(reverse('claims_list'), HTTP_X_PROFILE='1')
+        self.assertIn('X-Profile-Report', first)
+        self.assertNotIn('X-Profile-Report', second)
+
+
+class ScalableAdminTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin_user = User.objects.create_superuser(username='admin', password='testpass123')
+        self.client.login(username='admin', password='testpass123')
+        self.claims = list(Claim.objects.order_by('id')[:20])
+
+    def _changelist_queries(self, model_name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:claims_{model_name}_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_claim_changelist_annotates_flags(self):
+        """Test flag state comes from the main query, not one EXISTS per row"""
+        baseline = self._changelist_queries('claim')
+        for claim in self.claims:
+            ClaimFlag.objects.create(claim=claim, user=self.admin_user)
+        cache.clear()
+        self.assertEqual(self._changelist_queries('claim'), baseline)
+
+    def test_flag_and_note_changelists_select_related(self):
+        """Test displayed claims and users do not add per-row queries"""
+        ClaimFlag.objects.create(claim=self.claims[0], user=self.admin_user)
+        ClaimNote.objects.create(claim=self.claims[0], user=self.admin_user, content='Note')
+        flag_baseline = self._changelist_queries('claimflag')
+        note_baseline = self._changelist_queries('claimnote')
+        for claim in self.claims[1:]:
+            ClaimFlag.objects.create(claim=claim, user=self.admin_user)
+            ClaimNote.objects.create(claim=claim, user=self.admin_user, content='Note')
+        cache.clear()
+        self.assertEqual(self._changelist_queries('claimflag'), flag_baseline)
+        self.assertEqual(self._changelist_queries('claimnote'), note_baseline)
+
+    def test_numeric_search_matches_claim_id(self):
+        """Test searching a number finds the claim by primary key"""
+        claim = self.claims[0]
+        response = self.client.get(reverse('admin:claims_claim_changelist'), {'q': str(claim.id)})
+        self.assertContains(response, claim.patient_name)
+
+
+class UnderpaymentColumnTestCase(TestCase):
+
+    def setUp(self):
+        self.claim = Claim.objects.create(
+            id=66666,
+            patient_name='Underpaid Patient',
+            billed_amount=Decimal('9000000.00'),
+            paid_amount=Decimal('1000000.00'),
+            status='Denied',
+            insurer_name='Stingy Insurance',
+            discharge_date=date.today()
+        )
+        self.claim.refresh_from_db()
+
+    def test_generated_columns(self):
+        """Test underpayment and payment ratio are computed by the database"""
+        self.assertEqual(self.claim.underpayment, Decimal('8000000.00'))
+        self.assertAlmostEqual(self.claim.payment_ratio, 1 / 9)
+        self.assertEqual(self.claim.underpayment, self.claim.underpayment_amount)
+
+    def test_sort_and_filter_by_underpayment(self):
+        """Test the claims list sorts and range-filters on underpayment"""
+        response = self.client.get(reverse('claims_list'), {
+            'sort': 'underpayment', 'direction': 'desc', 'min_underpayment': '7000000'
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([claim.id for claim in response.context['claims']], [66666])
+
+    def test_top_underpaid_uses_index(self):
+        """Test the top underpaid view reads the underpayment index with LIMIT"""
+        response = self.client.get(reverse('top_underpaid'), {'limit': '5'})
+        self.assertEqual(response.context['claims'][0].id, 66666)
+        self.assertIn('claims_clai_underpa', Claim.objects.order_by('-underpayment')[:5].explain())
+
+
+class AnomalyDetectionTestCase(TestCase):
+
+    def setUp(self):
+        base = dict(insurer_name='Dup Insurance', status='Paid')
+        Claim.objects.create(id=55001, patient_name='Dana Dup', billed_amount=Decimal('1000.00'),
+                             paid_amount=Decimal('800.00'), discharge_date=date(2024, 3, 1), **base)
+        Claim.objects.create(id=55002, patient_name='Dana Dup', billed_amount=Decimal('1020.00'),
+                             paid_amount=Decimal('810.00'), discharge_date=date(2024, 3, 3), **base)
+        Claim.objects.create(id=55003, patient_name='Dana Dup', billed_amount=Decimal('1000.00'),
+                             paid_amount=Decimal('800.00'), discharge_date=date(2024, 6, 1), **base)
+        for offset in range(30):
+            Claim.objects.create(id=55100 + offset, patient_name=f'Normal {offset}', billed_amount=Decimal('500.00'),
+                                 paid_amount=Decimal('400.00'), discharge_date=date(2024, 1, 1), **base)
+        Claim.objects.create(id=55999, patient_name='Big Bill', billed_amount=Decimal('900000.00'),
+                             paid_amount=Decimal('400.00'), discharge_date=date(2024, 1, 1), **base)
+
+    def _findings(self):
+        return dict(detect_anomalies(workers=1))
+
+    def test_duplicates_within_window(self):
+        """Test claims for the same patient and insurer close in time are paired"""
+        findings = self._findings()
+        self.assertIn('duplicate of claim 55001', findings[55002])
+        self.assertNotIn(55003, findings)
+
+    def test_duplicates_match_names_across_case_and_spacing(self):
+        """Test a patient name differing only in case and surrounding spaces is still compared"""
+        Claim.objects.create(id=55004, patient_name='  dana DUP ', billed_amount=Decimal('1000.00'),
+                             paid_amount=Decimal('800.00'), discharge_date=date(2024, 6, 2),
+                             insurer_name='Dup Insurance', status='Paid')
+        Claim.objects.create(id=55005, patient_name='Dana Duplicate', billed_amount=Decimal('1000.00'),
+                             paid_amount=Decimal('800.00'), discharge_date=date(2024, 3, 2),
+                             insurer_name='Dup Insurance', status='Paid')
+        findings = self._findings()
+        self.assertIn('duplicate of claim 55003', findings[55004])
+        self.assertNotIn(55005, findings)
+
+    def test_amount_outliers(self):
+        """Test billed amounts far from the insurer mean are flagged"""
+        self.assertIn('Billed amount outlier for Dup Insurance', self._findings()[55999])
+
+    def test_findings_written_once_as_system_notes(self):
+        """Test findings become System Flag notes and reruns do not duplicate them"""
+        call_command('detect_anomalies', '--workers', '1', stdout=StringIO())
+        call_command('detect_anomalies', '--workers', '1', stdout=StringIO())
+        notes = ClaimNote.objects.filter(claim_id=55002, note_type='System Flag')
+        self.assertEqual(notes.count(), 1)
+        self.assertEqual(notes.get().user.username, 'system')
+
+    def test_rerun_after_data_change_refreshes_notes(self):
+        """Test a rerun whose figures moved rewrites the claim's existing note instead of adding one"""
+        call_command('detect_anomalies', '--workers', '1', stdout=StringIO())
+        before = ClaimNote.objects.get(claim_id=55999, note_type='System Flag')
+        Claim.objects.create(id=55200, patient_name='New Normal', billed_amount=Decimal('30000.00'),
+                             paid_amount=Decimal('400.00'), discharge_date=date(2024, 1, 2),
+                             insurer_name='Dup Insurance', status='Paid')
+        call_command('detect_anomalies', '--workers', '1', stdout=StringIO())
+        notes = ClaimNote.objects.filter(claim_id=55999, note_type='System Flag')
+        self.assertEqual(notes.count(), 1)
+        self.assertEqual(notes.get().id, before.id)
+        self.assertNotEqual(notes.get().content, before.content)
+        self.assertEqual(ChangeEvent.objects.filter(model='claimnote', object_id=before.id,
+                                                    operation=ChangeEvent.UPDATE).count(), 1)
+
+
+class JobQueueTestCase(TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, ignore_errors=True)
+        self.user = User.objects.create_user(username='exporter', password='testpass123')
+        self.client = Client()
+        self.client.login(username='exporter', password='testpass123')
+
+    def test_export_job_writes_filtered_csv(self):
+        """Test an export job runs to completion and writes only matching claims"""
+        Claim.objects.create(id=77001, patient_name='Export Target', billed_amount=Decimal('10.00'),
+                             paid_amount=Decimal('5.00'), status='Denied', insurer_name='Export Insurance',
+                             discharge_date=date(2024, 1, 1))
+        job = enqueue('export_claims', {'filters': {'insurer': 'Export Insurance'}}, user=self.user)
+        with self.settings(CLAIMS_JOB_OUTPUT_DIR=self.output_dir):
+            run_next_job('test-worker')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'Succeeded')
+        self.assertEqual(job.result['rows'], 1)
+        with open(job.result['path']) as f:
+            self.assertIn('Export Target', f.read())
+
+    def test_export_includes_archived_claims_the_list_shows(self):
+        """Test an export whose date range reaches past the archive horizon includes archived claims"""
+        for claim_id, discharge_date in ((77011, date(2010, 5, 1)), (77012, date.today())):
+            Claim.objects.create(id=claim_id, patient_name='Export Archive', billed_amount=Decimal('10.00'),
+                                 paid_amount=Decimal('5.00'), status='Denied', insurer_name='Archive Export Insurance',
+                                 discharge_date=discharge_date)
+        archive_claims(before=date(2011, 1, 1))
+        job = enqueue('export_claims', {'filters': {'insurer': 'Archive Export Insurance', 'date_from': '2010-01-01'}})
+        with self.settings(CLAIMS_JOB_OUTPUT_DIR=self.output_dir):
+            run_next_job('test-worker')
+        job.refresh_from_db()
+        self.assertEqual(job.result['rows'], 2)
+        with open(job.result['path']) as f:
+            self.assertEqual([line.split(',')[0] for line in f.read().splitlines()[1:]], ['77012', '77011'])
+
+    def test_failed_job_retries_with_backoff(self):
+        """Test a failing handler is requeued with a delay, then marked failed"""
+        @job_handler('always_fails')
+        def always_fails(context):
+            raise RuntimeError('boom')
+        self.addCleanup(JOB_HANDLERS.pop, 'always_fails')
+
+        job = enqueue('always_fails', max_attempts=2)
+        run_next_job('test-worker')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'Queued')
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn('boom', job.error)
+
+        Job.objects.filter(id=job.id).update(run_after=timezone.now())
+        run_next_job('test-worker')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('Failed', 2))
+
+    def test_stale_jobs_requeued_until_attempts_run_out(self):
+        """Test a job whose worker died is requeued, unless that was its last attempt"""
+        stale = timezone.now() - timedelta(hours=1)
+        retry = enqueue('export_claims', max_attempts=3)
+        last = enqueue('export_claims', max_attempts=3)
+        Job.objects.filter(id=retry.id).update(status='Running', attempts=1, heartbeat_at=stale, locked_by='dead')
+        Job.objects.filter(id=last.id).update(status='Running', attempts=3, heartbeat_at=stale, locked_by='dead')
+        self.assertEqual(requeue_stale_jobs(600), (1, 1))
+        retry.refresh_from_db()
+        last.refresh_from_db()
+        self.assertEqual((retry.status, retry.locked_by), ('Queued', ''))
+        self.assertEqual(last.status, 'Failed')
+        self.assertIn('heartbeats', last.error)
+
+    def test_failure_keeps_recorded_progress(self):
+        """Test a failed attempt leaves the progress its handler last recorded"""
+        @job_handler('fails_halfway')
+        def fails_halfway(context):
+            context.set_progress(40, 'Halfway')
+            raise RuntimeError('boom')
+        self.addCleanup(JOB_HANDLERS.pop, 'fails_halfway')
+        job = enqueue('fails_halfway', max_attempts=1)
+        run_next_job('test-worker')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress, job.progress_message), ('Failed', 40, 'Halfway'))
+
+    def test_worker_loop_requeues_stale_jobs(self):
+        """Test a running worker picks up a job whose worker died without being restarted"""
+        @job_handler('quick_job')
+        def quick_job(context):
+            return {'done': True}
+        self.addCleanup(JOB_HANDLERS.pop, 'quick_job')
+        job = enqueue('quick_job')
+        Job.objects.filter(id=job.id).update(status='Running', attempts=1, locked_by='dead',
+                                             heartbeat_at=timezone.now() - timedelta(hours=1))
+        with patch('claims.jobs.connections.close_all'):
+            self.assertEqual(worker_loop(stop_when_idle=True, stale_after=600), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('Succeeded', 2))
+
+    def test_cancel_queued_job(self):
+        """Test a cancelled job is never picked up by a worker"""
+        job = enqueue('export_claims')
+        cancel(job)
+        self.assertIsNone(run_next_job('test-worker'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'Cancelled')
+
+    def test_export_views(self):
+        """Test starting an export returns a polling partial and status is owner-only"""
+        response = self.client.post(reverse('start_export'), {'status': 'Denied'}, HTTP_HX_REQUEST='true')
+        self.assertContains(response, 'hx-trigger="every 2s"')
+        job = Job.objects.get(created_by=self.user)
+        self.assertEqual(job.params['filters'], {'status': 'Denied'})
+
+        self.assertEqual(self.client.get(reverse('job_status', args=[job.id])).json()['status'], 'Queued')
+        User.objects.create_user(username='other', password='testpass123')
+        self.client.login(username='other', password='testpass123')
+        self.assertEqual(self.client.get(reverse('job_status', args=[job.id])).status_code, 404)
+
+
+class JobHeartbeatTestCase(TransactionTestCase):
+
+    @override_settings(CLAIMS_JOB_HEARTBEAT_SECONDS=0.05)
+    def test_running_job_keeps_sending_heartbeats(self):
+        """Test a handler that never reports progress is not left looking stale"""
+        @job_handler('quiet_job')
+        def quiet_job(context):
+            time.sleep(0.5)
+            return Job.objects.get(id=context.job.id).heartbeat_at.isoformat()
+        self.addCleanup(JOB_HANDLERS.pop, 'quiet_job')
+
+        job = enqueue('quiet_job')
+        job = run_next_job('test-worker')
+        self.assertEqual(job.status, 'Succeeded')
+        self.assertGreater(parse_datetime(job.result), job.started_at)
+
+
+class CheckpointedIngestTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.settings_override = self.settings(CLAIMS_IMPORT_QUARANTINE_DIR=self.tmp)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.claims_file = f'{self.tmp}/claims.csv'
+        with open(self.claims_file, 'w') as f:
+            f.write('id|patient_name|billed_amount|paid_amount|status|insurer_name|discharge_date\n')
+            f.write('81001|Ana One|100.00|50.00|Paid|Ingest Health|2024-01-01\n')
+            f.write('81002|Ben Two|abc|50.00|Paid|Ingest Health|2024-01-02\n')
+            f.write('81003|Cy Three|300.00|150.00|Pending|Ingest Health|2024-01-03\n')
+            f.write('81004|Di Four|400.00|200.00|Denied|Ingest Health|2024-01-04\n')
+            f.write('81005|Ed Five|500.00|250.00|Paid|Ingest Health|2024-13-05\n')
+            f.write('81006|Flo Six|600.00|300.00|Paid|Ingest Health\n')
+            f.write('81007|Gus Seven|700.00|350.00|Under Review|Ingest Health|2024-01-07\n')
+
+    def test_invalid_rows_are_quarantined(self):
+        """Test bad rows go to the quarantine file with line numbers and reasons"""
+        result = ingest_file(self.claims_file, 'claims', chunk_lines=3)
+        self.assertEqual((result.loaded, result.quarantined), (3, 4))
+        self.assertEqual(set(Claim.objects.filter(insurer_name='Ingest Health').values_list('id', flat=True)),
+                         {81001, 81004, 81007})
+        with open(result.quarantine_path) as f:
+            quarantine = f.read()
+        self.assertIn('3|billed_amount is not a number', quarantine)
+        self.assertIn("unknown status: 'Pending'", quarantine)
+        self.assertIn('expected 7 fields, got 6', quarantine)
+
+    def test_resume_continues_after_last_committed_chunk(self):
+        """Test a crash mid-file leaves a checkpoint that --resume picks up from"""
+        from claims import ingest
+        original = ingest.write_claims
+        calls = []
+
+        def crash_on_second_chunk(rows):
+            calls.append(rows)
+            if len(calls) == 2:
+                raise RuntimeError('worker died')
+            return original(rows)
+
+        with patch.dict(ingest.WRITERS, {'claims': crash_on_second_chunk}):
+            with self.assertRaises(RuntimeError):
+                ingest_file(self.claims_file, 'claims', chunk_lines=2)
+        checkpoint = ImportCheckpoint.objects.get(path=self.claims_file)
+        self.assertEqual((checkpoint.line, checkpoint.completed), (4, False))
+        self.assertTrue(Claim.objects.filter(id=81001).exists())
+        self.assertFalse(Claim.objects.filter(id=81004).exists())
+
+        with patch.dict(ingest.WRITERS, {'claims': lambda rows: calls.append(rows) or original(rows)}):
+            result = ingest_file(self.claims_file, 'claims', resume=True, chunk_lines=2)
+        self.assertEqual(result.resumed_from, checkpoint.offset)
+        self.assertEqual(calls[2][0][2]['id'], 81004)
+        self.assertEqual(result.loaded, 2)
+        self.assertTrue(ImportCheckpoint.objects.get(path=self.claims_file).completed)
+
+    def test_details_for_unknown_claims_are_quarantined(self):
+        """Test detail rows are loaded once per claim and orphans are quarantined"""
+        ingest_file(self.claims_file, 'claims')
+        details_file = f'{self.tmp}/details.csv'
+        with open(details_file, 'w') as f:
+            f.write('id|claim_id|denial_reason|cpt_codes\n')
+            f.write('1|81001|N/A|99213\n')
+            f.write('2|81001|Duplicate|99214\n')
+            f.write('3|89999|Missing claim|99215\n')
+        result = ingest_file(details_file, 'details')
+        self.assertEqual((result.loaded, result.skipped, result.quarantined), (1, 1, 1))
+        self.assertIsNone(ClaimDetail.objects.get(claim_id=81001).denial_reason)
+
+
+class FlagQueueTestCase(TestCase):
+
+    def setUp(self):
+        self.reviewer = User.objects.create_user(username='queue_reviewer', password='testpass123')
+        self.other = User.objects.create_user(username='queue_other', password='testpass123')
+        start = timezone.now() - timezone.timedelta(days=10)
+        claim_ids = list(Claim.objects.order_by('id').values_list('id', flat=True)[:7])
+        for offset, claim_id in enumerate(claim_ids[:5]):
+            ClaimFlag.objects.create(claim_id=claim_id, user=self.reviewer,
+                                     flagged_at=start + timezone.timedelta(hours=offset // 2))
+        for claim_id in claim_ids[5:]:
+            ClaimFlag.objects.create(claim_id=claim_id, user=self.other)
+        self.client = Client()
+        self.client.login(username='queue_reviewer', password='testpass123')
+
+    def test_cursor_pages_cover_every_flag_once(self):
+        """Test cursor pages walk ties on flagged_at without gaps or repeats"""
+        queryset = ClaimFlag.objects.filter(user=self.reviewer)
+        seen, cursor = [], None
+        while True:
+            page, cursor = flag_queue_page(queryset, cursor, page_size=2)
+            seen += [flag.id for flag in page]
+            if not cursor:
+                break
+        self.assertEqual(seen, list(queryset.order_by('flagged_at', 'id').values_list('id', flat=True)))
+
+    def test_reviewer_counts_follow_flag_writes(self):
+        """Test reviewer counters track creates and deletes and match a full recount"""
+        self.assertEqual(ReviewerFlagCount.objects.get(user=self.reviewer).open_flags, 5)
+        ClaimFlag.objects.filter(user=self.reviewer).first().delete()
+        self.assertEqual(ReviewerFlagCount.objects.get(user=self.reviewer).open_flags, 4)
+        recount_reviewer_flags()
+        self.assertEqual(ReviewerFlagCount.objects.get(user=self.reviewer).open_flags, 4)
+
+    def test_queue_view_uses_counters_and_indexes(self):
+        """Test the queue page lists only my flags and does not count the flag table"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('flag_queue'))
+        self.assertEqual(len(response.context['flags']), 5)
+        self.assertEqual((response.context['my_open'], response.context['total_open']), (5, 7))
+        self.assertFalse(any('COUNT(' in query['sql'].upper() for query in queries.captured_queries))
+        plan = ClaimFlag.objects.filter(user=self.reviewer).order_by('flagged_at', 'id').explain()
+        self.assertIn('claims_clai_user_id_591b15_idx', plan)
+
+
+class SingleFlightTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_callers_share_one_computation(self):
+        """Test threads asking for the same key wait for the first and reuse its result"""
+        calls = []
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return 'shared'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(single_flight('sf-test', compute)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while not calls:
+            pass
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['shared'] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_waits_for_another_process(self):
+        """Test a caller that finds another worker's lock reuses the result it publishes"""
+        cache.add('claims:single-flight:lock:sf-other', 1)
+        threading.Timer(0.1, lambda: cache.set('claims:single-flight:result:sf-other', ('from other worker',))).start()
+        self.assertEqual(single_flight('sf-other', lambda: 'computed here'), 'from other worker')
+
+    def test_superseded_list_request_returns_no_content(self):
+        """Test a keystroke request replaced by a newer one from the same tab is dropped"""
+        note_request_sequence('tab-1', 5)
+        headers = {'HTTP_HX_REQUEST': 'true', 'HTTP_X_CLAIMS_CLIENT': 'tab-1'}
+        response = self.client.get(reverse('claims_list'), {'search': 'a'}, HTTP_X_CLAIMS_SEQ='4', **headers)
+        self.assertEqual(response.status_code, 204)
+        response = self.client.get(reverse('claims_list'), {'search': 'ab'}, HTTP_X_CLAIMS_SEQ='6', **headers)
+        self.assertEqual(response.status_code, 200)
+
+
+class LoadTestHarnessTestCase(LiveServerTestCase):
+    available_apps = ['claims', 'django.contrib.auth', 'django.contrib.contenttypes', 'django.contrib.sessions']
+
+    def test_percentiles_and_summary(self):
+        """Test nearest-rank percentiles and per-endpoint error counts"""
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+        samples = [Sample('list', ms, 200) for ms in range(1, 21)] + [Sample('flag', 5, 500)]
+        summary = summarize(samples, elapsed_seconds=2)
+        self.assertEqual(summary['list']['p50_ms'], 10)
+        self.assertEqual(summary['TOTAL']['requests'], 21)
+        self.assertEqual((summary['flag']['errors'], summary['flag']['error_examples']), (1, ['HTTP 500']))
+        previous = {'endpoints': {'list': dict(summary['list'], p95_ms=10.0)}}
+        self.assertEqual(compare({'endpoints': summary}, previous)[0]['p95_change_pct'], 90.0)
+
+    def test_mixed_traffic_against_live_server(self):
+        """Test logged-in reviewers drive the list and detail endpoints"""
+        User.objects.create_user(username='load_reviewer', password='testpass123')
+        for offset in range(5):
+            Claim.objects.create(id=90001 + offset, patient_name=f'Load {offset}', billed_amount=Decimal('100.00'),
+                                 paid_amount=Decimal('50.00'), status='Paid', insurer_name='Load Health',
+                                 discharge_date=date(2024, 1, 1))
+        samples, elapsed = run_load(self.live_server_url, 'load_reviewer', 'testpass123',
+                                    concurrency=2, duration=5, max_requests=30, seed=7)
+        self.assertGreaterEqual(len(samples), 30)
+        detail = [sample for sample in samples if sample.endpoint in ('detail_modal', 'list', 'list_filter')]
+        self.assertTrue(detail)
+        self.assertTrue(all(sample.ok for sample in detail))
+
+    def test_default_mix_only_reads(self):
+        """Test flags and notes are only posted when writes are asked for"""
+        self.assertFalse({'flag', 'note'} & {action[0] for action in TrafficMix(seed=1).actions})
+        self.assertLessEqual({'flag', 'note'}, {action[0] for action in TrafficMix(seed=1, with_writes=True).actions})
+
+    def test_command_removes_its_user_and_writes(self):
+        """Test the reviewer the command creates is deleted with the flags and notes it made"""
+        Claim.objects.create(id=90101, patient_name='Load Writes', billed_amount=Decimal('100.00'),
+                             paid_amount=Decimal('50.00'), status='Paid', insurer_name='Load Health',
+                             discharge_date=date(2024, 1, 1))
+        output = os.path.join(tempfile.mkdtemp(), 'results.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(output))
+        # Every request flags, so the run certainly writes
+        with patch('claims.loadtest.TrafficMix.next_request', lambda mix: ('flag',) + mix.flag()):
+            call_command('loadtest', '--url', self.live_server_url, '--with-writes', '--concurrency', '1',
+                         '--duration', '5', '--requests', '5', '--output', output, stdout=StringIO())
+        with open(output) as f:
+            self.assertEqual(json.load(f)['endpoints']['flag']['requests'], 5)
+        self.assertTrue(ChangeEvent.objects.filter(model='claimflag', operation=ChangeEvent.INSERT).exists())
+        self.assertFalse(User.objects.filter(username__startswith='loadtest').exists())
+        self.assertFalse(ClaimFlag.objects.filter(reason='Load test review').exists())
+
+
+class CompressedStreamingTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def _body(self, response):
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return re.sub(rb'(csrfmiddlewaretoken" value="|X-CSRFToken": ")[^"]+', rb'\1', content)
+
+    def test_large_list_page_streams_same_html(self):
+        """Test a 100-row page is streamed and matches the buffered rendering"""
+        streamed = self.client.get(reverse('claims_list'), {'per_page': '100'})
+        self.assertTrue(streamed.streaming)
+        with self.settings(CLAIMS_STREAM_MIN_ROWS=1000):
+            buffered = self.client.get(reverse('claims_list'), {'per_page': '100'})
+        self.assertFalse(buffered.streaming)
+        self.assertEqual(self._body(streamed), self._body(buffered))
+
+    def test_streamed_page_sets_csrf_cookie(self):
+        """Test a streamed first page still sets the CSRF cookie its forms and HTMX headers rely on"""
+        response = self.client.get(reverse('claims_list'), {'per_page': '100'})
+        self.assertTrue(response.streaming)
+        token = response.cookies[settings.CSRF_COOKIE_NAME].value
+        self.assertTrue(token)
+        self.assertIn(b'X-CSRFToken', b''.join(response.streaming_content))
+
+    def test_streamed_page_shows_messages_once(self):
+        """Test queued and deferred messages appear on one streamed page and are then gone"""
+        User.objects.create_user(username='streamer', password='testpass123')
+        self.client.login(username='streamer', password='testpass123')
+        claim = Claim.objects.order_by('id').first()
+        self.client.post(reverse('add_note', args=[claim.id]), {'content': 'Checked the remittance'})
+        first = b''.join(self.client.get(reverse('claims_list'), {'per_page': '100', 'min_amount': 'abc'}).streaming_content)
+        self.assertIn(b'Note added successfully', first)
+        self.assertIn(b'Invalid minimum amount format.', first)
+        second = b''.join(self.client.get(reverse('claims_list'), {'per_page': '100'}).streaming_content)
+        self.assertNotIn(b'Note added successfully', second)
+        self.assertNotIn(b'Invalid minimum amount format.', second)
+
+    def test_layout_is_sent_before_deferred_queries(self):
+        """Test the layout up to stream_flush is produced before the deferred context is built"""
+        calls = []
+        request = self.client.get(reverse('top_underpaid')).wsgi_request
+        response = stream_template(request, 'claims/top_underpaid.html',
+                                   deferred=lambda: calls.append(1) or {'claims': [], 'limit': 5})
+        chunks = iter(response.streaming_content)
+        first = next(chunks)
+        self.assertIn(b'styles.css', first)
+        self.assertEqual(calls, [])
+        self.assertIn(b'Top 5 Underpaid Claims', b''.join(chunks))
+        self.assertEqual(calls, [1])
+
+    def test_gzip_for_dynamic_pages(self):
+        """Test HTML responses are gzipped when brotli is not accepted"""
+        response = self.client.get(reverse('claims_list'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'claims-filter-form', gzip.decompress(response.content))
+
+    @skipUnless(compression.brotli, 'brotli is not installed')
+    def test_brotli_when_accepted(self):
+        """Test buffered and streamed pages are brotli-compressed when accepted"""
+        response = self.client.get(reverse('claims_list'), {'per_page': '100'}, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        html = compression.brotli.decompress(b''.join(response.streaming_content))
+        self.assertIn(b'claims-filter-form', html)
+        response = self.client.get(reverse('claims_list'), HTTP_ACCEPT_ENCODING='br')
+        self.assertIn(b'claims-filter-form', compression.brotli.decompress(response.content))
+
+    @skipUnless(compression.brotli, 'brotli is not installed')
+    def test_brotli_pages_are_padded(self):
+        """Test brotli pages end in random-length padding and non-HTML falls back to padded gzip"""
+        lengths = set()
+        for _ in range(5):
+            response = self.client.get(reverse('claims_list'), HTTP_ACCEPT_ENCODING='br')
+            html = compression.brotli.decompress(response.content)
+            self.assertRegex(html, rb'<!-- [A-Za-z0-9]* -->$')
+            lengths.add(len(re.search(rb'<!-- ([A-Za-z0-9]*) -->$', html).group(1)))
+        self.assertGreater(len(lengths), 1)
+        claim_ids = list(Claim.objects.values_list('id', flat=True)[:10])
+        response = self.client.get(reverse('claim_details_batch'), {'id': claim_ids}, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+class QuickStatsTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        Claim.objects.all().delete()
+        for offset, status in enumerate(['Paid', 'Denied', 'Under Review']):
+            Claim.objects.create(id=95001 + offset, patient_name=f'Stats {offset}', billed_amount=Decimal('1500.00'),
+                                 paid_amount=Decimal('500.00'), status=status, insurer_name='Stats Health',
+                                 discharge_date=date(2024, 1, 1))
+
+    def test_stats_in_one_query(self):
+        """Test all four widget values come from a single aggregate query"""
+        with self.assertNumQueries(1):
+            stats = compute_quick_stats()
+        self.assertEqual(stats['todays_claims'], 3)
+        self.assertEqual(stats['processed_claims'], 2)
+        self.assertEqual(stats['pending_claims'], 1)
+        self.assertEqual(stats['total_value'], Decimal('4.5'))
+
+    def test_polling_is_served_from_cache(self):
+        """Test repeated polls within the TTL run no queries"""
+        response = self.client.get(reverse('quick_stats'))
+        self.assertContains(response, 'id="quick-stats"')
+        self.assertEqual(response.context['pending_claims'], 1)
+        with self.assertNumQueries(0):
+            for _ in range(5):
+                self.client.get(reverse('quick_stats'))
+
+    def test_stale_stats_refresh_in_background(self):
+        """Test stale stats are returned at once while a single refresh is started"""
+        get_quick_stats()
+        Claim.objects.filter(status='Under Review').update(status='Paid')
+        with self.settings(CLAIMS_QUICK_STATS_TTL_SECONDS=0), \
+                patch('claims.quick_stats._refresh_in_background') as refresh:
+            with self.assertNumQueries(0):
+                self.assertEqual(get_quick_stats()['pending_claims'], 1)
+                get_quick_stats()
+        refresh.assert_called_once()
+
+    @override_settings(CLAIMS_QUICK_STATS_TTL_SECONDS=7)
+    def test_list_page_polls_quick_stats(self):
+        """Test the claims list loads the stats widget from the endpoint as often as the stats refresh"""
+        response = self.client.get(reverse('claims_list'))
+        self.assertContains(response, 'hx-get="%s"' % reverse('quick_stats'))
+        self.assertContains(response, 'hx-trigger="load, every 7s"')
+        self.assertContains(self.client.get(reverse('quick_stats')), 'hx-trigger="every 7s"')
+
+    def test_todays_claims_compared_with_yesterday(self):
+        """Test the today's-claims card shows the real change from yesterday's count"""
+        yesterday = timezone.now() - timedelta(days=1)
+        Claim.objects.filter(id__in=[95001, 95002]).update(created_at=yesterday)
+        stats = compute_quick_stats()
+        self.assertEqual((stats['todays_claims'], stats['yesterdays_claims'], stats['todays_change']), (1, 2, -50))
+        self.assertContains(self.client.get(reverse('quick_stats')), '↘︎ 50% from yesterday')
+        Claim.objects.all().update(created_at=timezone.now())
+        self.assertIsNone(compute_quick_stats()['todays_change'])
+
+
+class ShardingTestCase(TestCase):
+
+    def test_shard_keys(self):
+        """Test insurer hashing is stable and ID ranges split at their boundaries"""
+        self.assertEqual(insurer_shard('Aetna', 4), insurer_shard(' aetna ', 4))
+        self.assertEqual(len({insurer_shard(f'Insurer {n}', 4) for n in range(50)}), 4)
+        self.assertEqual([id_range_shard(claim_id, [100, 200]) for claim_id in (1, 99, 100, 199, 200, 5000)],
+                         [0, 0, 1, 1, 2, 2])
+
+    def test_merge_ordered(self):
+        """Test per-shard sorted results merge in database order, NULLs included"""
+        shard_a = [{'id': 4, 'ratio': 0.9}, {'id': 1, 'ratio': 0.5}, {'id': 6, 'ratio': None}]
+        shard_b = [{'id': 3, 'ratio': 0.9}, {'id': 2, 'ratio': 0.1}]
+        merged = merge_ordered([shard_a, shard_b], ['-ratio', '-id'])
+        self.assertEqual([row['id'] for row in merged], [4, 3, 1, 2, 6])
+        # Backends that sort NULLs as largest return them first in descending order
+        merged = merge_ordered([shard_a[2:] + shard_a[:2], shard_b], ['-ratio', '-id'], limit=3, nulls_largest=True)
+        self.assertEqual([row['id'] for row in merged], [6, 4, 3])
+        self.assertEqual(merge_distinct([['Denied', 'Paid'], ['Paid', 'Under Review']]),
+                         ['Denied', 'Paid', 'Under Review'])
+
+    def test_combine_groups(self):
+        """Test GROUP BY rows from several shards are summed per key"""
+        combined = combine_groups([
+            [{'status': 'Paid', 'count': 2, 'total': Decimal('10')}],
+            [{'status': 'Paid', 'count': 3, 'total': None}, {'status': 'Denied', 'count': 1, 'total': Decimal('4')}],
+        ], 'status', ['count', 'total'])
+        self.assertEqual(combined, [
+            {'status': 'Paid', 'count': 5, 'total': Decimal('10')},
+            {'status': 'Denied', 'count': 1, 'total': Decimal('4')},
+        ])
+
+    @override_settings(CLAIMS_SHARDS=['shard_0', 'shard_1'], CLAIMS_SHARD_KEY='id', CLAIMS_SHARD_ID_BOUNDARIES=[1000])
+    def test_router_places_new_rows(self):
+        """Test new claims go to their range's shard and flags follow their claim"""
+        router = ConnectionRouter([ShardRouter()])
+        self.assertEqual(router.db_for_write(Claim, instance=Claim(id=5, insurer_name='A')), 'shard_0')
+        claim = Claim(id=2000, insurer_name='A')
+        self.assertEqual(router.db_for_write(Claim, instance=claim), 'shard_1')
+        claim._state.db = 'shard_1'
+        self.assertEqual(router.db_for_write(ClaimFlag, instance=ClaimFlag(claim=claim)), 'shard_1')
+        self.assertEqual(router.db_for_write(Job, instance=Job(kind='export_claims')), 'default')
+
+    def test_dashboard_statistics(self):
+        """Test the gathered dashboard statistics match the single-database figures"""
+        user = User.objects.create_user(username='shard_admin', password='testpass123')
+        claim = Claim.objects.create(id=96001, patient_name='Shard Test', billed_amount=Decimal('300.00'),
+                                     paid_amount=Decimal('100.00'), status='Denied', insurer_name='Shard Health',
+                                     discharge_date=date(2024, 1, 1))
+        ClaimFlag.objects.create(claim=claim, user=user)
+        self.client.login(username='shard_admin', password='testpass123')
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.context['total_claims'], Claim.objects.count())
+        self.assertEqual(response.context['flagged_claims'], 1)
+        self.assertEqual(response.context['recent_flags'][0].claim_id, 96001)
+        denied = next(stat for stat in response.context['status_stats'] if stat['status'] == 'Denied')
+        self.assertEqual(denied['count'], Claim.objects.filter(status='Denied').count())
+        expected = Claim.objects.filter(status='Denied').aggregate(avg=Avg('underpayment'))['avg']
+        self.assertAlmostEqual(float(denied['avg_underpayment']), float(expected), places=2)
+
+
+class TwoShardTestCase(TransactionTestCase):
+    """Pages and counters against two real SQLite shard databases, queried from the shard pool"""
+    available_apps = [
+        'claims', 'django.contrib.admin', 'django.contrib.auth', 'django.contrib.contenttypes',
+        'django.contrib.sessions', 'django.contrib.messages',
+    ]
+    SHARDS = ['shard_0', 'shard_1']
+
+    # The shards are added once the test runner has set up its databases, so it does
+    # not try to create them; they are migrated here and then flushed like default
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.shard_dir = tempfile.mkdtemp()
+        for alias in cls.SHARDS:
+            settings.DATABASES[alias] = {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': f'{cls.shard_dir}/{alias}.sqlite3',
+                'CONN_MAX_AGE': 600,
+            }
+        del connections.settings  # Re-read DATABASES
+        cls.databases = {DEFAULT_DB_ALIAS, *cls.SHARDS}
+        for alias in cls.SHARDS:
+            call_command('migrate', database=alias, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutdown_shard_pool()
+        for alias in cls.SHARDS:
+            connections[alias].close()
+            del connections[alias]
+            del settings.DATABASES[alias]
+        del connections.settings
+        cls.databases = {DEFAULT_DB_ALIAS}
+        shutil.rmtree(cls.shard_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        # Per test rather than per class, so the setup's post_migrate does not go looking for shards
+        self.settings_override = self.settings(
+            CLAIMS_SHARDS=self.SHARDS, CLAIMS_SHARD_KEY='id', CLAIMS_SHARD_ID_BOUNDARIES=[1000],
+            CLAIMS_SHARD_THREADS=4, DATABASE_ROUTERS=['claims.sharding.ShardRouter'],
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        cache.clear()
+        self.admin_user = User.objects.create_superuser(username='shard_admin', password='testpass123')
+        self.client.login(username='shard_admin', password='testpass123')
+        # save() rather than objects.create(), which would send both to the manager's default database
+        self.low = Claim(id=10, patient_name='Low Shard', billed_amount=Decimal('300.00'),
+                         paid_amount=Decimal('100.00'), status='Denied', insurer_name='Shard Health',
+                         discharge_date=date.today())
+        self.low.save()
+        self.high = Claim(id=2000, patient_name='High Shard', billed_amount=Decimal('500.00'),
+                          paid_amount=Decimal('500.00'), status='Paid', insurer_name='Shard Health',
+                          discharge_date=date.today())
+        self.high.save()
+
+    def test_claims_are_placed_on_their_shards(self):
+        """Test each claim is stored only on the shard its ID range maps to"""
+        self.assertEqual(list(Claim.objects.using('shard_0').values_list('id', flat=True)), [10])
+        self.assertEqual(list(Claim.objects.using('shard_1').values_list('id', flat=True)), [2000])
+
+    def test_list_and_dashboard_gather_every_shard(self):
+        """Test the claims list and dashboard show and count the claims of both shards"""
+        response = self.client.get(reverse('claims_list'), {'sort': 'amount', 'direction': 'asc'})
+        self.assertEqual([claim.id for claim in response.context['claims']], [10, 2000])
+        self.assertEqual(response.context['total_claims'], 2)
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.context['total_claims'], 2)
+        self.assertEqual({stat['status']: stat['count'] for stat in response.context['status_stats']},
+                         {'Denied': 1, 'Paid': 1})
+
+    def test_first_flag_counts_itself(self):
+        """Test a reviewer's first flag seeds their counter with the flag still uncommitted"""
+        self.high.claim_flags.create(user=self.admin_user)
+        self.assertEqual(ReviewerFlagCount.objects.get(user=self.admin_user).open_flags, 1)
+        self.low.claim_flags.create(user=self.admin_user)
+        self.assertEqual(ReviewerFlagCount.objects.get(user=self.admin_user).open_flags, 2)
+
+    def test_load_summary_counts_every_shard(self):
+        """Test load_claims_data reports the claims it placed on the shards"""
+        claims_file = f'{self.shard_dir}/claims.csv'
+        details_file = f'{self.shard_dir}/details.csv'
+        with open(claims_file, 'w') as f:
+            f.write('id|patient_name|billed_amount|paid_amount|status|insurer_name|discharge_date\n')
+            f.write('20|Ana One|100.00|50.00|Paid|Load Health|2024-01-01\n')
+            f.write('3000|Ben Two|200.00|50.00|Denied|Load Health|2024-01-02\n')
+        with open(details_file, 'w') as f:
+            f.write('id|claim_id|denial_reason|cpt_codes\n')
+        out = StringIO()
+        with self.settings(CLAIMS_IMPORT_QUARANTINE_DIR=self.shard_dir):
+            call_command('load_claims_data', claims_file=claims_file, details_file=details_file, workers=1, stdout=out)
+        self.assertIn('Total Claims in Database: 4', out.getvalue())
+        self.assertIn('Denied: 2', out.getvalue())
+
+    def test_export_writes_every_shard_in_list_order(self):
+        """Test a CSV export merges the claims of both shards in the list's sort order"""
+        output_dir = tempfile.mkdtemp(dir=self.shard_dir)
+        job = enqueue('export_claims', {'filters': {'insurer': 'Shard Health', 'sort': 'amount'}})
+        with self.settings(CLAIMS_JOB_OUTPUT_DIR=output_dir):
+            run_next_job('test-worker')
+        job.refresh_from_db()
+        self.assertEqual(job.result['rows'], 2)
+        with open(job.result['path']) as f:
+            self.assertEqual([line.split(',')[0] for line in f.read().splitlines()[1:]], ['2000', '10'])
+
+    def test_detection_pairs_claims_across_shards(self):
+        """Test a patient's claims on different shards are compared and the note lands on the claim's shard"""
+        duplicate = Claim(id=2001, patient_name='low shard', billed_amount=Decimal('300.00'),
+                          paid_amount=Decimal('100.00'), status='Denied', insurer_name='Shard Health',
+                          discharge_date=date.today())
+        duplicate.save()
+        findings = dict(detect_anomalies(workers=1))
+        self.assertIn('duplicate of claim 10', findings[2001])
+        write_findings(list(findings.items()))
+        self.assertTrue(ClaimNote.objects.using('shard_1').filter(claim_id=2001, note_type='System Flag').exists())
+
+    def test_admin_changelist_and_change_page_read_the_shards(self):
+        """Test the admin lists one shard at a time and opens a claim from the shard holding it"""
+        response = self.client.get(reverse('admin:claims_claim_changelist'))
+        self.assertEqual([claim.id for claim in response.context['cl'].result_list], [10])
+        response = self.client.get(reverse('admin:claims_claim_changelist'), {'shard': 'shard_1'})
+        self.assertEqual([claim.id for claim in response.context['cl'].result_list], [2000])
+        response = self.client.get(reverse('admin:claims_claim_change', args=[2000]))
+        self.assertEqual(response.context['original'].id, 2000)
+        self.low.claim_flags.create(user=self.admin_user)
+        response = self.client.get(reverse('admin:claims_claimflag_changelist'))
+        self.assertEqual(len(response.context['cl'].result_list), 1)
+        self.assertFalse(response.context['has_add_permission'])
+
+    def test_unnumbered_claim_goes_to_the_last_shard(self):
+        """Test routing a claim that has no ID yet picks the open-ended last shard instead of failing"""
+        claim = Claim(patient_name='No Number', billed_amount=Decimal('1.00'), paid_amount=Decimal('1.00'),
+                      status='Paid', insurer_name='Shard Health', discharge_date=date.today())
+        self.assertEqual(ShardRouter().db_for_write(Claim, instance=claim), 'shard_1')
+
+    def test_scatter_reuses_pool_connections(self):
+        """Test repeated scatters reuse the pool threads' shard connections instead of opening new ones"""
+        opened = []
+        connection_created.connect(lambda sender, connection, **kwargs: opened.append(connection.alias), weak=False,
+                                   dispatch_uid='scatter-test')
+        self.addCleanup(connection_created.disconnect, dispatch_uid='scatter-test')
+        for _ in range(10):
+            self.assertEqual(scatter(lambda alias: Claim.objects.using(alias).count()), [1, 1])
+        self.assertLessEqual(len(opened), 8)
+
+
+class ChangeOutboxTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='outbox_reviewer', password='testpass123')
+        self.start = ChangeEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+    def _changes(self):
+        return [(event.model, event.operation, event.object_id)
+                for event in ChangeEvent.objects.filter(id__gt=self.start)]
+
+    def _claim(self, claim_id, **fields):
+        values = dict(patient_name='Outbox Test', billed_amount=Decimal('200.00'), paid_amount=Decimal('50.00'),
+                      status='Under Review', insurer_name='Outbox Health', discharge_date=date(2024, 1, 1))
+        values.update(fields)
+        return Claim.objects.create(id=claim_id, **values)
+
+    def test_writes_are_recorded_in_order(self):
+        """Test claim, flag and note inserts, updates and deletes each append an event"""
+        claim = self._claim(97001)
+        claim.status = 'Paid'
+        claim.save()
+        flag = ClaimFlag.objects.create(claim=claim, user=self.user)
+        note = ClaimNote.objects.create(claim=claim, user=self.user, content='Checked')
+        claim.delete()
+        self.assertEqual(self._changes(), [
+            ('claim', 'insert', 97001), ('claim', 'update', 97001),
+            ('claimflag', 'insert', flag.id), ('claimnote', 'insert', note.id),
+            ('claimflag', 'delete', flag.id), ('claimnote', 'delete', note.id), ('claim', 'delete', 97001),
+        ])
+        update = ChangeEvent.objects.get(id__gt=self.start, operation='update')
+        self.assertEqual(update.data['status'], 'Paid')
+        self.assertEqual(ChangeEvent.objects.get(id__gt=self.start, model='claimnote', operation='delete').claim_id, 97001)
+
+    def test_rolled_back_write_leaves_no_event(self):
+        """Test the event commits or rolls back with the row it records"""
+        claim = self._claim(97002)
+        # The reviewer counter is updated after the event is written; make it fail
+        with patch('claims.signals.adjust_reviewer_count', side_effect=RuntimeError('counter locked')):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                ClaimFlag.objects.create(claim=claim, user=self.user)
+        self.assertFalse(ClaimFlag.objects.filter(claim=claim).exists())
+        self.assertEqual(self._changes(), [('claim', 'insert', 97002)])
+
+    def test_bulk_writes_are_recorded(self):
+        """Test bulk flagging records one event per flag actually inserted"""
+        claims = [self._claim(97010 + offset) for offset in range(3)]
+        ClaimFlag.objects.create(claim=claims[0], user=self.user)
+        job = enqueue('bulk_flag', {'claim_ids': [claim.id for claim in claims], 'user_id': self.user.id})
+        run_next_job()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'Succeeded')
+        flag_events = [change for change in self._changes() if change[0] == 'claimflag']
+        self.assertEqual(len(flag_events), 3)
+        self.assertEqual(len({object_id for _, _, object_id in flag_events}), 3)
+
+    def test_bulk_import_is_recorded(self):
+        """Test the CSV import appends an insert event for every claim it loads"""
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        path = f'{tmp}/claims.csv'
+        with open(path, 'w') as f:
+            f.write('id|patient_name|billed_amount|paid_amount|status|insurer_name|discharge_date\n')
+            f.write('97040|Ana One|100.00|50.00|Paid|Outbox Health|2024-01-01\n')
+            f.write('97041|Ben Two|200.00|50.00|Denied|Outbox Health|2024-01-02\n')
+        with self.settings(CLAIMS_IMPORT_QUARANTINE_DIR=tmp):
+            ingest_file(path, 'claims')
+        self.assertEqual(self._changes(), [('claim', 'insert', 97040), ('claim', 'insert', 97041)])
+        self.assertEqual(ChangeEvent.objects.get(object_id=97041).data['billed_amount'], '200.00')
+
+    def test_consumer_checkpoints(self):
+        """Test consumers see each change once and keep their place when a batch fails"""
+        consume_changes('test-consumer', lambda events: None)
+        self._claim(97020)
+        self._claim(97021)
+
+        def failing_handler(events):
+            raise RuntimeError('index unavailable')
+
+        with self.assertRaises(RuntimeError):
+            consume_changes('test-consumer', failing_handler)
+        seen = []
+        self.assertEqual(consume_changes('test-consumer', lambda events: seen.extend(e.object_id for e in events)), 2)
+        self.assertEqual(seen, [97020, 97021])
+        self.assertEqual(consume_changes('test-consumer', seen.extend), 0)
+        checkpoint = ChangeCheckpoint.objects.get(consumer='test-consumer')
+        self.assertEqual(checkpoint.position, ChangeEvent.objects.latest('id').id)
+
+    def test_reading_waits_at_recent_gap(self):
+        """Test a missing sequence number holds readers back until it has settled"""
+        first = self._claim(97030)
+        ChangeEvent.objects.filter(id__gt=self.start).delete()
+        events = [ChangeEvent.objects.create(model='claim', object_id=first.id, claim_id=first.id,
+                                             operation='update') for _ in range(3)]
+        ChangeEvent.objects.filter(id=events[1].id).delete()
+        self.assertEqual([e.id for e in committed_changes(events[0].id - 1)], [events[0].id])
+        ChangeEvent.objects.filter(id=events[2].id).update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual([e.id for e in committed_changes(events[0].id - 1)], [events[0].id, events[2].id])
+
+
+class InsurerScorecardTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='contracts', password='testpass123')
+        update_scorecards()
+
+    def _claim(self, claim_id, billed, paid, status='Paid', discharge_date=date(2024, 3, 10)):
+        return Claim.objects.create(
+            id=claim_id, patient_name='Scorecard Patient', billed_amount=Decimal(billed), paid_amount=Decimal(paid),
+            status=status, insurer_name='Scorecard Health', discharge_date=discharge_date
+        )
+
+    def _card(self, since=None):
+        return next(card for card in merge_scorecards(since) if card['insurer_name'] == 'Scorecard Health')
+
+    def _stored(self):
+        return sorted(
+            (stats.insurer_name, stats.month, stats.claim_count, stats.denied_count, stats.billed_total,
+             stats.paid_total, stats.payment_ratios['zero'], sorted(stats.payment_ratios['bins'].items()),
+             sorted(stats.billed_amounts['bins'].items()))
+            for stats in InsurerMonthStats.objects.all()
+        )
+
+    def test_sketch_quantiles_merge_and_remove(self):
+        """Test sketch quantiles stay within the relative accuracy and sketches merge and subtract exactly"""
+        values = [1.5 ** (i % 40) + i for i in range(2000)]
+        whole, first, second = QuantileSketch(), QuantileSketch(), QuantileSketch()
+        for i, value in enumerate(values):
+            whole.add(value)
+            (first if i % 2 else second).add(value)
+        ordered = sorted(values)
+        for q in (0.1, 0.5, 0.9, 0.99):
+            exact = ordered[math.ceil(q * len(ordered)) - 1]
+            self.assertLessEqual(abs(whole.quantile(q) - exact), exact * 0.01 + 1e-9)
+        merged = QuantileSketch.from_dict(first.to_dict()).merge(second)
+        self.assertEqual(merged.to_dict(), whole.to_dict())
+        for value in values[1::2]:
+            merged.add(value, -1)
+        self.assertEqual(merged.to_dict(), second.to_dict())
+
+    def test_scorecard_follows_claim_writes(self):
+        """Test inserts, updates and deletes reach the scorecard through the outbox"""
+        self._claim(95001, '1000.00', '900.00')
+        second = self._claim(95002, '2000.00', '1000.00')
+        third = self._claim(95003, '4000.00', '1000.00')
+        update_scorecards()
+        card = self._card()
+        self.assertEqual((card['claim_count'], card['denied_count']), (3, 0))
+        self.assertAlmostEqual(card['median_payment_ratio'], 0.5, delta=0.005)
+        self.assertAlmostEqual(card['p90_payment_ratio'], 0.9, delta=0.009)
+
+        second.status = 'Denied'
+        second.paid_amount = Decimal('0.00')
+        second.save()
+        third.delete()
+        update_scorecards()
+        card = self._card()
+        self.assertEqual((card['claim_count'], card['denied_count'], card['denial_rate']), (2, 1, 0.5))
+        self.assertEqual((card['billed_total'], card['paid_total']), (Decimal('3000.00'), Decimal('900.00')))
+        self.assertEqual(card['median_payment_ratio'], 0.0)
+        self.assertAlmostEqual(card['p90_payment_ratio'], 0.9, delta=0.009)
+
+    def test_update_moves_claim_between_months(self):
+        """Test changing a discharge date moves the claim to its new month"""
+        claim = self._claim(95010, '500.00', '250.00')
+        update_scorecards()
+        claim.discharge_date = date(2024, 5, 2)
+        claim.save()
+        update_scorecards()
+        months = InsurerMonthStats.objects.filter(insurer_name='Scorecard Health').values_list('month', 'claim_count')
+        self.assertEqual(list(months), [(date(2024, 5, 1), 1)])
+        self.assertEqual(self._card(since=date(2024, 4, 1))['claim_count'], 1)
+        self.assertFalse(any(card['insurer_name'] == 'Scorecard Health' for card in merge_scorecards(date(2024, 6, 1))))
+
+    def test_incremental_matches_rebuild(self):
+        """Test the incrementally kept stats equal a rebuild from the claims"""
+        claims = [self._claim(95020 + i, f'{100 + i * 37}.00', f'{50 + i * 11}.00') for i in range(20)]
+        for claim in claims[:5]:
+            claim.status = 'Denied'
+            claim.save()
+        claims[-1].delete()
+        update_scorecards()
+        incremental = self._stored()
+        rebuild_scorecards()
+        self.assertEqual(self._stored(), incremental)
+
+    def test_archiving_keeps_claims_in_scorecards(self):
+        """Test archived claims stay counted, incrementally and in a rebuild, and restoring them does not double count"""
+        self._claim(95050, '700.00', '350.00', discharge_date=date(2010, 4, 1))
+        self._claim(95051, '900.00', '0.00', status='Denied', discharge_date=date(2010, 4, 2))
+        update_scorecards()
+        before = self._stored()
+        self.assertEqual(archive_claims(before=date(2011, 1, 1)), 2)
+        update_scorecards()
+        self.assertEqual(self._stored(), before)
+        rebuild_scorecards()
+        self.assertEqual(self._stored(), before)
+        self.assertEqual(restore_claims(since=date(2010, 1, 1)), 2)
+        update_scorecards()
+        self.assertEqual(self._stored(), before)
+
+    def test_first_view_queues_the_build(self):
+        """Test a page view before the first build queues it on the workers instead of reading every claim"""
+        ChangeCheckpoint.objects.filter(consumer='insurer-scorecards').delete()
+        InsurerMonthStats.objects.all().delete()
+        self.client.login(username='contracts', password='testpass123')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('insurer_scorecards'))
+            self.client.get(reverse('insurer_scorecards'))
+        self.assertContains(response, 'being built')
+        self.assertFalse([query['sql'] for query in queries.captured_queries if '"claims_claim"' in query['sql']])
+        self.assertEqual(Job.objects.filter(kind='update_scorecards', status='Queued').count(), 1)
+        run_next_job('test-worker')
+        self.assertNotContains(self.client.get(reverse('insurer_scorecards')), 'being built')
+
+    def test_page_renders_without_reading_claims(self):
+        """Test the scorecards page reads the stats and outbox but never the claims table"""
+        self._claim(95040, '800.00', '400.00', status='Denied')
+        self.client.login(username='contracts', password='testpass123')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('insurer_scorecards'))
+        self.assertContains(response, 'Scorecard Health')
+        self.assertFalse([query['sql'] for query in queries.captured_queries if '"claims_claim"' in query['sql']])
+
+
+class SavedViewTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='watcher', password='testpass123')
+        self.client = Client()
+        self.client.login(username='watcher', password='testpass123')
+        for i, billed in enumerate(['300.00', '100.00', '200.00']):
+            self._claim(96001 + i, billed)
+        self._claim(96010, '500.00', insurer_name='Other Health')
+
+    def _claim(self, claim_id, billed, insurer_name='Watched Health'):
+        return Claim.objects.create(
+            id=claim_id, patient_name='Saved View Patient', billed_amount=Decimal(billed), paid_amount=Decimal('50.00'),
+            status='Paid', insurer_name=insurer_name, discharge_date=date(2024, 5, 1)
+        )
+
+    def _save(self, name='Watched by amount'):
+        response = self.client.post(reverse('save_view'), {
+            'name': name, 'insurer': 'Watched Health', 'sort': 'amount', 'direction': 'asc', 'page': '2',
+        })
+        view = SavedView.objects.get(user=self.user, name=name)
+        self.assertRedirects(response, reverse('saved_view', args=[view.id]))
+        return view
+
+    def _ids(self, view):
+        view.refresh_from_db()
+        return [entry[1] for entry in view.entries]
+
+    def test_save_materializes_ordered_ids(self):
+        """Test saving keeps the filters without paging and materializes the matching IDs in list order"""
+        view = self._save()
+        self.assertEqual(view.params, {'insurer': 'Watched Health', 'sort': 'amount', 'direction': 'asc'})
+        self.assertEqual(self._ids(view), [96002, 96003, 96001])
+        User.objects.create_user(username='other', password='testpass123')
+        self.client.login(username='other', password='testpass123')
+        self.assertEqual(self.client.get(reverse('saved_view', args=[view.id])).status_code, 404)
+
+    def test_refresh_follows_inserts_updates_and_deletes(self):
+        """Test claim writes are folded into the view without recomputing it"""
+        view = self._save()
+        self._claim(96004, '150.00')
+        moved = Claim.objects.get(id=96001)
+        moved.billed_amount = Decimal('50.00')
+        moved.save()
+        left = Claim.objects.get(id=96010)
+        left.insurer_name = 'Watched Health'
+        left.save()
+        Claim.objects.get(id=96003).delete()
+        refresh_saved_views()
+        self.assertEqual(self._ids(view), [96001, 96002, 96004, 96010])
+        self.assertEqual(sorted(view.new_claim_ids), [96004, 96010])
+        # Replaying the same events changes nothing
+        ChangeCheckpoint.objects.filter(consumer='saved-views').update(position=0)
+        refresh_saved_views()
+        self.assertEqual(self._ids(view), [96001, 96002, 96004, 96010])
+
+    def test_new_claims_shown_once(self):
+        """Test opening a view reports the claims added since it was last opened, then clears them"""
+        view = self._save()
+        self._claim(96005, '250.00')
+        response = self.client.get(reverse('saved_view', args=[view.id]))
+        self.assertContains(response, '1 new claim since you last opened this view')
+        response = self.client.get(reverse('saved_view', args=[view.id]))
+        self.assertNotContains(response, 'since you last opened this view')
+        view.refresh_from_db()
+        self.assertIsNotNone(view.last_opened_at)
+
+    def test_open_fetches_page_by_id(self):
+        """Test opening a view reads its page by primary key instead of filtering and counting claims"""
+        view = self._save()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('saved_view', args=[view.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([claim.id for claim in response.context['claims']], [96002, 96003, 96001])
+        claim_queries = [q['sql'] for q in queries if 'FROM "claims_claim"' in q['sql']]
+        self.assertTrue(claim_queries)
+        for sql in claim_queries:
+            self.assertNotIn('COUNT(', sql)
+            self.assertNotIn('insurer_name', sql.split('WHERE')[-1])
+
+    def test_changed_filters_leave_the_view(self):
+        """Test an HTMX request with different filters is answered as a normal list query"""
+        view = self._save()
+        response = self.client.get(reverse('saved_view', args=[view.id]),
+                                   {'insurer': 'Other Health'}, HTTP_HX_REQUEST='true')
+        self.assertEqual([claim.id for claim in response.context['claims']], [96010])
+        self.assertIsNone(response.context['saved_view'])
+
+
+@override_settings(CLAIMS_BITMAP_INDEX=True, CLAIMS_ARCHIVE_HORIZON_DAYS=36500)
+class BitmapIndexTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        bitmaps._index = None
+
+    def _sql_ids(self, filters, offset, limit):
+        claims = apply_claim_filters(Claim.objects.all(), filters).order_by(*with_tiebreak([filters['ordering']]))
+        return list(claims.values_list('id', flat=True)[offset:offset + limit])
+
+    def _assert_matches_sql(self, params, offset=0, limit=25):
+        filters = parse_claim_filters(params)[0]
+        selection = select_claims(filters)
+        self.assertEqual(selection.count, apply_claim_filters(Claim.objects.all(), filters).count(), params)
+        self.assertEqual(selection.page(filters['ordering'], offset, limit), self._sql_ids(filters, offset, limit), params)
+
+    def test_filter_combinations_match_sql(self):
+        """Test counts and pages from the index equal the database's for combined filters and sorts"""
+        insurer = Claim.objects.values_list('insurer_name', flat=True).first()
+        for params in (
+            {},
+            {'status': 'Denied'},
+            {'insurer': insurer[2:6].upper(), 'sort': 'amount', 'direction': 'asc'},
+            {'status': 'Paid', 'date_from': '2023-02-14', 'date_to': '2023-08-31', 'sort': 'patient'},
+            {'min_amount': '120.5', 'max_amount': '2500', 'sort': 'ratio', 'direction': 'desc'},
+            {'status': 'Under Review', 'min_underpayment': '100', 'sort': 'underpayment', 'direction': 'asc'},
+            {'date_from': '2021-01-01', 'date_to': '2022-03-31', 'max_underpayment': '0', 'sort': 'id'},
+        ):
+            with self.subTest(params=params):
+                self._assert_matches_sql(params)
+                self._assert_matches_sql(params, offset=40, limit=10)
+
+    def test_refresh_applies_saves_and_deletes(self):
+        """Test claims inserted, updated and deleted after the index was built are reflected in it"""
+        params = {'insurer': 'Bitmap Health'}
+        self.assertEqual(select_claims(parse_claim_filters(params)[0]).count, 0)
+        for claim_id in (97001, 97002, 97003):
+            Claim.objects.create(
+                id=claim_id, patient_name='Bitmap Patient', billed_amount=Decimal('400.00'), paid_amount=Decimal('0.00'),
+                status='Denied', insurer_name='Bitmap Health', discharge_date=date(2024, 6, 1)
+            )
+        moved = Claim.objects.get(id=97002)
+        moved.status = 'Paid'
+        moved.save()
+        Claim.objects.get(id=97003).delete()
+        self._assert_matches_sql(params)
+        self._assert_matches_sql({**params, 'status': 'Denied'})
+        self.assertEqual(select_claims(parse_claim_filters(params)[0]).count, 2)
+
+    def test_sort_orders_are_kept_across_writes(self):
+        """Test a list order sorted before claims change is updated in place and still matches the database"""
+        for params in ({'sort': 'amount', 'direction': 'asc'}, {'status': 'Paid', 'sort': 'patient'}):
+            self._assert_matches_sql(params, offset=30, limit=10)
+        orders = dict(bitmaps._index._orders)
+        Claim.objects.create(
+            id=97201, patient_name='Aaron Sorted', billed_amount=Decimal('0.01'), paid_amount=Decimal('0.00'),
+            status='Paid', insurer_name='Sorted Health', discharge_date=date(2024, 6, 1)
+        )
+        moved = Claim.objects.order_by('billed_amount').first()
+        moved.billed_amount = Decimal('999999.00')
+        moved.save()
+        Claim.objects.order_by('patient_name').exclude(id=97201).first().delete()
+        for params in ({'sort': 'amount', 'direction': 'asc'}, {'sort': 'amount', 'direction': 'desc'},
+                       {'status': 'Paid', 'sort': 'patient'}):
+            self._assert_matches_sql(params)
+            self._assert_matches_sql(params, offset=30, limit=10)
+        for ordering, positions in orders.items():
+            self.assertIs(bitmaps._index._orders[ordering], positions)
+
+    @override_settings(CLAIMS_DATA_VERSION_CHECK_SECONDS=0)
+    def test_refresh_follows_writes_from_another_process(self):
+        """Test the index picks up claims saved and deleted by a process with a cache of its own"""
+        params = {'insurer': 'Other Process Health'}
+        self.assertEqual(select_claims(parse_claim_filters(params)[0]).count, 0)
+        # The other worker's signals bump the data version in its cache, not in this one
+        with patch('claims.counts.cache', LocMemCache('other-process', {})):
+            for claim_id in (97101, 97102):
+                Claim.objects.create(
+                    id=claim_id, patient_name='Other Patient', billed_amount=Decimal('400.00'),
+                    paid_amount=Decimal('0.00'), status='Denied', insurer_name='Other Process Health',
+                    discharge_date=date(2024, 6, 1)
+                )
+            Claim.objects.get(id=97102).delete()
+        self._assert_matches_sql(params)
+        self.assertEqual(select_claims(parse_claim_filters(params)[0]).count, 1)
+
+    def test_list_page_loads_claims_by_id(self):
+        """Test the list page counts from the index and sends only the page's IDs to the database"""
+        select_claims(parse_claim_filters({})[0])
+        prime_facets()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('claims_list'), {'status': 'Denied', 'per_page': 10})
+        filters = parse_claim_filters({'status': 'Denied'})[0]
+        self.assertEqual([claim.id for claim in response.context['claims']], self._sql_ids(filters, 0, 10))
+        claim_queries = [q['sql'] for q in queries if 'FROM "claims_claim"' in q['sql']]
+        self.assertEqual(len(claim_queries), 1, claim_queries)
+        self.assertIn(' IN (', claim_queries[0])
+        self.assertNotIn('status', claim_queries[0].split('WHERE')[-1])
+
+    def test_search_uses_the_database(self):
+        """Test free-text search is left to the database"""
+        self.assertIsNone(select_claims(parse_claim_filters({'search': 'smith'})[0]))
+        with override_settings(CLAIMS_BITMAP_INDEX=False):
+            self.assertIsNone(select_claims(parse_claim_filters({})[0]))
+
+
+class ClaimDetailBatchTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='batcher', password='testpass123')
+        self.client.login(username='batcher', password='testpass123')
+        self.claims = [
+            Claim.objects.create(
+                id=claim_id, patient_name=f'Batch Patient {claim_id}', billed_amount=Decimal('300.00'),
+                paid_amount=Decimal('100.00'), status='Denied', insurer_name='Batch Health', discharge_date=date(2024, 7, 1)
+            )
+            for claim_id in (98001, 98002, 98003)
+        ]
+
+    def _batch(self, claim_ids, known=None):
+        params = {'id': claim_ids, 'known': [f'{claim_id}:{stamp}' for claim_id, stamp in (known or {}).items()]}
+        response = self.client.get(reverse('claim_details_batch'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_batch_renders_every_modal(self):
+        """Test one request returns each claim's detail modal, as claim_detail renders it, with a stamp"""
+        ClaimNote.objects.create(claim=self.claims[1], user=self.user, content='Called the insurer')
+        data = self._batch([98001, 98002, 98003, 99999])
+        self.assertEqual(sorted(data['claims']), ['98001', '98002', '98003'])
+        self.assertIn('Called the insurer', data['claims']['98002']['html'])
+        self.assertIn('Batch Patient 98003', data['claims']['98003']['html'])
+        self.assertEqual(data['stamps']['99999'], 0)
+        self.assertGreater(data['stamps']['98002'], data['stamps']['98001'])
+
+    def test_known_stamps_resend_only_changed_claims(self):
+        """Test claims the client holds come back only after they, their flags or notes change"""
+        stamps = {int(claim_id): stamp for claim_id, stamp in self._batch([98001, 98002, 98003])['stamps'].items()}
+        self.assertEqual(self._batch([98001, 98002, 98003], stamps)['claims'], {})
+        ClaimFlag.objects.create(claim=self.claims[0], user=self.user, reason='Check coding')
+        self.claims[2].delete()
+        data = self._batch([98001, 98002, 98003], stamps)
+        self.assertEqual(list(data['claims']), ['98001'])
+        self.assertIn('Check coding', data['claims']['98001']['html'])
+        self.assertNotEqual(data['stamps']['98003'], stamps[98003])
+
+
+class StartupWarmupTestCase(TestCase):
+
+    def test_compile_templates_fills_cached_loader(self):
+        """Test every claims template is compiled before any request needs it"""
+        compiled = compile_templates()
+        self.assertIn('claims/claims_list_modern.html', compiled)
+        self.assertIn('claims/claims_table_partial.html', compiled)
+        loader = engines['django'].engine.template_loaders[0]
+        self.assertTrue(any('claims/base_modern.html' in str(key) for key in loader.get_template_cache))
+
+    def test_primed_facets_skip_distinct_scans(self):
+        """Test the list page uses the facet lists primed at startup"""
+        cache.clear()
+        self.assertEqual(set(prime_facets()), {'status', 'insurer_name'})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('claims_list'), HTTP_HX_REQUEST='true')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query['sql'] for query in queries.captured_queries if 'DISTINCT' in query['sql']])
+
+    def test_parse_import_times(self):
+        """Test -X importtime output is split into modules and summed per package"""
+        output = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       150 |        150 |     django.utils\n'
+            'import time:      1000 |       1150 |   django\n'
+            'import time:       500 |        500 | claims.views\n'
+        )
+        modules = parse_import_times(output)
+        self.assertEqual(modules[1], ('django', 0.001, 0.00115))
+        self.assertAlmostEqual(import_times_by_package(modules)['django'], 0.00115)
+        self.assertAlmostEqual(import_times_by_package(modules)['claims'], 0.0005)
+
+
+# Record every list query so buffering workload samples always counts against the budget
+@override_settings(CLAIMS_WORKLOAD_SAMPLE_RATE=1.0)
+class QueryBudgetTestCase(TestCase):
+    """Each page must cost the same number of queries whether it shows 10 related rows or 1,000"""
+
+    SIZES = (10, 100, 1000)
+    # Budgets include the one change outbox check data_version() makes after cache.clear()
+    # Upper bounds per request at the largest size; generous so slow CI machines pass
+    MAX_SECONDS = 3.0
+    MAX_PEAK_BYTES = 48 * 1024 * 1024
+
+    def setUp(self):
+        cache.clear()
+        self.admin_user = User.objects.create_superuser(username='budget_admin', password='testpass123')
+        self.client.login(username='budget_admin', password='testpass123')
+        self.claim = Claim.objects.create(
+            id=96000, patient_name='Budget Patient', billed_amount=Decimal('900.00'), paid_amount=Decimal('100.00'),
+            status='Denied', insurer_name='Budget Health', discharge_date=date(2024, 6, 1)
+        )
+        self.reviewers = []
+        self.claims = []
+
+    def _reviewers(self, count):
+        """At least count users, since a reviewer flags a claim at most once"""
+        missing = count - len(self.reviewers)
+        if missing > 0:
+            start = len(self.reviewers)
+            User.objects.bulk_create([User(username=f'budget_reviewer_{start + i}') for i in range(missing)])
+            self.reviewers = list(User.objects.filter(username__startswith='budget_reviewer_').order_by('id'))
+        return self.reviewers[:count]
+
+    def _seed_claim_rows(self, count):
+        """Grow the budget claim to count details, flags and notes"""
+        have = ClaimDetail.objects.filter(claim=self.claim).count()
+        reviewers = self._reviewers(count)[have:]
+        ClaimDetail.objects.bulk_create([
+            ClaimDetail(claim=self.claim, cpt_codes='99213,99214', denial_reason='Missing modifier')
+            for _ in reviewers
+        ])
+        ClaimFlag.objects.bulk_create([ClaimFlag(claim=self.claim, user=user) for user in reviewers])
+        ClaimNote.objects.bulk_create([ClaimNote(claim=self.claim, user=user, content='Checked') for user in reviewers])
+
+    def _seed_claims(self, count):
+        """Grow the Budget Health insurer to count claims, each flagged and noted once"""
+        start = len(self.claims)
+        new_claims = Claim.objects.bulk_create([
+            Claim(id=96001 + i, patient_name=f'Budget Patient {i}', billed_amount=Decimal('500.00'),
+                  paid_amount=Decimal('250.00'), status='Under Review', insurer_name='Budget Health',
+                  discharge_date=date(2024, 6, 1))
+            for i in range(start, count)
+        ])
+        ClaimDetail.objects.bulk_create([ClaimDetail(claim=claim, cpt_codes='99213') for claim in new_claims])
+        ClaimFlag.objects.bulk_create([ClaimFlag(claim=claim, user=self.admin_user) for claim in new_claims])
+        ClaimNote.objects.bulk_create([
+            ClaimNote(claim=claim, user=self.admin_user, content='Checked') for claim in new_claims
+        ])
+        self.claims.extend(new_claims)
+        recount_reviewer_flags()
+
+    def _get(self, url, params=None, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = self.client.get(url, params, **headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        self.assertEqual(response.status_code, 200)
+        return response, queries, elapsed
+
+    def _peak_memory(self, url, params=None, **headers):
+        cache.clear()
+        tracemalloc.start()
+        try:
+            response = self.client.get(url, params, **headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def _assert_budget(self, seed, budget, url, params=None, **headers):
+        """Seed each size in turn and hold the request to the query, time and memory budgets"""
+        for size in self.SIZES:
+            with self.subTest(size=size):
+                seed(size)
+                cache.clear()
+                response, queries, elapsed = self._get(url, params, **headers)
+                sql = '\n'.join(f"{i}. {query['sql']}" for i, query in enumerate(queries.captured_queries, 1))
+                self.assertLessEqual(
+                    len(queries), budget,
+                    f'{url} ran {len(queries)} queries with {size} rows (budget {budget}):\n{sql}'
+                )
+                self.assertLess(elapsed, self.MAX_SECONDS, f'{url} took {elapsed:.2f}s with {size} rows')
+                peak = self._peak_memory(url, params, **headers)
+                self.assertLess(peak, self.MAX_PEAK_BYTES, f'{url} peaked at {peak / 2**20:.1f} MiB with {size} rows')
+
+    def test_claims_list(self):
+        """Test the list page does not query per claim shown"""
+        self._assert_budget(self._seed_claims, 15, reverse('claims_list'), {'insurer': 'Budget Health', 'per_page': 100})
+
+    def test_claims_table_partial(self):
+        """Test the HTMX table refresh does not query per claim shown"""
+        self._assert_budget(self._seed_claims, 15, reverse('claims_list'),
+                            {'insurer': 'Budget Health', 'per_page': 100}, HTTP_HX_REQUEST='true')
+
+    def test_claim_detail_modal(self):
+        """Test the detail modal loads details, flags, notes and their users in fixed queries"""
+        self._assert_budget(self._seed_claim_rows, 6, reverse('claim_detail', args=[self.claim.id]),
+                            HTTP_HX_REQUEST='true')
+
+    def test_claim_detail_page(self):
+        """Test the full detail page loads related rows in fixed queries"""
+        self._assert_budget(self._seed_claim_rows, 6, reverse('claim_detail', args=[self.claim.id]))
+
+    def test_claim_details_batch(self):
+        """Test a page's detail modals load in fixed queries however many claims they cover"""
+        self._assert_budget(self._seed_claims, 7, reverse('claim_details_batch'), {'id': list(range(96000, 96100))})
+
+    def test_flag_queue(self):
+        """Test the flag queue selects claims and reviewers with the flags"""
+        self._assert_budget(self._seed_claims, 4, reverse('flag_queue'))
+
+    def test_admin_dashboard(self):
+        """Test the dashboard's recent flags and breakdowns are fixed queries"""
+        self._assert_budget(self._seed_claims, 9, reverse('admin_dashboard'))
+
+    def test_admin_changelists(self):
+        """Test the claim, flag, note and detail changelists do not query per row"""
+        for model_name in ('claim', 'claimflag', 'claimnote', 'claimdetail'):
+            with self.subTest(model=model_name):
+                self._assert_budget(self._seed_claims, 6, reverse(f'admin:claims_{model_name}_changelist'))
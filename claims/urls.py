@@ -3,8 +3,22 @@ from . import views
 
 urlpatterns = [
     path('', views.claims_list, name='claims_list'),
+    path('views/save/', views.save_view, name='save_view'),
+    path('views/<int:view_id>/', views.saved_view, name='saved_view'),
+    path('views/<int:view_id>/delete/', views.delete_saved_view, name='delete_saved_view'),
+    path('quick-stats/', views.quick_stats, name='quick_stats'),
     path('claim/<int:claim_id>/', views.claim_detail, name='claim_detail'),
+    path('claim/details/', views.claim_details_batch, name='claim_details_batch'),
     path('claim/<int:claim_id>/flag/', views.flag_claim, name='flag_claim'),
     path('claim/<int:claim_id>/note/', views.add_note, name='add_note'),
     path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('flags/', views.flag_queue, name='flag_queue'),
+    path('top-underpaid/', views.top_underpaid, name='top_underpaid'),
+    path('scorecards/', views.insurer_scorecards, name='insurer_scorecards'),
+    path('profiles/', views.profile_reports, name='profile_reports'),
+    path('profiles/<str:report_id>/', views.profile_report, name='profile_report'),
+    path('jobs/export/', views.start_export, name='start_export'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/cancel/', views.cancel_job, name='cancel_job'),
+    path('jobs/<int:job_id>/download/', views.job_download, name='job_download'),
 ]
@@ -1,112 +1,100 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse, HttpResponse
+from django.template.loader import render_to_string
+from django.http import JsonResponse, HttpResponse, FileResponse, Http404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.db.models import Q, Count, Avg, Sum
+from django.db.models import Count, Max, Prefetch, Sum, prefetch_related_objects
 from django.views.decorators.http import require_POST
+from django.utils import timezone
 from django.contrib.auth.models import User
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.core.exceptions import ValidationError
-from .models import Claim, ClaimDetail, ClaimFlag, ClaimNote
+from django.core.paginator import EmptyPage, PageNotAnInteger
+from django.urls import reverse
+from django.utils.http import urlencode
+from .archive import archived_claim_as_claim, filtered_claims
+from .bitmaps import select_claims
+from .counts import CountedPaginator, ResultCount, count_across_shards, data_version, filter_signature
+from .facets import facet_values
+from .filters import parse_claim_filters
+from .flag_queue import gather_flag_queue_page
+from .jobs import cancel, enqueue
+from .profiling import list_reports, report_path
+from .quick_stats import get_quick_stats
+from .saved_views import create_saved_view, is_materialized, mark_opened, page_claims, refresh_saved_views, view_filters
+from .scorecards import first_month, merge_scorecards, scorecards_built, update_scorecards
+from .sharding import combine_groups, fetch_claims, find_claim, gather_ordered, merge_ordered, scatter
+from .singleflight import is_superseded, note_request_sequence, single_flight
+from .streaming import stream_template
+from .models import ArchivedClaim, ChangeEvent, Claim, ClaimDetail, ClaimFlag, ClaimNote, Job, ReviewerFlagCount, SavedView
+from .workload import record_query
 import json
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
-def claims_list(request):
-    """Main claims list view with filtering and pagination"""
+def _request_sequence(request):
+    """(tab id, request number) sent with HTMX list requests, or None"""
+    client_id = request.headers.get('X-Claims-Client', '')
     try:
-        claims = Claim.objects.select_related().prefetch_related(
-            'details', 'claim_flags', 'claim_notes'
-        ).order_by('-discharge_date')
-        
-        filters_applied = False
-        
-        search_query = request.GET.get('search', '').strip()
-        if search_query:
-            claims = claims.filter(
-                Q(patient_name__icontains=search_query) |
-                Q(id__icontains=search_query) |
-                Q(insurer_name__icontains=search_query)
-            )
-            filters_applied = True
-        
-        status_filter = request.GET.get('status', '')
-        if status_filter:
-            claims = claims.filter(status=status_filter)
-            filters_applied = True
-        
-        insurer_filter = request.GET.get('insurer', '')
-        if insurer_filter:
-            claims = claims.filter(insurer_name__icontains=insurer_filter)
-            filters_applied = True
-        
-        min_amount = request.GET.get('min_amount', '')
-        max_amount = request.GET.get('max_amount', '')
-        if min_amount:
-            try:
-                min_val = float(min_amount)
-                if min_val >= 0:
-                    claims = claims.filter(billed_amount__gte=min_val)
-                    filters_applied = True
-            except (ValueError, TypeError):
-                messages.warning(request, 'Invalid minimum amount format.')
-        if max_amount:
-            try:
-                max_val = float(max_amount)
-                if max_val >= 0:
-                    claims = claims.filter(billed_amount__lte=max_val)
-                    filters_applied = True
-            except (ValueError, TypeError):
-                messages.warning(request, 'Invalid maximum amount format.')
-        
-        date_from = request.GET.get('date_from', '')
-        date_to = request.GET.get('date_to', '')
-        if date_from:
-            try:
-                claims = claims.filter(discharge_date__gte=date_from)
-                filters_applied = True
-            except ValidationError:
-                messages.warning(request, 'Invalid date format.')
-        if date_to:
-            try:
-                claims = claims.filter(discharge_date__lte=date_to)
-                filters_applied = True
-            except ValidationError:
-                messages.warning(request, 'Invalid date format.')
+        sequence = int(request.headers.get('X-Claims-Seq', ''))
+    except ValueError:
+        return None
+    if not client_id:
+        return None
+    note_request_sequence(client_id, sequence)
+    return client_id, sequence
+
+def _items_per_page(request):
+    try:
+        return min(int(request.GET.get('per_page', '25')), 100)
+    except (ValueError, TypeError):
+        return 25
+
+def _claims_list_context(request, saved_view=None):
+    """Filtered, paginated claims list context, or None if a newer request from the tab replaced it
+
+    With a saved view, its stored filters apply and the page comes from its materialized IDs.
+    """
+    params = saved_view.params if saved_view else request.GET
+    search_query = params.get('search', '').strip()
+    status_filter = params.get('status', '')
+    insurer_filter = params.get('insurer', '')
+    min_amount = params.get('min_amount', '')
+    max_amount = params.get('max_amount', '')
+    date_from = params.get('date_from', '')
+    date_to = params.get('date_to', '')
+    min_underpayment = params.get('min_underpayment', '')
+    max_underpayment = params.get('max_underpayment', '')
+    # A newer keystroke from the same tab replaces this request
+    sequence = _request_sequence(request)
+    
+    try:
+        started = time.perf_counter()
+        filters, warnings = parse_claim_filters(params)
+        for warning in warnings:
+            messages.warning(request, warning)
         
-        sort_field = request.GET.get('sort', 'discharge_date')
-        sort_direction = request.GET.get('direction', 'desc')
+        claims = filtered_claims(filters).order_by(filters['ordering'])
         
-        sort_mapping = {
-            'id': 'id',
-            'patient': 'patient_name',
-            'insurer': 'insurer_name',
-            'amount': 'billed_amount',
-            'status': 'status',
-            'date': 'discharge_date'
-        }
+        items_per_page = _items_per_page(request)
         
-        if sort_field in sort_mapping:
-            order_field = sort_mapping[sort_field]
-            if sort_direction == 'desc':
-                order_field = f'-{order_field}'
-            claims = claims.order_by(order_field)
+        signature = filter_signature(filters)
+        selection = None if saved_view else select_claims(filters)
+        if saved_view:
+            total = ResultCount(len(saved_view.entries))
+        elif selection is not None:
+            total = ResultCount(selection.count)
         else:
-            claims = claims.order_by('-discharge_date')
-        
-        items_per_page = request.GET.get('per_page', '25')
-        try:
-            items_per_page = min(int(items_per_page), 100)
-        except (ValueError, TypeError):
-            items_per_page = 25
-        
-        total_count = claims.count()
-        if total_count == 0:
+            total = count_across_shards(lambda alias: filtered_claims(filters, alias), signature)
+        if sequence and is_superseded(*sequence):
+            return None
+        if total.value == 0:
             context = {
                 'claims': Claim.objects.none(),
-                'statuses': Claim.objects.values_list('status', flat=True).exclude(status__isnull=True).exclude(status__exact='').distinct().order_by('status'),
-                'insurers': Claim.objects.values_list('insurer_name', flat=True).exclude(insurer_name__isnull=True).exclude(insurer_name__exact='').distinct().order_by('insurer_name'),
+                'statuses': facet_values('status'),
+                'insurers': facet_values('insurer_name'),
                 'search_query': search_query,
                 'status_filter': status_filter,
                 'insurer_filter': insurer_filter,
@@ -114,15 +102,16 @@ def claims_list(request):
                 'max_amount': max_amount,
                 'date_from': date_from,
                 'date_to': date_to,
+                'min_underpayment': min_underpayment,
+                'max_underpayment': max_underpayment,
                 'items_per_page': items_per_page,
                 'page_range': [1],
                 'total_claims': 0,
+                'total_claims_exact': True,
             }
-            if request.headers.get('HX-Request'):
-                return render(request, 'claims/claims_table_partial.html', context)
-            return render(request, 'claims/claims_list_modern.html', context)
+            return context
             
-        paginator = Paginator(claims, items_per_page)
+        paginator = CountedPaginator(claims, items_per_page, count=total.value, exact=total.exact)
         page = request.GET.get('page', '1')
         
         try:
@@ -132,8 +121,36 @@ def claims_list(request):
         except EmptyPage:
             claims = paginator.page(paginator.num_pages)
         
-        statuses = Claim.objects.values_list('status', flat=True).exclude(status__isnull=True).exclude(status__exact='').distinct().order_by('status')
-        insurers = Claim.objects.values_list('insurer_name', flat=True).exclude(insurer_name__isnull=True).exclude(insurer_name__exact='').distinct().order_by('insurer_name')
+        offset = claims.start_index() - 1
+        if saved_view:
+            claims.object_list = page_claims(saved_view, offset, items_per_page)
+        elif selection is not None:
+            # The index picked the page; the database only loads those claims
+            claims.object_list = fetch_claims(selection.page(filters['ordering'], offset, items_per_page))
+        else:
+            def load_page(page):
+                # Identical concurrent requests share one page query
+                page_key = f'claims:page:{data_version()}:{signature}:{filters["ordering"]}:{items_per_page}:{page.number}'
+                page.object_list = single_flight(page_key, lambda: gather_ordered(
+                    lambda alias: filtered_claims(filters, alias), [filters['ordering']],
+                    page.start_index() - 1, items_per_page
+                ))
+
+            load_page(claims)
+            if not paginator.exact and not claims.object_list and claims.number > 1:
+                # The estimate ran past the real end: count exactly and show the last page there is
+                paginator.recount(sum(scatter(lambda alias: filtered_claims(filters, alias).count())))
+                claims = paginator.page(paginator.num_pages)
+                load_page(claims)
+            # A short page is the real end, whatever the estimate said
+            paginator.clamp(claims)
+            total = ResultCount(paginator.count, exact=paginator.exact)
+            if sequence and is_superseded(*sequence):
+                return None
+            record_query(filters, request.GET, (time.perf_counter() - started) * 1000)
+        
+        statuses = facet_values('status')
+        insurers = facet_values('insurer_name')
         
         # Calculate pagination info for advanced navigation
         current_page = claims.number
@@ -143,7 +160,14 @@ def claims_list(request):
         
         # Generate smart page range for pagination
         page_range = []
-        if total_pages <= 7:
+        if not paginator.exact:
+            # The last page of an estimate may not exist, so only nearby pages are offered
+            page_range = list(range(max(1, current_page - 2), min(total_pages, current_page + 2) + 1))
+            if page_range[0] > 1:
+                page_range = [1] + ['...'] * (page_range[0] > 2) + page_range
+            if page_range[-1] < total_pages:
+                page_range.append('...')
+        elif total_pages <= 7:
             page_range = list(range(1, total_pages + 1))
         else:
             if current_page <= 4:
@@ -164,9 +188,12 @@ def claims_list(request):
             'max_amount': max_amount,
             'date_from': date_from,
             'date_to': date_to,
+            'min_underpayment': min_underpayment,
+            'max_underpayment': max_underpayment,
             'items_per_page': items_per_page,
             'page_range': page_range,
-            'total_claims': paginator.count,
+            'total_claims': total.value,
+            'total_claims_exact': total.exact,
         }
         
     except Exception as e:
@@ -175,8 +202,8 @@ def claims_list(request):
         claims = Claim.objects.none()
         context = {
             'claims': claims,
-            'statuses': Claim.objects.values_list('status', flat=True).exclude(status__isnull=True).exclude(status__exact='').distinct().order_by('status'),
-            'insurers': Claim.objects.values_list('insurer_name', flat=True).exclude(insurer_name__isnull=True).exclude(insurer_name__exact='').distinct().order_by('insurer_name'),
+            'statuses': facet_values('status'),
+            'insurers': facet_values('insurer_name'),
             'search_query': search_query,
             'status_filter': status_filter,
             'insurer_filter': insurer_filter,
@@ -184,17 +211,113 @@ def claims_list(request):
             'max_amount': max_amount,
             'date_from': date_from,
             'date_to': date_to,
+            'min_underpayment': min_underpayment,
+            'max_underpayment': max_underpayment,
+            'total_claims_exact': True,
             'error': True,
         }
     
+    return context
+
+def _list_page_context(request, saved_view=None):
+    """Claims list context plus the user's saved views for the views menu"""
+    context = _claims_list_context(request, saved_view)
+    if context is not None:
+        context['saved_view'] = saved_view
+        # Polling faster than the stats are recomputed would only fetch the same values
+        context['quick_stats_poll_seconds'] = settings.CLAIMS_QUICK_STATS_TTL_SECONDS
+        if request.user.is_authenticated:
+            context['saved_views'] = list(request.user.saved_views.only('id', 'name'))
+    return context
+
+def claims_list(request):
+    """Main claims list view with filtering and pagination"""
     if request.headers.get('HX-Request'):
+        context = _list_page_context(request)
+        if context is None:
+            return HttpResponse(status=204)  # htmx ignores 204s
         return render(request, 'claims/claims_table_partial.html', context)
     
+    if _items_per_page(request) >= settings.CLAIMS_STREAM_MIN_ROWS:
+        # Send the layout and stylesheets while the list queries run
+        return stream_template(
+            request, 'claims/claims_list_modern.html', deferred=lambda: _list_page_context(request) or {}
+        )
+    return render(request, 'claims/claims_list_modern.html', _list_page_context(request))
+
+@login_required
+@require_POST
+def save_view(request):
+    """Save the claims list filters posted with the form as one of the user's named views"""
+    name = request.POST.get('name', '').strip()[:100]
+    if not name:
+        messages.error(request, 'Saved views need a name.')
+        return redirect('claims_list')
+    view = create_saved_view(request.user, name, request.POST)
+    messages.success(request, f'Saved view "{view.name}" with {len(view.entries)} claims.')
+    url = reverse('saved_view', args=[view.id])
+    if request.headers.get('HX-Request'):
+        response = HttpResponse()
+        response['HX-Redirect'] = url
+        return response
+    return redirect(url)
+
+@login_required
+def saved_view(request, view_id):
+    """A saved view: pages come from its materialized claim IDs instead of a filter query"""
+    # Apply claim changes since the last refresh; concurrent openers share the run
+    single_flight(f'claims:saved-views:refresh:{data_version()}', refresh_saved_views)
+    view = get_object_or_404(SavedView, id=view_id, user=request.user)
+    filters = view_filters(view)
+    if not is_materialized(filters):
+        return redirect(f"{reverse('claims_list')}?{urlencode(view.params)}")
+    
+    if request.headers.get('HX-Request'):
+        if parse_claim_filters(request.GET)[0] != filters:
+            # The filter form was changed: this is a new list query, not the view
+            return claims_list(request)
+        return render(request, 'claims/claims_table_partial.html', _list_page_context(request, view))
+    
+    new_claim_ids = mark_opened(view)
+    context = _list_page_context(request, view)
+    context['new_claim_ids'] = set(new_claim_ids)
     return render(request, 'claims/claims_list_modern.html', context)
 
+@login_required
+@require_POST
+def delete_saved_view(request, view_id):
+    """Delete one of the user's saved views"""
+    view = get_object_or_404(SavedView, id=view_id, user=request.user)
+    view.delete()
+    messages.success(request, f'Deleted saved view "{view.name}".')
+    return redirect('claims_list')
+
+def _claim_or_404(claim_id, model=Claim):
+    """The claim from whichever shard holds it, or a 404"""
+    try:
+        return find_claim(claim_id, model)
+    except model.DoesNotExist:
+        raise Http404(f'No {model._meta.object_name} matches the given query.')
+
+def quick_stats(request):
+    """Quick-stats cards, polled by the claims list; served from a shared short-lived cache"""
+    context = {**get_quick_stats(), 'quick_stats_poll_seconds': settings.CLAIMS_QUICK_STATS_TTL_SECONDS}
+    response = render(request, 'claims/quick_stats_partial.html', context)
+    response['Cache-Control'] = f'private, max-age={settings.CLAIMS_QUICK_STATS_TTL_SECONDS}'
+    return response
+
 def claim_detail(request, claim_id):
     """HTMX claim detail view"""
-    claim = get_object_or_404(Claim, id=claim_id)
+    try:
+        claim = find_claim(claim_id)
+        # The modal lists every detail, flag and note with its author
+        prefetch_related_objects(
+            [claim], 'details',
+            Prefetch('claim_flags', queryset=ClaimFlag.objects.select_related('user')),
+            Prefetch('claim_notes', queryset=ClaimNote.objects.select_related('user')),
+        )
+    except Claim.DoesNotExist:
+        claim = archived_claim_as_claim(_claim_or_404(claim_id, ArchivedClaim))
     
     context = {
         'claim': claim,
@@ -205,15 +328,68 @@ def claim_detail(request, claim_id):
         return render(request, 'claims/claim_detail_modal.html', context)
     return render(request, 'claims/claim_detail_modern.html', context)
 
+def _detail_stamps(alias, claim_ids):
+    """{claim id: newest change event id} on one database; any write to the claim, its flags or notes moves it"""
+    return dict(
+        ChangeEvent.objects.using(alias).filter(claim_id__in=claim_ids)
+        .order_by().values('claim_id').annotate(stamp=Max('id')).values_list('claim_id', 'stamp')
+    )
+
+def _detail_claims(alias, claim_ids):
+    """Claims on one database with everything the detail modal shows, in a fixed number of queries"""
+    claims = list(Claim.objects.using(alias).filter(id__in=claim_ids))
+    prefetch_related_objects(
+        claims, 'details',
+        Prefetch('claim_flags', queryset=ClaimFlag.objects.select_related('user')),
+        Prefetch('claim_notes', queryset=ClaimNote.objects.select_related('user')),
+    )
+    return claims
+
+def claim_details_batch(request):
+    """Detail modals for the claims on a list page, each with a freshness stamp
+
+    ``id`` is repeated for every claim; ``known=<id>:<stamp>`` entries name claims the
+    client already holds, which are sent again only if their stamp has moved.
+    """
+    claim_ids = []
+    for value in request.GET.getlist('id')[:100]:
+        try:
+            claim_ids.append(int(value))
+        except ValueError:
+            continue
+    known = {}
+    for value in request.GET.getlist('known'):
+        claim_id, _, stamp = value.partition(':')
+        try:
+            known[int(claim_id)] = int(stamp)
+        except ValueError:
+            continue
+
+    stamps = {claim_id: 0 for claim_id in claim_ids}
+    for shard_stamps in scatter(lambda alias: _detail_stamps(alias, claim_ids)):
+        for claim_id, stamp in shard_stamps.items():
+            stamps[claim_id] = max(stamps[claim_id], stamp)
+    stale = [claim_id for claim_id in claim_ids if known.get(claim_id) != stamps[claim_id]]
+
+    entries = {}
+    if stale:
+        for claims in scatter(lambda alias: _detail_claims(alias, stale)):
+            for claim in claims:
+                entries[claim.id] = {
+                    'stamp': stamps[claim.id],
+                    'html': render_to_string('claims/claim_detail_modal.html', {'claim': claim, 'is_htmx': True}, request),
+                }
+    # Claims missing from entries and stale were deleted or archived; the client drops them
+    return JsonResponse({'claims': entries, 'stamps': stamps})
+
 @login_required
 @require_POST
 def flag_claim(request, claim_id):
     """Flag claim for review"""
-    claim = get_object_or_404(Claim, id=claim_id)
+    claim = _claim_or_404(claim_id)
     reason = request.POST.get('reason', 'Flagged for review')
     
-    flag, created = ClaimFlag.objects.get_or_create(
-        claim=claim,
+    flag, created = claim.claim_flags.get_or_create(
         user=request.user,
         defaults={'reason': reason}
     )
@@ -232,13 +408,12 @@ def flag_claim(request, claim_id):
 @require_POST
 def add_note(request, claim_id):
     """Add note to claim"""
-    claim = get_object_or_404(Claim, id=claim_id)
+    claim = _claim_or_404(claim_id)
     content = request.POST.get('content', '').strip()
     note_type = request.POST.get('note_type', 'User Note')
     
     if content:
-        note = ClaimNote.objects.create(
-            claim=claim,
+        note = claim.claim_notes.create(
             user=request.user,
             content=content,
             note_type=note_type
@@ -255,25 +430,49 @@ def add_note(request, claim_id):
 
 @login_required
 def admin_dashboard(request):
-    """Admin dashboard with claim statistics"""
-    total_claims = Claim.objects.count()
-    flagged_claims = ClaimFlag.objects.values('claim').distinct().count()
+    """Admin dashboard with claim statistics, gathered from every shard"""
+    def shard_stats(alias):
+        return {
+            'total_claims': Claim.objects.using(alias).count(),
+            'flagged_claims': ClaimFlag.objects.using(alias).values('claim').distinct().count(),
+            'status_stats': list(Claim.objects.using(alias).values('status').annotate(
+                count=Count('id'),
+                total_underpayment=Sum('underpayment'),
+                total_billed=Sum('billed_amount'),
+                total_paid=Sum('paid_amount')
+            ).order_by('status')),
+            'recent_flags': list(ClaimFlag.objects.using(alias).select_related('claim', 'user').order_by('-flagged_at', '-id')[:10]),
+            'insurer_stats': list(Claim.objects.using(alias).values('insurer_name').annotate(
+                claim_count=Count('id'),
+                total_underpayment=Sum('underpayment')
+            )),
+            'total_notes': ClaimNote.objects.using(alias).count(),
+        }
+    shards = scatter(shard_stats)
+    
+    total_claims = sum(shard['total_claims'] for shard in shards)
+    # A claim and its flags share a shard, so per-shard distinct counts add up
+    flagged_claims = sum(shard['flagged_claims'] for shard in shards)
     
-    status_stats = Claim.objects.values('status').annotate(
-        count=Count('id'),
-        avg_underpayment=Avg('billed_amount') - Avg('paid_amount'),
-        total_billed=Sum('billed_amount'),
-        total_paid=Sum('paid_amount')
-    ).order_by('status')
+    status_stats = sorted(
+        combine_groups([shard['status_stats'] for shard in shards], 'status',
+                       ['count', 'total_underpayment', 'total_billed', 'total_paid']),
+        key=lambda stat: stat['status'],
+    )
     
-    recent_flags = ClaimFlag.objects.select_related('claim', 'user').order_by('-flagged_at')[:10]
+    recent_flags = merge_ordered([shard['recent_flags'] for shard in shards], ['-flagged_at', '-id'], limit=10)
     
-    insurer_stats = Claim.objects.values('insurer_name').annotate(
-        claim_count=Count('id'),
-        avg_underpayment=Avg('billed_amount') - Avg('paid_amount')
-    ).order_by('-claim_count')[:5]
+    insurer_stats = sorted(
+        combine_groups([shard['insurer_stats'] for shard in shards], 'insurer_name', ['claim_count', 'total_underpayment']),
+        key=lambda stat: (-stat['claim_count'], stat['insurer_name']),
+    )[:5]
+    # Averages are recombined from sums, since averages of averages would be wrong
+    for stat in status_stats:
+        stat['avg_underpayment'] = (stat['total_underpayment'] or 0) / stat['count']
+    for stat in insurer_stats:
+        stat['avg_underpayment'] = (stat['total_underpayment'] or 0) / stat['claim_count']
     
-    total_notes = ClaimNote.objects.count()
+    total_notes = sum(shard['total_notes'] for shard in shards)
     total_users = User.objects.count()
     
     context = {
@@ -288,3 +487,140 @@ def admin_dashboard(request):
     }
     
     return render(request, 'claims/admin_dashboard_modern.html', context)
+
+@login_required
+def flag_queue(request):
+    """Reviewer work queue of open flags, cursor-paginated over the flagged_at indexes"""
+    reviewer = request.GET.get('reviewer', 'me')
+    newest_first = request.GET.get('order') == 'newest'
+    
+    flags = ClaimFlag.objects.select_related('claim', 'user')
+    if reviewer == 'me':
+        flags = flags.filter(user=request.user)
+    elif reviewer != 'all':
+        flags = flags.filter(user__username=reviewer)
+    page, next_cursor = gather_flag_queue_page(
+        lambda alias: flags.using(alias), request.GET.get('cursor'), newest_first=newest_first
+    )
+    
+    context = {
+        'flags': page,
+        'next_cursor': next_cursor,
+        'reviewer': reviewer,
+        'order': 'newest' if newest_first else 'oldest',
+    }
+    if request.headers.get('HX-Request') and request.GET.get('cursor'):
+        return render(request, 'claims/flag_queue_rows.html', context)
+    
+    reviewer_counts = list(ReviewerFlagCount.objects.select_related('user').filter(open_flags__gt=0))
+    context.update({
+        'reviewer_counts': reviewer_counts,
+        'total_open': sum(count.open_flags for count in reviewer_counts),
+        'my_open': next((c.open_flags for c in reviewer_counts if c.user_id == request.user.id), 0),
+    })
+    return render(request, 'claims/flag_queue.html', context)
+
+def top_underpaid(request):
+    """Claims with the largest underpayment, read straight off the underpayment index"""
+    try:
+        limit = min(int(request.GET.get('limit', '25')), 100)
+    except (ValueError, TypeError):
+        limit = 25
+    claims = gather_ordered(lambda alias: Claim.objects.using(alias), ['-underpayment'], limit=limit)
+    
+    context = {
+        'claims': claims,
+        'limit': limit,
+    }
+    return render(request, 'claims/top_underpaid.html', context)
+
+@login_required
+def insurer_scorecards(request):
+    """Per-insurer denial rate, payment ratio percentiles and billed amount distribution"""
+    building = not scorecards_built()
+    if building:
+        # The first build reads every claim, so it runs on a worker rather than in this request
+        if not Job.objects.filter(kind='update_scorecards', status__in=['Queued', 'Running']).exists():
+            enqueue('update_scorecards', user=request.user)
+    else:
+        # Fold in claim writes since the last view; concurrent viewers share the run
+        single_flight(f'claims:scorecards:update:{data_version()}', update_scorecards)
+    try:
+        months = max(int(request.GET.get('months', '0')), 0)
+    except (ValueError, TypeError):
+        months = 0
+    since = first_month(months, timezone.localdate()) if months else None
+    
+    context = {
+        'scorecards': merge_scorecards(since),
+        'months': months,
+        'month_choices': [3, 6, 12, 24],
+        'since': since,
+        'building': building,
+    }
+    return render(request, 'claims/insurer_scorecards.html', context)
+
+@staff_member_required
+def profile_reports(request):
+    """List saved request profiles"""
+    return render(request, 'claims/profile_reports.html', {'reports': list_reports()})
+
+@staff_member_required
+def profile_report(request, report_id):
+    """Serve one saved request profile report"""
+    try:
+        return FileResponse(open(report_path(report_id), 'rb'), content_type='text/html')
+    except FileNotFoundError:
+        raise Http404('Profile report not found')
+
+def _get_job_for(request, job_id):
+    job = get_object_or_404(Job, id=job_id)
+    if not request.user.is_staff and job.created_by_id != request.user.id:
+        raise Http404('Job not found')
+    return job
+
+def _job_response(request, job):
+    if request.headers.get('HX-Request'):
+        return render(request, 'claims/job_status_partial.html', {'job': job})
+    return JsonResponse({
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.progress_message,
+        'result': job.result,
+    })
+
+@login_required
+@require_POST
+def start_export(request):
+    """Queue a CSV export of the current claims list filters"""
+    filters = {key: value for key, value in request.POST.items() if key != 'csrfmiddlewaretoken'}
+    job = enqueue('export_claims', {'filters': filters}, user=request.user)
+    return _job_response(request, job)
+
+@login_required
+def job_status(request, job_id):
+    """Progress of a background job; the HTMX partial polls until it finishes"""
+    return _job_response(request, _get_job_for(request, job_id))
+
+@login_required
+@require_POST
+def cancel_job(request, job_id):
+    """Cancel a queued job or ask a running one to stop"""
+    job = _get_job_for(request, job_id)
+    cancel(job)
+    job.refresh_from_db()
+    return _job_response(request, job)
+
+@login_required
+def job_download(request, job_id):
+    """Download the file written by a finished export job"""
+    job = _get_job_for(request, job_id)
+    path = (job.result or {}).get('path') if job.status == 'Succeeded' else None
+    if not path:
+        raise Http404('Job output not available')
+    try:
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'claims-export-{job.id}.csv')
+    except FileNotFoundError:
+        raise Http404('Job output not found')
@@ -0,0 +1,125 @@
+import gc
+import logging
+import os
+import time
+from collections import defaultdict
+
+from django.apps import apps
+from django.db import DatabaseError, connections
+from django.template import TemplateSyntaxError, engines
+from django.urls import get_resolver
+
+from .bitmaps import prime_bitmap_index
+from .facets import prime_facets
+from .quick_stats import refresh_quick_stats
+from .sharding import shutdown_shard_pool
+
+logger = logging.getLogger(__name__)
+
+
+def template_names(backend):
+    """Every template file the backend's loaders can see, as names it can load"""
+    names = set()
+    for loader in backend.engine.template_loaders:
+        for inner in getattr(loader, 'loaders', [loader]):
+            for directory in inner.get_dirs():
+                for root, _, files in os.walk(directory):
+                    for filename in files:
+                        names.add(os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, '/'))
+    return sorted(names)
+
+
+def compile_templates():
+    """Compile every template into the cached loader; returns {name: seconds}, skipping files that are not templates"""
+    timings = {}
+    for backend in engines.all():
+        if not hasattr(backend, 'engine'):
+            continue
+        for name in template_names(backend):
+            started = time.perf_counter()
+            try:
+                backend.get_template(name)
+            except (TemplateSyntaxError, UnicodeDecodeError) as e:
+                logger.debug(f'Not precompiling {name}: {e}')
+                continue
+            timings[name] = time.perf_counter() - started
+    return timings
+
+
+def prime_metadata():
+    """Build URL resolver and model relation caches that are otherwise filled by the first requests"""
+    # reverse_dict is built on first access
+    url_names = len(get_resolver().reverse_dict)
+    for model in apps.get_models():
+        model._meta.get_fields()
+    return {'url_names': url_names, 'models': len(apps.get_models())}
+
+
+def prime_connections():
+    """Open and check every database connection, then close them so no socket is shared after fork"""
+    try:
+        for connection in connections.all():
+            connection.ensure_connection()
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+    finally:
+        connections.close_all()
+    return len(connections.all())
+
+
+WARM_UP_STEPS = [
+    ('templates', compile_templates),
+    ('metadata', prime_metadata),
+    ('connections', prime_connections),
+    ('facets', prime_facets),
+    ('quick_stats', refresh_quick_stats),
+    ('bitmap_index', prime_bitmap_index),
+]
+
+
+def warm_up(freeze=False):
+    """Run every warm-up step and return [(step, seconds, result)]
+
+    Meant for a preforking server's master: the work is done once, and workers
+    inherit it copy-on-write. With freeze, objects made so far are moved out of
+    the garbage collector's view so its passes don't write to (and copy) them.
+    """
+    report = []
+    for step, function in WARM_UP_STEPS:
+        started = time.perf_counter()
+        try:
+            result = function()
+        except DatabaseError as e:
+            # A database that is not reachable yet must not stop the server starting
+            logger.warning(f'Warm-up step {step} failed: {e}')
+            result = None
+        report.append((step, time.perf_counter() - started, result))
+    # Database work in the steps reopened connections, some on shard pool threads; workers must open their own
+    shutdown_shard_pool()
+    connections.close_all()
+    if freeze:
+        gc.collect()
+        gc.freeze()
+    return report
+
+
+def parse_import_times(output):
+    """[(module, self seconds, cumulative seconds)] from ``python -X importtime`` stderr, in import order"""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        try:
+            own, cumulative, name = line[len('import time:'):].split('|')
+            modules.append((name.strip(), int(own) / 1e6, int(cumulative) / 1e6))
+        except ValueError:
+            continue  # The header line
+    return modules
+
+
+def import_times_by_package(modules):
+    """{top-level package: summed self seconds}, so nested imports are not counted twice"""
+    totals = defaultdict(float)
+    for name, own, _ in modules:
+        totals[name.split('.')[0]] += own
+    return dict(totals)
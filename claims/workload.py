@@ -0,0 +1,217 @@
+import hashlib
+import json
+import logging
+import random
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections, models, transaction
+from django.utils import timezone
+
+from .filters import apply_claim_filters, parse_claim_filters
+from .models import Claim, QueryPattern
+
+logger = logging.getLogger(__name__)
+
+BUFFER_KEY = 'claims:workload'
+BUFFER_STARTED_KEY = 'claims:workload:started'
+FLUSH_LOCK_KEY = 'claims:workload:flushing'
+
+# Filter parameter -> (column it constrains, kind of predicate) for each column it reads
+FILTER_COLUMNS = {
+    'status': [('status', 'eq')],
+    'insurer': [('insurer_name', 'contains')],
+    # The search box matches a claim id or a patient or insurer name
+    'search': [('id', 'eq'), ('patient_name', 'contains'), ('insurer_name', 'contains')],
+    'min_amount': [('billed_amount', 'range')],
+    'max_amount': [('billed_amount', 'range')],
+    'min_underpayment': [('underpayment', 'range')],
+    'max_underpayment': [('underpayment', 'range')],
+    'date_from': [('discharge_date', 'range')],
+    'date_to': [('discharge_date', 'range')],
+}
+
+EXAMPLE_PARAMS = list(FILTER_COLUMNS) + ['sort', 'direction']
+
+
+def query_shape(filters):
+    """Columns and predicate kinds a filter set uses, independent of values"""
+    predicates = {
+        predicate
+        for key, columns in FILTER_COLUMNS.items()
+        if filters.get(key) not in ('', None)
+        for predicate in columns
+    }
+    return {
+        'filters': sorted(list(predicate) for predicate in predicates),
+        'ordering': filters['ordering'],
+    }
+
+
+def shape_signature(shape):
+    return hashlib.sha1(json.dumps(shape, sort_keys=True).encode()).hexdigest()
+
+
+def _incr(key, delta):
+    cache.add(key, 0, timeout=None)
+    return cache.incr(key, delta)
+
+
+def _take(key):
+    """Read a buffered counter and subtract what was read, keeping increments made meanwhile"""
+    value = cache.get(key, 0)
+    if value:
+        cache.decr(key, value)
+    return value
+
+
+def record_query(filters, params, elapsed_ms):
+    """Sample a claims list query into the workload log used by advise_indexes
+
+    Samples are only counted in the cache here. They reach QueryPattern when advise_indexes runs,
+    or from a background flush once the buffer is CLAIMS_WORKLOAD_FLUSH_SECONDS old.
+    """
+    if random.random() >= settings.CLAIMS_WORKLOAD_SAMPLE_RATE:
+        return
+    shape = query_shape(filters)
+    signature = shape_signature(shape)
+    key = f'{BUFFER_KEY}:{signature}'
+    cache.set(key, {
+        'shape': shape,
+        'last_seen': timezone.now(),
+        'example_filters': {name: params[name] for name in EXAMPLE_PARAMS if params.get(name)},
+    }, timeout=None)
+    if cache.add(f'{key}:registered', 1, timeout=None):
+        # Numbered slots, so concurrent requests never overwrite each other's signatures
+        cache.set(f'{BUFFER_KEY}:slot:{_incr(f"{BUFFER_KEY}:slots", 1)}', signature, timeout=None)
+    if filters.get('status') in dict(Claim.STATUS_CHOICES):
+        _incr(f'{key}:status:{filters["status"]}', 1)
+    _incr(f'{key}:micros', round(elapsed_ms * 1000))
+    _incr(f'{key}:hits', 1)
+
+    cache.add(BUFFER_STARTED_KEY, time.time(), timeout=None)
+    started = cache.get(BUFFER_STARTED_KEY)
+    if started and time.time() - started >= settings.CLAIMS_WORKLOAD_FLUSH_SECONDS:
+        if cache.add(FLUSH_LOCK_KEY, 1, timeout=settings.CLAIMS_SINGLE_FLIGHT_WAIT_SECONDS):
+            _flush_in_background()
+
+
+def flush_query_patterns():
+    """Write the query samples buffered in the cache to QueryPattern; returns the patterns updated"""
+    cache.delete(BUFFER_STARTED_KEY)
+    slots = cache.get(f'{BUFFER_KEY}:slots', 0)
+    signatures = {cache.get(f'{BUFFER_KEY}:slot:{slot}') for slot in range(1, slots + 1)} - {None}
+    updated = 0
+    for signature in sorted(signatures):
+        key = f'{BUFFER_KEY}:{signature}'
+        sample = cache.get(key)
+        hits = _take(f'{key}:hits')
+        if sample is None or not hits:
+            continue
+        micros = _take(f'{key}:micros')
+        statuses = {status: _take(f'{key}:status:{status}') for status, _ in Claim.STATUS_CHOICES}
+        with transaction.atomic():
+            pattern, _ = QueryPattern.objects.select_for_update().get_or_create(
+                signature=signature, defaults={'shape': sample['shape']}
+            )
+            pattern.hits += hits
+            pattern.total_ms += micros / 1000
+            pattern.last_seen = sample['last_seen']
+            pattern.example_filters = sample['example_filters']
+            for status, count in statuses.items():
+                if count:
+                    counts = pattern.value_counts.setdefault('status', {})
+                    counts[status] = counts.get(status, 0) + count
+            pattern.save()
+        updated += 1
+    return updated
+
+
+def _flush_worker():
+    try:
+        flush_query_patterns()
+    except DatabaseError as e:
+        logger.warning(f"Could not record query patterns: {e}")
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+        connections.close_all()
+
+
+def _flush_in_background():
+    thread = threading.Thread(target=_flush_worker, name='workload-flush', daemon=True)
+    thread.start()
+
+
+def pattern_queryset(pattern):
+    """Rebuild the claims list query for a recorded pattern from its example"""
+    filters, _ = parse_claim_filters(pattern.example_filters)
+    return apply_claim_filters(Claim.objects.all(), filters).order_by(filters['ordering'])
+
+
+def _dominant_value(counts, share=0.9):
+    total = sum(counts.values())
+    if not total:
+        return None
+    value, hits = max(counts.items(), key=lambda item: item[1])
+    return value if hits / total >= share else None
+
+
+def _covered_by_existing(fields, condition):
+    if condition:
+        return False
+    plain = [field.lstrip('-') for field in fields]
+    for index in Claim._meta.indexes:
+        existing = [field.lstrip('-') for field in index.fields]
+        if index.condition is None and existing[:len(plain)] == plain:
+            return True
+    return False
+
+
+def propose_index(pattern, vendor):
+    """Composite (and where useful partial or covering) index for a query pattern, or None"""
+    shape = pattern.shape
+    # The search box ORs its id match with the name matches, so the id never narrows a seek
+    equality = [column for column, kind in shape['filters'] if kind == 'eq' and column != 'id']
+    ranges = [column for column, kind in shape['filters'] if kind == 'range']
+    contains = [column for column, kind in shape['filters'] if kind == 'contains']
+    ordering = shape['ordering']
+
+    condition = None
+    status = _dominant_value(pattern.value_counts.get('status', {}))
+    if 'status' in equality and status:
+        # Nearly every request pins the same status: index only those rows
+        condition = models.Q(status=status)
+        equality.remove('status')
+
+    # Equality columns seek, the sort column avoids a sort, ranges filter inside the index
+    fields = []
+    for field in equality + [ordering] + ranges:
+        if field.lstrip('-') not in [f.lstrip('-') for f in fields]:
+            fields.append(field)
+    if len(fields) < 2 and condition is None:
+        return None
+    if _covered_by_existing(fields, condition):
+        return None
+
+    include = contains if vendor == 'postgresql' and not condition else []
+    key = json.dumps([fields, str(condition), include])
+    name = f"claims_adv_{hashlib.sha1(key.encode()).hexdigest()[:8]}"
+    return models.Index(fields=fields, condition=condition, include=include or None, name=name)
+
+
+def benchmark_workload(patterns, runs=5, page_size=25):
+    """Hit-weighted median cost in ms of replaying each pattern's count and first page"""
+    total = 0
+    for pattern in patterns:
+        queryset = pattern_queryset(pattern)
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            queryset.count()
+            list(queryset[:page_size])
+            timings.append((time.perf_counter() - started) * 1000)
+        total += statistics.median(timings) * pattern.hits
+    return total
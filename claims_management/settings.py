@@ -5,6 +5,7 @@ Django settings for claims_management project.
 from pathlib import Path
 import os
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -36,12 +37,14 @@ if DEBUG:
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add WhiteNoise
+    'claims.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'claims.profiling.RequestProfilerMiddleware',
 ]
 
 # Add browser reload middleware only in debug mode
@@ -79,6 +82,40 @@ DATABASES = {
 if 'DATABASE_URL' in os.environ:
     DATABASES['default'] = dj_database_url.parse(os.environ.get('DATABASE_URL'))
 
+# Optional horizontal sharding of claim data: comma-separated database URLs, one per shard
+CLAIMS_SHARDS = []
+# Shard queries run on a thread pool whose connections are kept this many seconds
+CLAIMS_SHARD_CONN_MAX_AGE = int(os.environ.get('CLAIMS_SHARD_CONN_MAX_AGE', '600'))
+for shard_index, shard_url in enumerate(url for url in os.environ.get('CLAIMS_SHARD_DATABASES', '').split(',') if url.strip()):
+    DATABASES[f'shard_{shard_index}'] = dj_database_url.parse(
+        shard_url.strip(), conn_max_age=CLAIMS_SHARD_CONN_MAX_AGE, conn_health_checks=True,
+    )
+    CLAIMS_SHARDS.append(f'shard_{shard_index}')
+# Threads per process querying shards in parallel; each keeps its own connection to every shard
+CLAIMS_SHARD_THREADS = int(os.environ.get('CLAIMS_SHARD_THREADS', str(len(CLAIMS_SHARDS) * 2)))
+
+# Shard key: 'insurer' hashes the insurer name; 'id' splits claim IDs into ranges
+CLAIMS_SHARD_KEY = os.environ.get('CLAIMS_SHARD_KEY', 'insurer')
+# With the 'id' key, the first claim ID of every shard after the first, e.g. "500000,1000000"
+CLAIMS_SHARD_ID_BOUNDARIES = [int(value) for value in os.environ.get('CLAIMS_SHARD_ID_BOUNDARIES', '').split(',') if value.strip()]
+
+if CLAIMS_SHARDS:
+    if CLAIMS_SHARD_KEY not in ('insurer', 'id'):
+        raise ImproperlyConfigured("CLAIMS_SHARD_KEY must be 'insurer' or 'id'")
+    if CLAIMS_SHARD_KEY == 'id' and len(CLAIMS_SHARD_ID_BOUNDARIES) != len(CLAIMS_SHARDS) - 1:
+        raise ImproperlyConfigured('CLAIMS_SHARD_ID_BOUNDARIES needs one boundary fewer than there are shards')
+    DATABASE_ROUTERS = ['claims.sharding.ShardRouter']
+
+# The cache is per process unless CACHE_URL names a Redis server every worker shares
+# (needs the redis package); cached counts follow writes from other processes either way
+if os.environ.get('CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('CACHE_URL'),
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -138,3 +175,48 @@ if not DEBUG:
     SECURE_SSL_REDIRECT = True
     SESSION_COOKIE_SECURE = True
     CSRF_COOKIE_SECURE = True
+
+# Claims discharged longer ago than this are moved to the archive tables
+CLAIMS_ARCHIVE_HORIZON_DAYS = int(os.environ.get('CLAIMS_ARCHIVE_HORIZON_DAYS', '730'))
+
+# Result counts above this use planner estimates where the database provides them
+CLAIMS_EXACT_COUNT_THRESHOLD = int(os.environ.get('CLAIMS_EXACT_COUNT_THRESHOLD', '10000'))
+CLAIMS_COUNT_CACHE_SECONDS = int(os.environ.get('CLAIMS_COUNT_CACHE_SECONDS', '60'))
+# Seconds between checks of the change outbox for claim writes made by other processes
+CLAIMS_DATA_VERSION_CHECK_SECONDS = int(os.environ.get('CLAIMS_DATA_VERSION_CHECK_SECONDS', '1'))
+
+# Fraction of claims list requests recorded for the index advisor
+CLAIMS_WORKLOAD_SAMPLE_RATE = float(os.environ.get('CLAIMS_WORKLOAD_SAMPLE_RATE', '0.1'))
+# Sampled queries are buffered in the cache and written out at most this often
+CLAIMS_WORKLOAD_FLUSH_SECONDS = int(os.environ.get('CLAIMS_WORKLOAD_FLUSH_SECONDS', '60'))
+
+# Staff-triggered request profiles are written here, at most one per interval
+CLAIMS_PROFILE_DIR = os.environ.get('CLAIMS_PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+CLAIMS_PROFILE_MIN_INTERVAL = int(os.environ.get('CLAIMS_PROFILE_MIN_INTERVAL', '30'))
+
+# Files written by background jobs (e.g. CSV exports) from run_workers
+CLAIMS_JOB_OUTPUT_DIR = os.environ.get('CLAIMS_JOB_OUTPUT_DIR', os.path.join(BASE_DIR, 'job_output'))
+# Seconds between heartbeats a worker sends for the job it is running
+CLAIMS_JOB_HEARTBEAT_SECONDS = float(os.environ.get('CLAIMS_JOB_HEARTBEAT_SECONDS', '30'))
+
+# Rows rejected by load_claims_data are written here with the reason
+CLAIMS_IMPORT_QUARANTINE_DIR = os.environ.get('CLAIMS_IMPORT_QUARANTINE_DIR', os.path.join(BASE_DIR, 'quarantine'))
+
+# Identical concurrent list queries wait up to this long for the first one and reuse its result
+CLAIMS_SINGLE_FLIGHT_WAIT_SECONDS = float(os.environ.get('CLAIMS_SINGLE_FLIGHT_WAIT_SECONDS', '10'))
+CLAIMS_SINGLE_FLIGHT_SHARE_SECONDS = float(os.environ.get('CLAIMS_SINGLE_FLIGHT_SHARE_SECONDS', '2'))
+
+# Results saved by the loadtest command, one JSON file per run
+CLAIMS_LOADTEST_DIR = os.environ.get('CLAIMS_LOADTEST_DIR', os.path.join(BASE_DIR, 'loadtest_results'))
+
+# Claims list pages with at least this many rows are streamed while they render
+CLAIMS_STREAM_MIN_ROWS = int(os.environ.get('CLAIMS_STREAM_MIN_ROWS', '50'))
+
+# Seconds the quick-stats widget values are served before being refreshed in the background
+CLAIMS_QUICK_STATS_TTL_SECONDS = int(os.environ.get('CLAIMS_QUICK_STATS_TTL_SECONDS', '5'))
+
+# Seconds change-outbox consumers wait at a sequence gap before treating it as a rollback
+CLAIMS_OUTBOX_SETTLE_SECONDS = int(os.environ.get('CLAIMS_OUTBOX_SETTLE_SECONDS', '30'))
+
+# Answer claims list filters on status, insurer, dates and amounts from a bitmap index held by each process
+CLAIMS_BITMAP_INDEX = os.environ.get('CLAIMS_BITMAP_INDEX', 'False').lower() == 'true'
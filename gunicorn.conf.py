@@ -0,0 +1,29 @@
+"""Gunicorn settings for the render.yaml deployment
+
+By default the app is loaded and warmed in the master before workers fork, so
+every worker starts with Django imported, all templates compiled and the facet
+and quick-stats caches filled, sharing that memory copy-on-write. Set
+GUNICORN_PRELOAD=0 to load the app separately in each worker instead.
+"""
+import os
+
+wsgi_app = 'claims_management.wsgi:application'
+workers = int(os.environ.get('WEB_CONCURRENCY', '4'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def when_ready(server):
+    """Runs in the master once the app is loaded, before the first worker forks"""
+    if not preload_app:
+        return
+    from claims.warmup import warm_up
+    for step, seconds, _ in warm_up(freeze=True):
+        server.log.info(f'Warm-up {step}: {seconds * 1000:.0f}ms')
+
+
+def pre_fork(server, worker):
+    # A connection opened in the master would be shared by every worker's process
+    if not preload_app:
+        return
+    from django.db import connections
+    connections.close_all()